@@ -0,0 +1,394 @@
+# SPDX-License-Identifier: MIT
+"""Benchmarks for the snapshot and query hot paths.
+
+Generates a synthetic project with a long shadow history (written with
+`git fast-import`, so a 50k-snapshot history takes seconds), then times the
+operations a session exercises and writes the timings as JSON.
+
+Usage:
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --files 1000 --snapshots 5000 --output quick.json
+    python benchmarks/run.py --compare before.json after.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from code_trajectory.recorder import CONSOLIDATED_REF, Recorder  # noqa: E402
+from code_trajectory.scheduler import SnapshotScheduler  # noqa: E402
+from code_trajectory.trajectory import Trajectory  # noqa: E402
+from code_trajectory.watcher import Watcher  # noqa: E402
+
+FILES_PER_DIRECTORY = 100
+LINES_PER_FILE = 20
+# Share of snapshots that touch the small set of hot files, as in real editing.
+HOT_FILE_SHARE = 0.8
+HOT_FILE_COUNT = 20
+CONSOLIDATE_EVERY = 500
+SNAPSHOT_INTERVAL = 30
+IDENTITY = "Benchmark <bench@example.com>"
+
+# Relative slowdown of the median reported as a regression by --compare.
+DEFAULT_THRESHOLD = 0.10
+
+
+class SyntheticProject:
+    """A generated project and its shadow history.
+
+    Attributes:
+        root: The project directory.
+        paths: Project-relative paths of the generated files.
+        hot_paths: The files most snapshots touch.
+    """
+
+    def __init__(self, root: str, files: int, seed: int):
+        self.root = root
+        self.rng = random.Random(seed)
+        self.paths = [
+            f"pkg{i // FILES_PER_DIRECTORY:03d}/module{i % FILES_PER_DIRECTORY:03d}.py"
+            for i in range(files)
+        ]
+        self.hot_paths = self.paths[:HOT_FILE_COUNT]
+        self._versions: Dict[str, int] = {}
+
+    def content(self, path: str) -> bytes:
+        version = self._versions.get(path, 0)
+        lines = [f"# {path}\n"]
+        for line in range(LINES_PER_FILE):
+            value = version if line == version % LINES_PER_FILE else 0
+            lines.append(f"VALUE_{line} = {value}\n")
+        return "".join(lines).encode("utf-8")
+
+    def pick(self) -> str:
+        if self.rng.random() < HOT_FILE_SHARE:
+            return self.rng.choice(self.hot_paths)
+        return self.rng.choice(self.paths)
+
+    def edit(self, path: str) -> str:
+        """Changes one line of path on disk and returns its absolute path."""
+        self._versions[path] = self._versions.get(path, 0) + 1
+        abs_path = os.path.join(self.root, path)
+        with open(abs_path, "wb") as f:
+            f.write(self.content(path))
+        return abs_path
+
+    def generate(self, snapshots: int):
+        """Writes the shadow history and the matching worktree."""
+        recorder = Recorder(self.root)
+        recorder.repo.git.config("user.name", "Benchmark")
+        recorder.repo.git.config("user.email", "bench@example.com")
+        git_dir = recorder.repo.git_dir
+        recorder.close()
+
+        proc = subprocess.Popen(
+            ["git", f"--git-dir={git_dir}", "fast-import", "--quiet"],
+            stdin=subprocess.PIPE,
+        )
+        assert proc.stdin is not None
+        timestamp = int(time.time()) - (snapshots + 1) * SNAPSHOT_INTERVAL
+
+        def commit(mark: int, message: str, changed: List[str]):
+            data = message.encode("utf-8")
+            out = [
+                b"commit refs/heads/master\n",
+                b"mark :%d\n" % mark,
+                f"committer {IDENTITY} {timestamp + mark * SNAPSHOT_INTERVAL} +0000\n".encode(),
+                b"data %d\n" % len(data),
+                data,
+                b"\n",
+            ]
+            for path in changed:
+                content = self.content(path)
+                out.append(f"M 100644 inline {path}\ndata {len(content)}\n".encode("utf-8"))
+                out.append(content)
+                out.append(b"\n")
+            proc.stdin.write(b"".join(out))
+
+        commit(1, f"[AUTO-TRJ] 00:00:00 - Snapshot of {len(self.paths)} files", self.paths)
+        last_consolidate = None
+        for mark in range(2, snapshots + 2):
+            path = self.pick()
+            self._versions[path] = self._versions.get(path, 0) + 1
+            if mark % CONSOLIDATE_EVERY == 0:
+                commit(mark, f"[CONSOLIDATE] 00:00:00 - Step {mark // CONSOLIDATE_EVERY}", [path])
+                last_consolidate = mark
+            else:
+                commit(mark, f"[AUTO-TRJ] 00:00:00 - Snapshot of {self.root}/{path}", [path])
+        if last_consolidate is not None:
+            proc.stdin.write(f"reset {CONSOLIDATED_REF}\nfrom :{last_consolidate}\n\n".encode())
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError("git fast-import failed")
+
+        for path in self.paths:
+            abs_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+            with open(abs_path, "wb") as f:
+                f.write(self.content(path))
+        subprocess.run(["git", f"--git-dir={git_dir}", "read-tree", "HEAD"], check=True)
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    return {
+        "runs": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "max": max(timings),
+    }
+
+
+class Runner:
+    """Times benchmark cases and collects their summaries."""
+
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def measure(
+        self,
+        name: str,
+        func: Callable[[], object],
+        repeat: Optional[int] = None,
+        setup: Optional[Callable[[], object]] = None,
+    ):
+        timings = []
+        for _ in range(repeat or self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        self.results[name] = summarize(timings)
+        print(f"{name:45s} median {self.results[name]['median'] * 1000:10.2f} ms", flush=True)
+
+
+def wait_for_commit(recorder: Recorder, old_head: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if recorder.history.head_sha() != old_head:
+            return
+        time.sleep(0.005)
+    raise TimeoutError("watcher did not record the change")
+
+
+def run_benchmarks(args) -> Dict[str, object]:
+    workdir = tempfile.mkdtemp(prefix="trajectory-bench-")
+    try:
+        root = os.path.join(workdir, "project")
+        os.makedirs(root)
+        subprocess.run(["git", "init", "-q", root], check=True)
+        project = SyntheticProject(root, args.files, args.seed)
+
+        runner = Runner(args.repeat)
+        runner.measure("generate_history", lambda: project.generate(args.snapshots), repeat=1)
+
+        recorder = Recorder(root)
+        trajectory = Trajectory(recorder)
+        runner.measure("history_index_sync_cold", recorder.history.sync, repeat=1)
+        runner.measure("history_index_sync_warm", recorder.history.sync)
+
+        hot_path = project.hot_paths[0]
+        for depth in (5, 20, 100):
+            runner.measure(
+                f"get_file_trajectory_depth_{depth}",
+                lambda: trajectory.get_file_trajectory(hot_path, depth, max_tokens=8000),
+                setup=trajectory.cache.clear,
+            )
+        runner.measure(
+            "get_file_trajectory_cached",
+            lambda: trajectory.get_file_trajectory(hot_path, 5, max_tokens=8000),
+        )
+        runner.measure(
+            "get_global_trajectory",
+            lambda: trajectory.get_global_trajectory(20, max_tokens=8000),
+            setup=trajectory.cache.clear,
+        )
+        runner.measure(
+            "get_global_trajectory_since_consolidate",
+            lambda: trajectory.get_global_trajectory(since_consolidate=True, max_tokens=8000),
+            setup=trajectory.cache.clear,
+        )
+        runner.measure(
+            "get_session_summary",
+            trajectory.get_session_summary,
+            setup=trajectory.cache.clear,
+        )
+
+        edited: List[str] = []
+        runner.measure(
+            "create_snapshot_cli",
+            lambda: recorder.create_snapshot(edited[-1]),
+            setup=lambda: edited.append(project.edit(project.pick())),
+        )
+        batch: List[str] = []
+        runner.measure(
+            "create_batch_snapshot_cli_100_files",
+            lambda: recorder.create_batch_snapshot(batch),
+            setup=lambda: batch.__setitem__(
+                slice(None), [project.edit(project.pick()) for _ in range(100)]
+            ),
+        )
+
+        def snapshots_before_consolidate():
+            for _ in range(20):
+                recorder.create_snapshot(project.edit(project.pick()))
+
+        runner.measure(
+            "consolidate_20_snapshots",
+            lambda: recorder.consolidate("Benchmark step"),
+            setup=snapshots_before_consolidate,
+        )
+        recorder.close()
+
+        object_recorder = Recorder(root, snapshot_engine="objects")
+        runner.measure(
+            "create_snapshot_objects",
+            lambda: object_recorder.create_snapshot(edited[-1]),
+            setup=lambda: edited.append(project.edit(project.pick())),
+        )
+        object_recorder.close()
+
+        if args.large_file_mb:
+            recorder = Recorder(root)
+            large_path = os.path.join(root, "data", "large.bin")
+            os.makedirs(os.path.dirname(large_path), exist_ok=True)
+
+            def write_large():
+                with open(large_path, "wb") as f:
+                    f.write(os.urandom(args.large_file_mb * 1024 * 1024))
+
+            runner.measure(
+                "create_snapshot_large_file",
+                lambda: recorder.create_snapshot(large_path),
+                setup=write_large,
+            )
+            recorder.close()
+
+        recorder = Recorder(root)
+        scheduler = SnapshotScheduler(debounce_interval=args.debounce)
+        scheduler.start()
+        watcher = Watcher(root, recorder, scheduler=scheduler)
+        runner.measure("watcher_start", watcher.start, repeat=1)
+        try:
+            heads: List[str] = []
+
+            def save():
+                heads.append(recorder.history.head_sha() or "")
+                project.edit(project.pick())
+
+            runner.measure(
+                "watcher_save_to_commit",
+                lambda: wait_for_commit(recorder, heads[-1]),
+                setup=save,
+            )
+        finally:
+            watcher.stop()
+            scheduler.stop()
+            recorder.close()
+
+        return {
+            "revision": _revision(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                "files": args.files,
+                "snapshots": args.snapshots,
+                "large_file_mb": args.large_file_mb,
+                "repeat": args.repeat,
+                "debounce": args.debounce,
+                "seed": args.seed,
+            },
+            "results": runner.results,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "-C", ROOT, "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path: str, after_path: str, threshold: float) -> int:
+    """Prints the median change per benchmark; returns 1 if any regressed."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    if before.get("params") != after.get("params"):
+        print("Warning: the runs used different parameters.")
+
+    regressions = 0
+    print(f"{'benchmark':45s} {'before ms':>10s} {'after ms':>10s} {'change':>8s}")
+    for name, result in after["results"].items():
+        if name not in before["results"]:
+            continue
+        old = before["results"][name]["median"]
+        new = result["median"]
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  improved"
+        print(f"{name:45s} {old * 1000:10.2f} {new * 1000:10.2f} {change:+8.1%}{flag}")
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Code Trajectory benchmarks")
+    parser.add_argument("--files", type=int, default=10000, help="Files in the project")
+    parser.add_argument("--snapshots", type=int, default=50000, help="Snapshots in the history")
+    parser.add_argument(
+        "--large-file-mb", type=int, default=50, help="Size of the large file case (0 to skip)"
+    )
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per benchmark")
+    parser.add_argument(
+        "--debounce", type=float, default=0.05, help="Watcher debounce interval in seconds"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated history")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two result files"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Median slowdown reported as a regression by --compare (default: 0.10)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# SPDX-License-Identifier: MIT
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Default memory limit of a Trajectory's cache.
+DEFAULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+class LRUCache:
+    """A thread-safe least-recently-used cache bounded by the size of its values.
+
+    Attributes:
+        max_bytes: Total size of the values kept before the oldest are evicted.
+        hits: Number of successful lookups.
+        misses: Number of failed lookups.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached values."""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int):
+        """Caches value, evicting the least recently used entries to stay within max_bytes.
+
+        Values larger than max_bytes are not cached.
+        """
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]):
+        """Drops every entry whose key matches predicate."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -0,0 +1,188 @@
+# SPDX-License-Identifier: MIT
+import logging
+import subprocess
+import threading
+from io import BytesIO
+from typing import Optional
+
+import git
+from git.db import GitCmdObjectDB
+from gitdb.base import OInfo, OStream
+from gitdb.exc import BadObject
+from gitdb.util import bin_to_hex, hex_to_bin
+
+logger = logging.getLogger(__name__)
+
+# Number of long-lived processes per mode (--batch and --batch-check).
+DEFAULT_POOL_SIZE = 2
+
+
+class _CatFileProcess:
+    """One `git cat-file --batch[-check]` process; used by a single thread at a time."""
+
+    def __init__(self, git_cmd: git.Git, mode: str, generation: int):
+        self.mode = mode
+        self.generation = generation
+        self.proc = git_cmd.cat_file(mode, as_process=True, istream=subprocess.PIPE)
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.proc is not None and self.proc.proc.poll() is None
+
+    def request(self, rev: str) -> tuple[str, str, int, Optional[bytes]]:
+        stdin, stdout = self.proc.proc.stdin, self.proc.proc.stdout
+        stdin.write(rev.encode("utf-8") + b"\n")
+        stdin.flush()
+
+        header = stdout.readline()
+        if not header:
+            raise BrokenPipeError(f"git cat-file {self.mode} exited")
+        header = header.rstrip(b"\n")
+        # "<rev> missing" or "<rev> ambiguous"; rev may itself contain spaces.
+        if header.endswith((b" missing", b" ambiguous")):
+            raise BadObject(rev)
+        fields = header.split()
+        if len(fields) != 3 or not fields[2].isdigit():
+            raise BadObject(rev)
+        sha, typename, size = fields[0].decode(), fields[1].decode(), int(fields[2])
+
+        data = None
+        if self.mode == "--batch":
+            data = stdout.read(size)
+            stdout.read(1)  # Trailing newline.
+        return sha, typename, size, data
+
+    def close(self):
+        if self.alive:
+            self.proc.proc.stdin.close()
+            self.proc.proc.wait()
+
+
+class CatFilePool:
+    """A thread-safe pool of long-lived `git cat-file` processes.
+
+    Each request borrows an idle process (spawning one while the pool is below
+    its size, waiting otherwise), so object reads from several threads never
+    pay process startup per object and never interleave on one pipe.
+
+    Attributes:
+        size: Maximum number of processes per mode.
+    """
+
+    def __init__(self, git_cmd: git.Git, size: int = DEFAULT_POOL_SIZE):
+        self.size = size
+        self._git = git_cmd
+        self._cond = threading.Condition()
+        self._idle: dict[str, list[_CatFileProcess]] = {"--batch": [], "--batch-check": []}
+        self._count = {"--batch": 0, "--batch-check": 0}
+        # Bumped by close() so that processes busy at that time are not reused.
+        self._generation = 0
+
+    def info(self, rev: str) -> tuple[str, str, int]:
+        """Returns (hexsha, type, size) of rev without reading its content."""
+        sha, typename, size, _ = self._request("--batch-check", rev)
+        return sha, typename, size
+
+    def read(self, rev: str) -> tuple[str, str, bytes]:
+        """Returns (hexsha, type, content) of rev."""
+        sha, typename, _, data = self._request("--batch", rev)
+        assert data is not None
+        return sha, typename, data
+
+    def close(self):
+        """Stops every idle process; busy ones are stopped when released.
+
+        The pool stays usable and starts new processes on the next request.
+        """
+        with self._cond:
+            self._generation += 1
+            for processes in self._idle.values():
+                for process in processes:
+                    process.close()
+                processes.clear()
+            self._count = {mode: 0 for mode in self._count}
+
+    def _request(self, mode: str, rev: str) -> tuple[str, str, int, Optional[bytes]]:
+        process = self._acquire(mode)
+        try:
+            try:
+                result = process.request(rev)
+            except (BrokenPipeError, OSError):
+                # The process died (e.g. after repository maintenance); retry once.
+                logger.debug(f"Restarting git cat-file {mode}")
+                process.close()
+                process = _CatFileProcess(self._git, mode, process.generation)
+                result = process.request(rev)
+        except BadObject:
+            self._release(process)
+            raise
+        except BaseException:
+            # A partially read reply would desynchronise the pipe.
+            self._release(process, broken=True)
+            raise
+        self._release(process)
+        return result
+
+    def _acquire(self, mode: str) -> _CatFileProcess:
+        with self._cond:
+            while not self._idle[mode] and self._count[mode] >= self.size:
+                self._cond.wait()
+            if self._idle[mode]:
+                return self._idle[mode].pop()
+            self._count[mode] += 1
+            generation = self._generation
+        try:
+            return _CatFileProcess(self._git, mode, generation)
+        except Exception:
+            with self._cond:
+                self._count[mode] -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, process: _CatFileProcess, broken: bool = False):
+        with self._cond:
+            if process.generation != self._generation:
+                # Already uncounted by close().
+                process.close()
+            elif broken:
+                process.close()
+                self._count[process.mode] -= 1
+            else:
+                self._idle[process.mode].append(process)
+            self._cond.notify()
+
+
+class PooledObjectDB(GitCmdObjectDB):
+    """Object database that reads through a CatFilePool.
+
+    Passed as `odbt` to git.Repo so that every GitPython object read (commit
+    parsing, tree lookups, blob streams) is served by the shared pool instead
+    of the single per-repository cat-file process, which is not thread-safe.
+
+    Attributes:
+        pool: The cat-file pool serving reads.
+    """
+
+    def __init__(self, root_path, git_cmd: git.Git):
+        super().__init__(root_path, git_cmd)
+        self.pool = CatFilePool(git_cmd)
+
+    def info(self, binsha: bytes) -> OInfo:
+        hexsha = bin_to_hex(binsha).decode("ascii")
+        try:
+            sha, typename, size = self.pool.info(hexsha)
+        except BadObject:
+            # GitPython reports missing objects as ValueError.
+            raise ValueError(f"SHA {hexsha} could not be resolved")
+        return OInfo(hex_to_bin(sha), typename.encode("ascii"), size)
+
+    def stream(self, binsha: bytes) -> OStream:
+        hexsha = bin_to_hex(binsha).decode("ascii")
+        try:
+            sha, typename, data = self.pool.read(hexsha)
+        except BadObject:
+            raise ValueError(f"SHA {hexsha} could not be resolved")
+        return OStream(hex_to_bin(sha), typename.encode("ascii"), len(data), BytesIO(data))
+
+    def partial_to_complete_sha_hex(self, partial_hexsha: str) -> bytes:
+        return hex_to_bin(self.pool.info(partial_hexsha)[0])
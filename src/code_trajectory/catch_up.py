@@ -0,0 +1,233 @@
+# SPDX-License-Identifier: MIT
+import hashlib
+import logging
+import os
+import sqlite3
+import stat
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .ignore import IgnoreMatcher
+from .large_files import FilePointer, LargeFilePolicy
+from .object_writer import MODE_EXECUTABLE, MODE_FILE, MODE_SYMLINK
+
+logger = logging.getLogger(__name__)
+
+# SQLite stat cache of the last catch-up scan, inside the shadow git dir.
+STAT_CACHE_FILE = "trajectory-stat-cache.sqlite3"
+
+# Files modified this recently before being hashed may change again within the
+# same timestamp, so their hash is not trusted on the next scan (git's "racy
+# git" problem).
+RACY_SECONDS = 2.0
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stat_cache (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    mode INTEGER NOT NULL,
+    blob TEXT
+);
+"""
+
+
+@dataclass
+class StatEntry:
+    """The stat of a file at the last scan and, if it was hashed, its blob.
+
+    Attributes:
+        mtime_ns: Modification time in nanoseconds.
+        size: Size in bytes.
+        inode: Inode number.
+        mode: The git file mode (regular, executable or symlink).
+        blob: The git blob sha of the content, or None if it was not hashed.
+    """
+
+    mtime_ns: int
+    size: int
+    inode: int
+    mode: int
+    blob: Optional[str] = None
+
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> "StatEntry":
+        return cls(st.st_mtime_ns, st.st_size, st.st_ino, git_mode(st))
+
+    def same_stat(self, other: "StatEntry") -> bool:
+        return (self.mtime_ns, self.size, self.inode, self.mode) == (
+            other.mtime_ns,
+            other.size,
+            other.inode,
+            other.mode,
+        )
+
+
+@dataclass
+class CatchUpResult:
+    """The outcome of comparing the worktree with the shadow HEAD.
+
+    Attributes:
+        changed: Relative paths that were modified, created or deleted.
+        entries: The stat cache to persist for the next scan.
+        hashed: Number of files whose content had to be hashed.
+    """
+
+    changed: List[str] = field(default_factory=list)
+    entries: Dict[str, StatEntry] = field(default_factory=dict)
+    hashed: int = 0
+
+
+class StatCache:
+    """Persists the stat of every worktree file between server runs.
+
+    Like git's index, the cache lets a scan trust a file whose mtime, size,
+    inode and mode are unchanged and hash only the others.
+
+    Attributes:
+        path: Location of the SQLite database.
+        exists: False if no scan was ever saved, so every file is new to it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.exists = os.path.exists(path)
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def load(self) -> Dict[str, StatEntry]:
+        rows = self._conn.execute(
+            "SELECT path, mtime_ns, size, inode, mode, blob FROM stat_cache"
+        )
+        return {row[0]: StatEntry(*row[1:]) for row in rows}
+
+    def replace(self, entries: Dict[str, StatEntry]):
+        """Replaces the whole cache with entries in one transaction."""
+        with self._conn:
+            self._conn.execute("DELETE FROM stat_cache")
+            self._conn.executemany(
+                "INSERT INTO stat_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (path, e.mtime_ns, e.size, e.inode, e.mode, e.blob)
+                    for path, e in entries.items()
+                ),
+            )
+        self.exists = True
+
+
+def git_mode(st: os.stat_result) -> int:
+    if stat.S_ISLNK(st.st_mode):
+        return MODE_SYMLINK
+    return MODE_EXECUTABLE if st.st_mode & stat.S_IXUSR else MODE_FILE
+
+
+def blob_sha(filepath: str, st: os.stat_result, large_files: LargeFilePolicy) -> str:
+    """Returns the sha of the blob a snapshot of filepath would store.
+
+    Regular files are hashed in chunks; large files hash their pointer.
+    """
+    if stat.S_ISLNK(st.st_mode):
+        data = os.fsencode(os.readlink(filepath))
+    elif large_files.stores_pointer(filepath, st.st_size):
+        data = FilePointer.from_file(filepath).to_bytes()
+    else:
+        digest = hashlib.sha1(b"blob %d\0" % st.st_size)
+        with open(filepath, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def iter_worktree(root: str, matcher: IgnoreMatcher) -> Iterator[Tuple[str, os.stat_result]]:
+    """Yields every file that is not ignored, relative to root, with its lstat.
+
+    Ignored directories are pruned without being listed.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not matcher.is_ignored(entry.path, is_dir=True):
+                                stack.append(entry.path)
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if not (stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)):
+                        continue
+                    if matcher.is_ignored(entry.path, is_dir=False):
+                        continue
+                    rel_path = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                    yield rel_path, st
+        except OSError as e:
+            logger.warning(f"Failed to scan {directory}: {e}")
+
+
+def find_changes(
+    root: str,
+    head: Dict[str, Tuple[int, str]],
+    cache: Dict[str, StatEntry],
+    cache_exists: bool,
+    matcher: IgnoreMatcher,
+    large_files: LargeFilePolicy,
+) -> CatchUpResult:
+    """Compares the worktree with the shadow HEAD tree.
+
+    A file recorded in HEAD is hashed only if its stat differs from the
+    cache (or its hash was never trusted) and is changed if its mode or blob
+    differs. A file that was never recorded is changed only if it is new or
+    was modified since the previous scan; on the first scan the cache is
+    only populated, so untouched files are not swept into history.
+
+    Args:
+        root: The project root.
+        head: Mode and blob sha of each file in HEAD, by relative path.
+        cache: The stat cache of the previous scan.
+        cache_exists: Whether a previous scan was saved.
+        matcher: Decides which paths are ignored.
+        large_files: Limits above which snapshots store a pointer.
+    """
+    result = CatchUpResult()
+    racy_since = time.time_ns() - int(RACY_SECONDS * 1e9)
+    for rel_path, st in iter_worktree(root, matcher):
+        entry = StatEntry.from_stat(st)
+        cached = cache.get(rel_path)
+        if cached is not None and cached.same_stat(entry):
+            entry.blob = cached.blob
+
+        recorded = head.get(rel_path)
+        if recorded is None:
+            if cache_exists and (cached is None or not cached.same_stat(entry)):
+                result.changed.append(rel_path)
+        else:
+            if entry.blob is None:
+                try:
+                    blob = blob_sha(os.path.join(root, rel_path), st, large_files)
+                except OSError as e:
+                    logger.warning(f"Failed to hash {rel_path}: {e}")
+                    continue
+                result.hashed += 1
+                if st.st_mtime_ns < racy_since:
+                    entry.blob = blob
+            else:
+                blob = entry.blob
+            if (entry.mode, blob) != recorded:
+                result.changed.append(rel_path)
+        result.entries[rel_path] = entry
+
+    for rel_path in head:
+        if rel_path not in result.entries and not os.path.lexists(os.path.join(root, rel_path)):
+            result.changed.append(rel_path)
+    return result
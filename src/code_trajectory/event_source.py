@@ -0,0 +1,131 @@
+# SPDX-License-Identifier: MIT
+import functools
+import logging
+import threading
+from typing import Optional
+
+from watchdog.observers.api import (
+    DEFAULT_OBSERVER_TIMEOUT,
+    BaseObserver,
+    EventEmitter,
+    EventQueue,
+    ObservedWatch,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SourceEmitter(EventEmitter):
+    """A watchdog emitter without a thread of its own.
+
+    Its watch is served by the observer's shared EventSource, which queues
+    events through it, so the number of threads does not grow with the
+    number of watches.
+    """
+
+    def __init__(
+        self,
+        source: "EventSource",
+        event_queue: EventQueue,
+        watch: ObservedWatch,
+        *,
+        timeout: float = DEFAULT_OBSERVER_TIMEOUT,
+        event_filter=None,
+    ):
+        super().__init__(event_queue, watch, timeout=timeout, event_filter=event_filter)
+        self._source = source
+
+    def start(self):
+        self._source.add(self)
+
+    def stop(self):
+        super().stop()
+        self._source.remove(self)
+
+
+class EventSource:
+    """Produces the events of every watch of an observer from one thread.
+
+    Subclasses implement `poll`, which waits up to a timeout and queues the
+    events found through the emitters, and may react to watches being added
+    and removed. `poll`, `watch_added` and `watch_removed` are called with
+    `lock` held, apart from the waiting part of `poll`, which subclasses do
+    before taking the lock.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.RLock()
+        self.emitters: dict[str, SourceEmitter] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self.close()
+
+    def add(self, emitter: SourceEmitter):
+        with self.lock:
+            self.emitters[emitter.watch.path] = emitter
+            self.watch_added(emitter)
+
+    def remove(self, emitter: SourceEmitter):
+        with self.lock:
+            if self.emitters.get(emitter.watch.path) is emitter:
+                del self.emitters[emitter.watch.path]
+                self.watch_removed(emitter)
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """Sleeps up to timeout; returns True if the source is stopping."""
+        return self._stop.wait(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll(DEFAULT_OBSERVER_TIMEOUT)
+            except Exception as e:
+                logger.error(f"{self.name} failed: {e}")
+                self.wait(DEFAULT_OBSERVER_TIMEOUT)
+
+    def poll(self, timeout: float):
+        raise NotImplementedError
+
+    def watch_added(self, emitter: SourceEmitter):
+        pass
+
+    def watch_removed(self, emitter: SourceEmitter):
+        pass
+
+    def close(self):
+        pass
+
+
+class SourceObserver(BaseObserver):
+    """A watchdog observer whose watches are all served by one EventSource.
+
+    Attributes:
+        source: The shared event source.
+    """
+
+    def __init__(self, source: EventSource):
+        super().__init__(functools.partial(SourceEmitter, source))  # type: ignore[arg-type]
+        self.source = source
+
+    def start(self):
+        self.source.start()
+        super().start()
+
+    def on_thread_stop(self):
+        super().on_thread_stop()
+        self.source.stop()
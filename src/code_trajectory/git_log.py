@@ -0,0 +1,201 @@
+# SPDX-License-Identifier: MIT
+import logging
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+import git
+
+logger = logging.getLogger(__name__)
+
+# Record layout parsed by `iter_log_with_stats`: a record separator, then the
+# commit fields separated by unit separators, then the -z numstat entries.
+LOG_FORMAT = "%x1e%H%x1f%P%x1f%ct%x1f%B%x1f"
+
+READ_CHUNK_SIZE = 65536
+
+
+@dataclass
+class CommitStats:
+    """A commit and its per-file line counts, as streamed from `git log --numstat`.
+
+    Attributes:
+        sha: The commit hexsha.
+        parent: The first parent hexsha, or None for a root commit.
+        timestamp: Committer time as a unix epoch.
+        message: The full commit message.
+        files: (path, added, removed) per changed file; counts are None for
+            binary files. Paths are relative to the project root.
+    """
+
+    sha: str
+    parent: Optional[str]
+    timestamp: int
+    message: str
+    files: List[Tuple[str, Optional[int], Optional[int]]] = field(default_factory=list)
+
+
+@dataclass
+class FileRevision:
+    """One commit of a file's history, as streamed from `git log -p --follow`.
+
+    Attributes:
+        sha: The commit hexsha.
+        parent: The first parent hexsha, or None for a root commit.
+        timestamp: Committer time as a unix epoch.
+        message: The full commit message.
+        blob: The file's blob sha after the commit, or None if it was deleted.
+        patch: The diff hunks for the file, without the diff headers.
+    """
+
+    sha: str
+    parent: Optional[str]
+    timestamp: int
+    message: str
+    blob: Optional[str]
+    patch: str
+
+
+def iter_log_with_stats(repo: git.Repo, *args: str) -> Iterator[CommitStats]:
+    """Streams commits with their numstat from a single `git log` process.
+
+    A caller that stops iterating early (e.g. at the first commit it already
+    knows) does not wait for the rest of the history.
+
+    Args:
+        repo: The repository to read.
+        *args: Extra `git log` arguments (revisions, limits, "--" and paths).
+    """
+    for record in _iter_records(
+        repo, "-z", "--numstat", "--no-renames", f"--format={LOG_FORMAT}", *args
+    ):
+        yield _parse_record(record.decode("utf-8", errors="replace"))
+
+
+def iter_log(repo: git.Repo, *args: str) -> Iterator[CommitStats]:
+    """Streams commits without file statistics (files is empty), newest first.
+
+    Args:
+        repo: The repository to read.
+        *args: Extra `git log` arguments (revisions, limits).
+    """
+    for record in _iter_records(repo, f"--format={LOG_FORMAT}", *args):
+        yield _parse_record(record.decode("utf-8", errors="replace"))
+
+
+def iter_log_subjects(repo: git.Repo, *args: str) -> Iterator[Tuple[str, str]]:
+    """Streams (sha, subject) pairs from a single `git log` process, newest first.
+
+    Args:
+        repo: The repository to read.
+        *args: Extra `git log` arguments (revisions, limits).
+    """
+    for record in _iter_records(repo, "--format=%x1e%H%x1f%s", *args):
+        sha, subject = record.decode("utf-8", errors="replace").split("\x1f", 1)
+        yield sha, subject.rstrip("\n")
+
+
+def iter_file_log(
+    repo: git.Repo,
+    abs_path: str,
+    max_count: Optional[int] = None,
+    rev_range: str = "HEAD",
+    patches: bool = True,
+) -> Iterator[FileRevision]:
+    """Streams a file's history with its patches, newest first, in one git process.
+
+    Renames are followed. The blob sha comes from the raw diff line, so no file
+    content is read to tell revisions apart.
+
+    Args:
+        repo: The repository to read.
+        abs_path: Absolute path of the file.
+        max_count: Maximum number of commits to return.
+        rev_range: Revisions to walk.
+        patches: If False, git computes no diffs and every patch is empty.
+    """
+    args = ["--follow", "--raw", "--no-abbrev", f"--format={LOG_FORMAT}"]
+    if patches:
+        args.append("-p")
+    if max_count is not None:
+        args.append(f"--max-count={max_count}")
+    for record in _iter_records(repo, *args, rev_range, "--", abs_path):
+        yield _parse_file_record(record)
+
+
+def _iter_records(repo: git.Repo, *args: str) -> Iterator[bytes]:
+    """Runs `git log` and yields its output split at LOG_FORMAT's record separator.
+
+    Output is read incrementally and the git process is killed if the caller
+    stops iterating early.
+    """
+    proc = repo.git.log(*args, as_process=True)
+    finished = False
+    try:
+        yield from _split_records(proc.stdout)
+        finished = True
+    finally:
+        if finished:
+            # Raises GitCommandError if git failed.
+            proc.wait()
+        elif proc.proc is not None:
+            proc.proc.kill()
+            proc.proc.wait()
+
+
+def _split_records(stream) -> Iterator[bytes]:
+    buffer = b""
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        buffer += chunk
+        records = buffer.split(b"\x1e")
+        # The last record may be incomplete until the stream ends.
+        buffer = records.pop() if chunk else b""
+        for record in records:
+            if record:
+                yield record
+        if not chunk:
+            return
+
+
+def _parse_record(record: str) -> CommitStats:
+    sha, parents, timestamp, message, numstat = record.split("\x1f", 4)
+    files = []
+    for entry in numstat.split("\0"):
+        entry = entry.lstrip("\n")
+        fields = entry.split("\t", 2)
+        if len(fields) != 3:
+            continue
+        added, removed, path = fields
+        files.append((
+            path,
+            int(added) if added != "-" else None,
+            int(removed) if removed != "-" else None,
+        ))
+    parent = parents.split(" ")[0] if parents else None
+    return CommitStats(sha, parent, int(timestamp), message, files)
+
+
+def _parse_file_record(record: bytes) -> FileRevision:
+    *header, diff = record.split(b"\x1f", 4)
+    sha, parents, timestamp, message = (f.decode("utf-8", errors="replace") for f in header)
+
+    blob: Optional[str] = None
+    patch_start = None
+    lines = diff.split(b"\n")
+    for index, line in enumerate(lines):
+        if line.startswith(b":"):
+            # ":<old mode> <new mode> <old sha> <new sha> <status>\t<path>"
+            fields = line.split(b"\t", 1)[0].split(b" ")
+            new_sha = fields[3].decode("ascii")
+            blob = None if fields[4].startswith(b"D") else new_sha
+        elif line.startswith(b"@@") or line.startswith(b"Binary files"):
+            patch_start = index
+            break
+
+    patch = b""
+    if patch_start is not None:
+        patch = b"\n".join(lines[patch_start:]).rstrip(b"\n")
+    parent = parents.split(" ")[0] if parents else None
+    return FileRevision(
+        sha, parent, int(timestamp), message, blob, patch.decode("utf-8", errors="replace")
+    )
@@ -0,0 +1,419 @@
+# SPDX-License-Identifier: MIT
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional
+
+import git
+
+from .git_log import CommitStats, iter_log_with_stats
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    sha TEXT PRIMARY KEY,
+    parent TEXT,
+    timestamp INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    intent TEXT,
+    message TEXT NOT NULL,
+    stats_pending INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS files (
+    sha TEXT NOT NULL,
+    path TEXT NOT NULL,
+    added INTEGER,
+    removed INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_by_sha ON files (sha);
+CREATE INDEX IF NOT EXISTS commits_pending ON commits (sha) WHERE stats_pending = 1;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS session (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    head TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    commits INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_files (path TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS session_intents (intent TEXT PRIMARY KEY);
+"""
+
+# Pending commits resolved per `git log --no-walk` call, bounding its argv.
+PENDING_CHUNK_SIZE = 500
+
+# Commits further apart than this belong to different sessions.
+SESSION_GAP_SECONDS = 3600
+
+# How far back a rebuilt session model looks for a session boundary.
+SESSION_LOOKBACK = 1000
+
+# Walks the first-parent chain from a commit, newest first.
+CHAIN_QUERY = """
+WITH RECURSIVE chain(sha, depth) AS (
+    SELECT ?, 0
+    UNION ALL
+    SELECT commits.parent, chain.depth + 1
+    FROM commits JOIN chain ON commits.sha = chain.sha
+    WHERE commits.parent IS NOT NULL AND chain.depth + 1 < ?
+)
+SELECT commits.sha, commits.parent, commits.timestamp, commits.kind,
+       commits.intent, commits.message
+FROM chain JOIN commits ON commits.sha = chain.sha
+ORDER BY chain.depth
+"""
+
+def commit_kind(message: str) -> str:
+    """Classifies a shadow commit message as AUTO-TRJ, CONSOLIDATE or OTHER."""
+    if message.startswith("[AUTO-TRJ]"):
+        return "AUTO-TRJ"
+    # Backward compatibility: [CHECKPOINT] was the old name of [CONSOLIDATE].
+    if message.startswith("[CONSOLIDATE]") or message.startswith("[CHECKPOINT]"):
+        return "CONSOLIDATE"
+    return "OTHER"
+
+
+def commit_intent(message: str) -> Optional[str]:
+    """Extracts the intent from a message written by the Recorder."""
+    parts = message.strip().split("\n", 1)[0].split(" - ")
+    kind = commit_kind(message)
+    if kind == "AUTO-TRJ" and len(parts) >= 3:
+        return " - ".join(parts[1:-1])
+    if kind == "CONSOLIDATE" and len(parts) >= 2:
+        return " - ".join(parts[1:])
+    return None
+
+
+class HistoryRow:
+    """One indexed commit, as returned by HistoryIndex queries."""
+
+    __slots__ = ("sha", "parent", "timestamp", "kind", "intent", "message")
+
+    def __init__(self, sha, parent, timestamp, kind, intent, message):
+        self.sha = sha
+        self.parent = parent
+        self.timestamp = timestamp
+        self.kind = kind
+        self.intent = intent
+        self.message = message
+
+
+@dataclass
+class SessionSummary:
+    """The last session: the run of commits up to HEAD without an hour-long gap.
+
+    Attributes:
+        head: The commit the summary is up to date with.
+        start: Timestamp of the session's first commit.
+        end: Timestamp of its last commit.
+        commits: Number of commits in the session.
+        files: Paths changed in the session, in the order they were first seen.
+        intents: Intents of the session's commits, in the order they were first seen.
+    """
+
+    head: str
+    start: int
+    end: int
+    commits: int
+    files: list[str] = field(default_factory=list)
+    intents: list[str] = field(default_factory=list)
+
+
+class HistoryIndex:
+    """SQLite sidecar that indexes the shadow history for fast queries.
+
+    The Recorder adds every commit it creates with `record_commit`, using the
+    paths it already knows; line counts that would need a diff are marked as
+    pending. `sync` backfills commits that were made outside the Recorder and
+    resolves pending counts with a single `git log --numstat` call, so history
+    queries never walk commits or compute stats one commit at a time. The
+    newest commit whose whole chain is indexed is remembered, so a `sync`
+    with nothing to do costs one lookup whatever the history's length.
+
+    The index also keeps a model of the last session, extended by each
+    recorded commit, so summarizing it does not depend on the session's
+    length. Any other change to HEAD invalidates the model, which the next
+    `session` call rebuilds from the commit chain.
+
+    Attributes:
+        repo: The shadow repository.
+        path: Location of the SQLite database.
+    """
+
+    def __init__(self, repo: git.Repo, path: str):
+        self.repo = repo
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def head_sha(self) -> Optional[str]:
+        """Returns the shadow HEAD commit, resolved without spawning git."""
+        try:
+            return self.repo.head.commit.hexsha
+        except ValueError:
+            return None
+
+    def record_commit(
+        self,
+        sha: str,
+        parent: Optional[str],
+        timestamp: int,
+        message: str,
+        paths: Optional[Iterable[str]] = None,
+    ):
+        """Adds a commit created by the Recorder.
+
+        Args:
+            sha: The new commit.
+            parent: Its first parent, if any.
+            timestamp: Commit time as a unix epoch.
+            message: The full commit message.
+            paths: Changed paths relative to the project root, or None if they
+                are unknown and should be backfilled from git.
+        """
+        intent = commit_intent(message)
+        paths = None if paths is None else list(paths)
+        with self._lock, self._conn:
+            synced = self._synced_head()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO commits VALUES (?, ?, ?, ?, ?, ?, 1)",
+                (sha, parent, timestamp, commit_kind(message), intent, message),
+            )
+            if parent is None or (synced is not None and parent == synced):
+                self._set_synced_head(sha)
+            self._conn.execute("DELETE FROM files WHERE sha = ?", (sha,))
+            if paths is not None:
+                self._conn.executemany(
+                    "INSERT INTO files (sha, path) VALUES (?, ?)",
+                    [(sha, path) for path in paths],
+                )
+            self._extend_session(sha, parent, timestamp, intent, paths)
+
+    def _extend_session(
+        self,
+        sha: str,
+        parent: Optional[str],
+        timestamp: int,
+        intent: Optional[str],
+        paths: Optional[list[str]],
+    ):
+        """Adds a commit on top of the session model, or invalidates the model."""
+        row = self._conn.execute("SELECT head, end FROM session").fetchone()
+        if paths is None or (parent is not None and (row is None or row[0] != parent)):
+            self._clear_session()
+            return
+        if row is None or parent is None or timestamp - row[1] > SESSION_GAP_SECONDS:
+            self._clear_session()
+            self._conn.execute(
+                "INSERT INTO session VALUES (0, ?, ?, ?, 1)", (sha, timestamp, timestamp)
+            )
+        else:
+            self._conn.execute(
+                "UPDATE session SET head = ?, end = ?, commits = commits + 1", (sha, timestamp)
+            )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO session_files VALUES (?)", [(path,) for path in paths]
+        )
+        if intent:
+            self._conn.execute("INSERT OR IGNORE INTO session_intents VALUES (?)", (intent,))
+
+    def _clear_session(self):
+        self._conn.execute("DELETE FROM session")
+        self._conn.execute("DELETE FROM session_files")
+        self._conn.execute("DELETE FROM session_intents")
+
+    def forget(self, shas: Iterable[str]):
+        """Drops commits that are no longer reachable (e.g. squashed snapshots)."""
+        rows = [(sha,) for sha in shas]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM commits WHERE sha = ?", rows)
+            self._conn.executemany("DELETE FROM files WHERE sha = ?", rows)
+            self._conn.executemany("DELETE FROM session WHERE head = ?", rows)
+            self._conn.executemany(
+                "DELETE FROM meta WHERE key = 'synced_head' AND value = ?", rows
+            )
+
+    def reparent(self, sha: str, parent: str):
+        """Records a new parent for sha (a retention graft).
+
+        The chain below sha is indexed again on the next sync.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE commits SET parent = ? WHERE sha = ?", (parent, sha))
+            self._conn.execute("DELETE FROM meta WHERE key = 'synced_head'")
+            self._clear_session()
+
+    def session(self) -> Optional[SessionSummary]:
+        """Returns the last session up to HEAD, or None without history.
+
+        Reads the session model when it is up to date with HEAD and rebuilds
+        it from the last SESSION_LOOKBACK commits otherwise.
+        """
+        head = self.head_sha()
+        if head is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT head, start, end, commits FROM session"
+            ).fetchone()
+            if row is not None and row[0] == head:
+                return SessionSummary(
+                    *row,
+                    files=[r[0] for r in self._conn.execute(
+                        "SELECT path FROM session_files ORDER BY rowid"
+                    )],
+                    intents=[r[0] for r in self._conn.execute(
+                        "SELECT intent FROM session_intents ORDER BY rowid"
+                    )],
+                )
+        return self._rebuild_session()
+
+    def _rebuild_session(self) -> Optional[SessionSummary]:
+        self.sync()
+        rows = self.chain(SESSION_LOOKBACK)
+        if not rows:
+            return None
+        session = rows
+        for i in range(len(rows) - 1):
+            if rows[i].timestamp - rows[i + 1].timestamp > SESSION_GAP_SECONDS:
+                session = rows[: i + 1]
+                break
+
+        files: dict[str, None] = {}
+        intents: dict[str, None] = {}
+        changed = self.files([row.sha for row in session])
+        for row in reversed(session):
+            files.update(dict.fromkeys(changed[row.sha]))
+            if row.intent:
+                intents[row.intent] = None
+        summary = SessionSummary(
+            rows[0].sha, session[-1].timestamp, rows[0].timestamp, len(session),
+            list(files), list(intents),
+        )
+
+        with self._lock, self._conn:
+            self._clear_session()
+            self._conn.execute(
+                "INSERT INTO session VALUES (0, ?, ?, ?, ?)",
+                (summary.head, summary.start, summary.end, summary.commits),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO session_files VALUES (?)", [(p,) for p in summary.files]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO session_intents VALUES (?)",
+                [(i,) for i in summary.intents],
+            )
+        return summary
+
+    def sync(self):
+        """Indexes commits reachable from HEAD that are missing or incomplete."""
+        head = self.head_sha()
+        if head is None:
+            return
+
+        with self._lock:
+            synced = self._synced_head() == head
+        if not synced:
+            start = self._backfill_start(head)
+            if start is not None:
+                self._backfill(start)
+            with self._lock, self._conn:
+                self._set_synced_head(head)
+
+        with self._lock:
+            pending = [row[0] for row in self._conn.execute(
+                "SELECT sha FROM commits WHERE stats_pending = 1"
+            )]
+        for start in range(0, len(pending), PENDING_CHUNK_SIZE):
+            chunk = pending[start:start + PENDING_CHUNK_SIZE]
+            self._store(iter_log_with_stats(self.repo, "--no-walk=unsorted", *chunk))
+
+    def _synced_head(self) -> Optional[str]:
+        """Returns the newest commit whose whole first-parent chain is indexed."""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'synced_head'").fetchone()
+        return None if row is None else row[0]
+
+    def _set_synced_head(self, sha: str):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('synced_head', ?)", (sha,))
+
+    def _backfill_start(self, head: str) -> Optional[str]:
+        """Returns the newest commit of the HEAD chain that is not indexed yet."""
+        with self._lock:
+            tail = self._conn.execute(
+                CHAIN_QUERY + " DESC LIMIT 1", (head, 2**31)
+            ).fetchone()
+        if tail is None:
+            return head
+        # The chain ends at the root commit or at the first unindexed parent.
+        return tail[1]
+
+    def chain(self, limit: int) -> list[HistoryRow]:
+        """Returns up to limit commits on the first-parent chain of HEAD, newest first."""
+        head = self.head_sha()
+        if head is None or limit <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(CHAIN_QUERY, (head, limit)).fetchall()
+        return [HistoryRow(*row) for row in rows]
+
+    def files(self, shas: list[str]) -> dict[str, list[str]]:
+        """Returns the changed paths of each commit, in git's order."""
+        result: dict[str, list[str]] = {sha: [] for sha in shas}
+        with self._lock:
+            for start in range(0, len(shas), 500):
+                chunk = shas[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                for sha, path in self._conn.execute(
+                    f"SELECT sha, path FROM files WHERE sha IN ({placeholders}) ORDER BY rowid",
+                    chunk,
+                ):
+                    result[sha].append(path)
+        return result
+
+    def _backfill(self, head: str):
+        """Streams history from head until it reaches an indexed commit."""
+        with self._lock:
+            indexed = self._conn.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+        log = iter_log_with_stats(self.repo, head)
+        try:
+            count = self._store(self._until_known(log) if indexed else log)
+        finally:
+            # Stops git if the walk ended at an indexed commit.
+            log.close()
+        logger.info(f"Indexed {count} commits of shadow history")
+
+    def _until_known(self, entries: Iterator[CommitStats]) -> Iterator[CommitStats]:
+        for entry in entries:
+            with self._lock:
+                known = self._conn.execute(
+                    "SELECT 1 FROM commits WHERE sha = ? AND stats_pending = 0", (entry.sha,)
+                ).fetchone()
+            if known:
+                return
+            yield entry
+
+    def _store(self, entries: Iterable[CommitStats]) -> int:
+        count = 0
+        with self._lock, self._conn:
+            for entry in entries:
+                message = entry.message
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO commits VALUES (?, ?, ?, ?, ?, ?, 0)",
+                    (entry.sha, entry.parent, entry.timestamp, commit_kind(message),
+                     commit_intent(message), message),
+                )
+                self._conn.execute("DELETE FROM files WHERE sha = ?", (entry.sha,))
+                self._conn.executemany(
+                    "INSERT INTO files VALUES (?, ?, ?, ?)",
+                    [(entry.sha, *stats) for stats in entry.files],
+                )
+                count += 1
+        return count
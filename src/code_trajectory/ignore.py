@@ -0,0 +1,315 @@
+# SPDX-License-Identifier: MIT
+import logging
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+import git
+
+logger = logging.getLogger(__name__)
+
+# Directory names that are never recorded, whatever the ignore files say.
+ALWAYS_IGNORED = frozenset({".git", ".trajectory"})
+
+_GLOB_CHARS = re.compile(r"[*?\[\\]")
+
+# info/exclude and core.excludesFile are outside the watched tree, so lookups
+# re-stat them, at most this often.
+BASE_CHECK_SECONDS = 2.0
+
+
+class IgnoreRule:
+    """A single compiled line of an ignore file.
+
+    Attributes:
+        pattern: The pattern as written, without negation or trailing slash.
+        negated: True for "!pattern" lines, which re-include matching paths.
+        dir_only: True for "pattern/" lines, which only match directories.
+        anchored: True if the pattern is matched against the full path relative
+            to its ignore file rather than against the basename alone.
+    """
+
+    def __init__(self, line: str):
+        self.negated = line.startswith("!")
+        if self.negated:
+            line = line[1:]
+        elif line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+
+        self.dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        self.anchored = "/" in line
+        self.pattern = line.lstrip("/")
+        self.literal = not _GLOB_CHARS.search(self.pattern)
+        self._regex = None if self.literal else re.compile(_translate(self.pattern))
+
+    def matches(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        target = rel_path if self.anchored else name
+        if self.literal:
+            return target == self.pattern
+        assert self._regex is not None
+        return self._regex.fullmatch(target) is not None
+
+
+class IgnoreFile:
+    """The rules of one ignore file, indexed for fast lookups.
+
+    Unanchored literal patterns (e.g. "node_modules" or ".venv/") are looked
+    up by basename in a dict; only the remaining glob rules are evaluated one
+    by one. Rule positions are kept so that the last matching line still wins.
+
+    Attributes:
+        base: Directory the patterns are relative to ("" for the project root).
+    """
+
+    def __init__(self, base: str, lines: list[str]):
+        self.base = base
+        self._by_name: dict[str, list[tuple[int, IgnoreRule]]] = {}
+        self._globs: list[tuple[int, IgnoreRule]] = []
+
+        for index, raw in enumerate(lines):
+            line = raw.rstrip("\n").rstrip("\r")
+            # Trailing spaces are ignored unless escaped with a backslash.
+            if not line.endswith("\\ "):
+                line = line.rstrip(" ")
+            if not line or line.startswith("#"):
+                continue
+            try:
+                rule = IgnoreRule(line)
+            except re.error as e:
+                logger.warning(f"Skipping invalid ignore pattern {line!r}: {e}")
+                continue
+            if not rule.pattern:
+                continue
+            if rule.literal and not rule.anchored:
+                self._by_name.setdefault(rule.pattern, []).append((index, rule))
+            else:
+                self._globs.append((index, rule))
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """Returns True/False for the last matching rule, or None if none match."""
+        if self.base:
+            if not rel_path.startswith(self.base + "/"):
+                return None
+            rel_path = rel_path[len(self.base) + 1:]
+        name = rel_path.rsplit("/", 1)[-1]
+
+        best: Optional[tuple[int, IgnoreRule]] = None
+        for index, rule in self._by_name.get(name, ()):
+            if rule.matches(rel_path, name, is_dir) and (best is None or index > best[0]):
+                best = (index, rule)
+        for index, rule in reversed(self._globs):
+            if best is not None and index < best[0]:
+                break
+            if rule.matches(rel_path, name, is_dir):
+                best = (index, rule)
+                break
+
+        if best is None:
+            return None
+        return not best[1].negated
+
+
+class IgnoreMatcher:
+    """Decides in-process whether a path is ignored by the shadow repository.
+
+    Follows git's rules for `.gitignore` files in every directory, the shadow
+    repository's `info/exclude` and the global `core.excludesFile`, which are
+    exactly the sources `git check-ignore` consults in the shadow repository.
+    Ignore files are parsed lazily per directory and cached together with the
+    decision for every directory seen, so an ignored directory is pruned with
+    a single dict lookup. Caches are dropped when a `.gitignore` changes (see
+    `invalidate`) and when a lookup finds that `info/exclude` or the global
+    excludes file changed; those two are outside the watched tree, so they
+    are re-stated at most every BASE_CHECK_SECONDS.
+
+    Attributes:
+        project_root: The worktree the paths belong to.
+    """
+
+    def __init__(self, project_root: str, repo: git.Repo):
+        self.project_root = project_root
+        self._lock = threading.Lock()
+        self._exclude_paths = [os.path.join(repo.git_dir, "info", "exclude")]
+        self._global_excludes = self._global_excludes_file(repo)
+        self._files: dict[str, Optional[IgnoreFile]] = {}
+        self._base: Optional[list[IgnoreFile]] = None
+        self._dir_cache: dict[str, bool] = {}
+        self._base_stats: Optional[list[Optional[tuple[int, int]]]] = None
+        self._base_checked = -float("inf")
+
+    @staticmethod
+    def _global_excludes_file(repo: git.Repo) -> Optional[str]:
+        try:
+            value = repo.config_reader().get_value("core", "excludesFile", "")
+        except Exception:
+            value = ""
+        if value:
+            return os.path.expanduser(str(value))
+        config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+        return os.path.join(config_home, "git", "ignore")
+
+    def is_ignore_file(self, path: str) -> bool:
+        """Returns True if path is a file whose changes affect ignore decisions."""
+        return os.path.basename(path) == ".gitignore"
+
+    def invalidate(self, path: Optional[str] = None):
+        """Drops cached rules after an ignore file changed (all caches if path is None)."""
+        with self._lock:
+            self._dir_cache.clear()
+            if path is None or os.path.basename(path) != ".gitignore":
+                self._files.clear()
+                self._base = None
+            else:
+                self._files.pop(self._relative(os.path.dirname(path)), None)
+        logger.debug(f"Invalidated ignore rules for {path or 'all files'}")
+
+    def is_ignored(self, path: str, is_dir: Optional[bool] = None) -> bool:
+        """Returns True if path (absolute or relative to the project root) is ignored."""
+        rel_path = self._relative(path)
+        if not rel_path or rel_path.startswith("../"):
+            return False
+        if is_dir is None:
+            is_dir = os.path.isdir(os.path.join(self.project_root, rel_path))
+
+        parts = rel_path.split("/")
+        with self._lock:
+            self._check_base_files()
+            # A path inside an ignored directory can never be re-included.
+            for i in range(1, len(parts)):
+                if self._dir_ignored("/".join(parts[:i])):
+                    return True
+            if is_dir:
+                return self._dir_ignored(rel_path)
+            return self._decide(rel_path, False)
+
+    def _check_base_files(self):
+        """Drops cached decisions if info/exclude or core.excludesFile changed."""
+        now = time.monotonic()
+        if now - self._base_checked < BASE_CHECK_SECONDS:
+            return
+        self._base_checked = now
+        stats = [_file_stat(path) for path in self._base_sources()]
+        if self._base_stats is not None and stats != self._base_stats:
+            self._dir_cache.clear()
+            self._base = None
+            logger.debug("Reloading info/exclude and core.excludesFile rules")
+        self._base_stats = stats
+
+    def _dir_ignored(self, rel_dir: str) -> bool:
+        cached = self._dir_cache.get(rel_dir)
+        if cached is None:
+            cached = self._dir_cache[rel_dir] = self._decide(rel_dir, True)
+        return cached
+
+    def _decide(self, rel_path: str, is_dir: bool) -> bool:
+        if rel_path.rsplit("/", 1)[-1] in ALWAYS_IGNORED:
+            return True
+
+        # Deeper ignore files take precedence, so check them first.
+        parent = rel_path.rsplit("/", 1)[0] if "/" in rel_path else ""
+        while True:
+            ignore_file = self._load(parent)
+            if ignore_file is not None:
+                result = ignore_file.match(rel_path, is_dir)
+                if result is not None:
+                    return result
+            if not parent:
+                break
+            parent = parent.rsplit("/", 1)[0] if "/" in parent else ""
+
+        for ignore_file in self._base_files():
+            result = ignore_file.match(rel_path, is_dir)
+            if result is not None:
+                return result
+        return False
+
+    def _load(self, rel_dir: str) -> Optional[IgnoreFile]:
+        if rel_dir not in self._files:
+            path = os.path.join(self.project_root, rel_dir, ".gitignore")
+            lines = _read_lines(path)
+            self._files[rel_dir] = IgnoreFile(rel_dir, lines) if lines else None
+        return self._files[rel_dir]
+
+    def _base_files(self) -> list[IgnoreFile]:
+        """Returns info/exclude and core.excludesFile rules, highest precedence first."""
+        if self._base is None:
+            self._base = [
+                IgnoreFile("", lines) for lines in map(_read_lines, self._base_sources()) if lines
+            ]
+        return self._base
+
+    def _base_sources(self) -> list[str]:
+        sources = list(self._exclude_paths)
+        if self._global_excludes:
+            sources.append(self._global_excludes)
+        return sources
+
+    def _relative(self, path: str) -> str:
+        if os.path.isabs(path):
+            path = os.path.relpath(path, self.project_root)
+        path = path.replace(os.sep, "/")
+        return "" if path == "." else path
+
+
+def _file_stat(path: str) -> Optional[tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_lines(path: str) -> list[str]:
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.readlines()
+    except OSError:
+        return []
+
+
+def _translate(pattern: str) -> str:
+    """Translates a gitignore glob into a regular expression."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and i + 2 == n and (i == 0 or pattern[i - 1] == "/"):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            start = i + 1
+            negated = pattern[start:start + 1] in ("!", "^")
+            if negated:
+                start += 1
+            # A "]" right after the opening bracket is a literal member.
+            end = pattern.find("]", start + 1 if pattern[start:start + 1] == "]" else start)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            members = pattern[start:end].replace("[", "\\[")
+            if members.startswith("]"):
+                members = "\\" + members
+            out.append(f"[{'^' if negated else ''}{members}]")
+            i = end + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
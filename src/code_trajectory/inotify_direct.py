@@ -0,0 +1,223 @@
+# SPDX-License-Identifier: MIT
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+from typing import Dict, List, Tuple
+
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirMovedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+)
+
+from .event_source import EventSource, SourceEmitter, SourceObserver
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+    | IN_EXCL_UNLINK
+)
+
+# struct inotify_event: wd, mask, cookie, len, followed by a NUL-padded name.
+EVENT_HEADER = struct.Struct("iIII")
+
+# Bytes read per system call; every event that is ready is read in one batch.
+READ_SIZE = 256 * 1024
+
+
+def _load_libc() -> ctypes.CDLL:
+    if not sys.platform.startswith("linux"):
+        raise OSError("The inotify watch backend is only available on Linux")
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("This C library does not provide inotify")
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+def parse_events(data: bytes) -> List[Tuple[int, int, int, str]]:
+    """Splits a read from an inotify fd into (wd, mask, cookie, name) tuples."""
+    events = []
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+        wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        name = data[offset : offset + length].rstrip(b"\0")
+        offset += length
+        events.append((wd, mask, cookie, os.fsdecode(name)))
+    return events
+
+
+class InotifySource(EventSource):
+    """Watches every directory of an observer through one inotify fd.
+
+    watchdog's inotify observer opens one fd and one thread per watch and
+    reads events one at a time. Here a single thread reads everything that
+    is ready in one `read`, and pairs the two halves of each rename within
+    the batch. Recursive watches add one inotify watch per directory and
+    follow directories as they are created, moved and removed.
+    """
+
+    def __init__(self):
+        super().__init__("trajectory-inotify")
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1 failed: {os.strerror(error)}")
+        self.paths: Dict[int, str] = {}
+        self._wds: Dict[str, int] = {}
+        self._owners: Dict[int, SourceEmitter] = {}
+
+    def watch_added(self, emitter: SourceEmitter):
+        self._add_tree(emitter.watch.path, emitter)
+
+    def watch_removed(self, emitter: SourceEmitter):
+        for wd in [wd for wd, owner in self._owners.items() if owner is emitter]:
+            self._libc.inotify_rm_watch(self._fd, wd)
+            self._forget(wd)
+
+    def poll(self, timeout: float):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready or self.stopping:
+            return
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        with self.lock:
+            self.handle(data)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def handle(self, data: bytes):
+        """Turns one batch of raw events into watchdog events."""
+        moved_from: Dict[int, Tuple[str, bool, int]] = {}
+        for wd, mask, cookie, name in parse_events(data):
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflowed; changes may have been missed")
+                continue
+            if mask & IN_IGNORED:
+                self._forget(wd)
+                continue
+            directory = self.paths.get(wd)
+            if directory is None:
+                continue
+            owner = self._owners[wd]
+            path = os.path.join(directory, name) if name else directory
+            is_dir = bool(mask & IN_ISDIR)
+
+            if mask & IN_MOVED_FROM:
+                moved_from[cookie] = (path, is_dir, wd)
+            elif mask & IN_MOVED_TO:
+                src = moved_from.pop(cookie, None)
+                if src is None:
+                    owner.queue_event(DirCreatedEvent(path) if is_dir else FileCreatedEvent(path))
+                    if is_dir and owner.watch.is_recursive:
+                        self._add_tree(path, owner)
+                    continue
+                self._owners.get(src[2], owner).queue_event(
+                    DirMovedEvent(src[0], path) if is_dir else FileMovedEvent(src[0], path)
+                )
+                if is_dir:
+                    self._remove_tree(src[0])
+                    if owner.watch.is_recursive:
+                        self._add_tree(path, owner)
+            elif mask & IN_CREATE:
+                owner.queue_event(DirCreatedEvent(path) if is_dir else FileCreatedEvent(path))
+                if is_dir and owner.watch.is_recursive:
+                    self._add_tree(path, owner)
+            elif mask & IN_DELETE:
+                owner.queue_event(DirDeletedEvent(path) if is_dir else FileDeletedEvent(path))
+            elif mask & (IN_MODIFY | IN_CLOSE_WRITE) and not is_dir:
+                owner.queue_event(FileModifiedEvent(path))
+
+        # Moved out of the watched tree.
+        for path, is_dir, wd in moved_from.values():
+            owner = self._owners.get(wd)
+            if owner is not None:
+                owner.queue_event(DirDeletedEvent(path) if is_dir else FileDeletedEvent(path))
+            if is_dir:
+                self._remove_tree(path)
+
+    def _add_tree(self, directory: str, owner: SourceEmitter):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                logger.warning(
+                    f"Cannot watch {directory}: inotify watch limit reached "
+                    "(raise fs.inotify.max_user_watches)"
+                )
+            elif error != errno.ENOENT:
+                logger.warning(f"Cannot watch {directory}: {os.strerror(error)}")
+            return
+        self.paths[wd] = directory
+        self._wds[directory] = wd
+        self._owners[wd] = owner
+        if not owner.watch.is_recursive:
+            return
+        try:
+            with os.scandir(directory) as entries:
+                subdirectories = [e.path for e in entries if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for subdirectory in subdirectories:
+            self._add_tree(subdirectory, owner)
+
+    def _remove_tree(self, directory: str):
+        """Drops the watches of a directory that left its place in the tree."""
+        prefix = directory.rstrip(os.sep) + os.sep
+        for path in [p for p in self._wds if p == directory or p.startswith(prefix)]:
+            wd = self._wds[path]
+            self._libc.inotify_rm_watch(self._fd, wd)
+            self._forget(wd)
+
+    def _forget(self, wd: int):
+        path = self.paths.pop(wd, None)
+        self._owners.pop(wd, None)
+        if path is not None and self._wds.get(path) == wd:
+            del self._wds[path]
+
+
+class InotifyObserver(SourceObserver):
+    """Observer backed by an InotifySource."""
+
+    def __init__(self):
+        super().__init__(InotifySource())
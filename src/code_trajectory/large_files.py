@@ -0,0 +1,97 @@
+# SPDX-License-Identifier: MIT
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+# First line of a pointer blob stored in place of a large file's content.
+POINTER_HEADER = b"version code-trajectory/large-file/v1\n"
+
+# Bytes inspected to decide whether a file is binary, as git does.
+BINARY_SNIFF_BYTES = 8000
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class LargeFilePolicy:
+    """Size limits above which a snapshot stores a pointer instead of the content.
+
+    Attributes:
+        max_file_bytes: Largest text file whose content is stored.
+        max_binary_bytes: Largest binary file whose content is stored.
+    """
+
+    max_file_bytes: int = 10 * 1024 * 1024
+    max_binary_bytes: int = 1024 * 1024
+
+    def stores_pointer(self, filepath: str, size: int) -> bool:
+        """Returns True if a file of this size should be replaced by a pointer."""
+        if size > self.max_file_bytes:
+            return True
+        return size > self.max_binary_bytes and is_binary_file(filepath)
+
+
+@dataclass
+class FilePointer:
+    """Stand-in for a large file's content: its hash, size and modification time.
+
+    Identical content always has the same oid, so the content itself is never
+    duplicated into the shadow repository, however often it is saved.
+    """
+
+    oid: str
+    size: int
+    mtime: int
+
+    @classmethod
+    def from_file(cls, filepath: str) -> "FilePointer":
+        """Hashes filepath in chunks, so memory use does not depend on its size."""
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        st = os.stat(filepath)
+        return cls(digest.hexdigest(), st.st_size, int(st.st_mtime))
+
+    @classmethod
+    def parse(cls, data: bytes) -> Optional["FilePointer"]:
+        """Parses a pointer blob, or returns None if data is regular content."""
+        if not data.startswith(POINTER_HEADER):
+            return None
+        fields = dict(
+            line.split(" ", 1)
+            for line in data[len(POINTER_HEADER):].decode("ascii", errors="replace").splitlines()
+            if " " in line
+        )
+        try:
+            oid = fields["oid"].removeprefix("sha256:")
+            return cls(oid, int(fields["size"]), int(fields["mtime"]))
+        except (KeyError, ValueError):
+            return None
+
+    def to_bytes(self) -> bytes:
+        return POINTER_HEADER + (
+            f"oid sha256:{self.oid}\nsize {self.size}\nmtime {self.mtime}\n"
+        ).encode("ascii")
+
+    def describe(self) -> str:
+        return f"[Large file: {self.size} bytes, sha256 {self.oid[:12]}, content not stored]"
+
+
+def is_binary_file(filepath: str) -> bool:
+    """Returns True if the start of the file contains a NUL byte."""
+    try:
+        with open(filepath, "rb") as f:
+            return b"\0" in f.read(BINARY_SNIFF_BYTES)
+    except OSError:
+        return False
+
+
+def describe_pointer_patch(patch: str) -> Optional[str]:
+    """Returns a stub if a patch's new side is a pointer blob, else None."""
+    if POINTER_HEADER.decode("ascii").strip() not in patch:
+        return None
+    new_side = [line[1:] for line in patch.splitlines() if line[:1] in ("+", " ")]
+    pointer = FilePointer.parse("\n".join(new_side).encode("utf-8") + b"\n")
+    return pointer.describe() if pointer is not None else None
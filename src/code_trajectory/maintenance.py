@@ -0,0 +1,227 @@
+# SPDX-License-Identifier: MIT
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Protocol
+
+import git
+from git.exc import GitCommandError
+
+logger = logging.getLogger(__name__)
+
+# Last maintenance run times, inside the shadow git dir.
+MAINTENANCE_STATE_FILE = "trajectory-maintenance.json"
+
+# How often the scheduler looks for repositories due for maintenance.
+DEFAULT_CHECK_INTERVAL = 60.0
+
+
+@dataclass
+class MaintenancePolicy:
+    """When and how aggressively a shadow repository is maintained.
+
+    Attributes:
+        idle_seconds: Time without snapshots before maintenance may start.
+        min_interval: Minimum time between two runs on one repository.
+        max_interval: Run at least this often while the repository changes.
+        loose_objects: Run as soon as this many loose objects accumulated.
+        full_repack_interval: How often every pack is rewritten, which drops
+            packed objects that consolidation made unreachable.
+        reflog_expire: Age after which reflog entries (which keep squashed
+            snapshots reachable) are dropped.
+        prune_expire: Age after which unreachable loose objects are deleted.
+            The grace period protects objects of a snapshot being written.
+    """
+
+    idle_seconds: float = 30.0
+    min_interval: float = 10 * 60.0
+    max_interval: float = 24 * 3600.0
+    loose_objects: int = 1000
+    full_repack_interval: float = 7 * 24 * 3600.0
+    reflog_expire: str = "2.weeks.ago"
+    prune_expire: str = "1.day.ago"
+
+
+def count_loose_objects(repo: git.Repo) -> int:
+    """Returns the number of loose objects in repo."""
+    for line in repo.git.count_objects("-v").splitlines():
+        name, _, value = line.partition(":")
+        if name == "count":
+            return int(value)
+    return 0
+
+
+def maintain_repository(repo: git.Repo, policy: MaintenancePolicy, full_repack: bool):
+    """Runs one maintenance pass over repo.
+
+    Expires old reflog entries, packs loose objects into geometrically sized
+    packs (or rewrites every pack on a full repack), prunes unreachable loose
+    objects and writes a commit-graph with changed-path Bloom filters, which
+    lets path-limited `git log` skip commits that do not touch the path.
+    """
+    git_cmd = repo.git
+    git_cmd.reflog("expire", f"--expire={policy.reflog_expire}",
+                   f"--expire-unreachable={policy.reflog_expire}", "--all")
+    if full_repack:
+        git_cmd.repack("-a", "-d", "-q")
+    else:
+        git_cmd.repack("-d", "-q", "--geometric=2")
+    git_cmd.prune(f"--expire={policy.prune_expire}")
+    git_cmd.commit_graph("write", "--reachable", "--changed-paths", "--no-progress")
+    git_cmd.pack_refs("--all")
+
+
+class MaintenanceState:
+    """Wall-clock times of the last runs, persisted across server restarts.
+
+    Attributes:
+        last_run: Time of the last maintenance pass, 0 if never.
+        last_full_repack: Time of the last full repack, 0 if never.
+        last_retention: Time of the last history downsampling, 0 if never.
+        grafted_since: Time the oldest retention graft was made, 0 if none.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.last_run = 0.0
+        self.last_full_repack = 0.0
+        self.last_retention = 0.0
+        self.grafted_since = 0.0
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.last_run = float(data.get("last_run", 0))
+            self.last_full_repack = float(data.get("last_full_repack", 0))
+            self.last_retention = float(data.get("last_retention", 0))
+            self.grafted_since = float(data.get("grafted_since", 0))
+        except (OSError, ValueError) as e:
+            if os.path.exists(path):
+                logger.warning(f"Ignoring unreadable maintenance state {path}: {e}")
+
+    def save(self):
+        data = {
+            "last_run": self.last_run,
+            "last_full_repack": self.last_full_repack,
+            "last_retention": self.last_retention,
+            "grafted_since": self.grafted_since,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+class Maintainable(Protocol):
+    def maintenance_due(self) -> bool: ...
+
+    def run_maintenance(self, force: bool = False) -> bool: ...
+
+
+class MaintenanceScheduler:
+    """Runs shadow repository maintenance from one background thread.
+
+    Every `check_interval` seconds each registered repository is asked whether
+    maintenance is due (idle and over its policy thresholds) and due ones are
+    maintained one at a time, so several projects share a single thread.
+
+    Attributes:
+        check_interval: Seconds between two checks.
+    """
+
+    def __init__(self, check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._targets: List[Maintainable] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, target: Maintainable):
+        with self._lock:
+            if target not in self._targets:
+                self._targets.append(target)
+
+    def unregister(self, target: Maintainable):
+        with self._lock:
+            if target in self._targets:
+                self._targets.remove(target)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name="trajectory-maintenance", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stops the thread, waiting for a maintenance pass in progress."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_pending(self, should_stop: Callable[[], bool] = lambda: False):
+        """Maintains every registered repository that is due."""
+        with self._lock:
+            targets = list(self._targets)
+        for target in targets:
+            if should_stop():
+                return
+            try:
+                if target.maintenance_due():
+                    target.run_maintenance()
+            except Exception as e:
+                logger.warning(f"Maintenance check failed: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.check_interval):
+            self.run_pending(self._stop.is_set)
+
+
+def needs_maintenance(repo: git.Repo, policy: MaintenancePolicy, state: MaintenanceState) -> bool:
+    """Returns True if the policy's interval and loose-object thresholds call for a run."""
+    now = time.time()
+    if now - state.last_run < policy.min_interval:
+        return False
+    loose = count_loose_objects(repo)
+    return loose > 0 and (
+        loose >= policy.loose_objects or now - state.last_run >= policy.max_interval
+    )
+
+
+def run_git_maintenance(
+    repo: git.Repo, policy: MaintenancePolicy, state: MaintenanceState, full_repack: bool = False
+) -> bool:
+    """Runs one maintenance pass on repo and records it in state.
+
+    A full repack also happens when the policy's interval since the last one
+    has passed.
+
+    Returns:
+        True if the pass succeeded.
+    """
+    now = time.time()
+    full_repack = full_repack or now - state.last_full_repack >= policy.full_repack_interval
+    started = time.monotonic()
+    try:
+        maintain_repository(repo, policy, full_repack)
+    except GitCommandError as e:
+        logger.error(f"Maintenance of {repo.git_dir} failed: {e}")
+        return False
+
+    state.last_run = now
+    if full_repack:
+        state.last_full_repack = now
+    try:
+        state.save()
+    except OSError as e:
+        logger.warning(f"Failed to save maintenance state: {e}")
+    logger.info(
+        f"Maintained {repo.git_dir} in {time.monotonic() - started:.1f}s"
+        f"{' (full repack)' if full_repack else ''}"
+    )
+    return True
@@ -0,0 +1,273 @@
+# SPDX-License-Identifier: MIT
+import bisect
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEFAULT_DUMP_INTERVAL = 15.0
+
+# A metric name plus its sorted (label, value) pairs.
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+T = TypeVar("T")
+
+
+class Histogram:
+    """Counts observations per latency bucket, plus their count and sum."""
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> dict:
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, float("inf")), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class Metrics:
+    """Process-wide counters, latency histograms and gauges.
+
+    Every recording method returns immediately when `enabled` is False, so
+    instrumentation left in hot paths costs one attribute check.
+
+    Attributes:
+        enabled: Whether observations are recorded.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[MetricKey, float] = {}
+        self._histograms: Dict[MetricKey, Histogram] = {}
+        self._gauges: Dict[MetricKey, Callable[[], float]] = {}
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def gauge(self, name: str, callback: Callable[[], float], **labels: str):
+        """Registers callback to be read whenever the metrics are reported."""
+        with self._lock:
+            self._gauges[_key(name, labels)] = callback
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """Observes the duration of the with block in histogram name."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """Decorator observing each call's duration in histogram name."""
+
+        def decorate(func: Callable[..., T]) -> Callable[..., T]:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs) -> T:
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+
+            return wrapper
+
+        return decorate
+
+    def counter(self, name: str, **labels: str) -> float:
+        """Returns the current value of a counter."""
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(_key(name, labels))
+
+    def reset(self):
+        """Drops every recorded value (gauges stay registered)."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        """Returns the current values as a JSON-serialisable dict."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: h.to_dict() for key, h in self._histograms.items()}
+            gauges = dict(self._gauges)
+
+        gauge_values = {}
+        for key, callback in gauges.items():
+            try:
+                gauge_values[key] = callback()
+            except Exception as e:
+                logger.debug(f"Gauge {key[0]} failed: {e}")
+
+        return {
+            "enabled": self.enabled,
+            "counters": [_entry(key, value) for key, value in sorted(counters.items())],
+            "gauges": [_entry(key, value) for key, value in sorted(gauge_values.items())],
+            "histograms": [_entry(key, value) for key, value in sorted(histograms.items())],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Returns the current values in the Prometheus text exposition format."""
+        data = self.snapshot()
+        lines = []
+        typed = set()
+
+        def declare(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for entry in data["counters"]:
+            declare(entry["name"], "counter")
+            lines.append(f"{entry['name']}{_labels(entry['labels'])} {entry['value']}")
+        for entry in data["gauges"]:
+            declare(entry["name"], "gauge")
+            lines.append(f"{entry['name']}{_labels(entry['labels'])} {entry['value']}")
+        for entry in data["histograms"]:
+            name, labels, value = entry["name"], entry["labels"], entry["value"]
+            declare(name, "histogram")
+            for bound, count in value["buckets"].items():
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+            lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+            lines.append(f"{name}_sum{_labels(labels)} {value['sum']}")
+        return "\n".join(lines) + "\n"
+
+
+def _key(name: str, labels: Dict[str, str]) -> MetricKey:
+    return name, tuple(sorted(labels.items()))
+
+
+def _entry(key: MetricKey, value) -> dict:
+    return {"name": key[0], "labels": dict(key[1]), "value": value}
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+# The process-wide metrics every module records into.
+METRICS = Metrics()
+
+_subprocess_hook_installed = False
+
+
+def count_subprocesses():
+    """Counts every subprocess spawned (git included) through an audit hook.
+
+    Audit hooks cannot be removed, so this is installed once; it records
+    nothing while metrics are disabled.
+    """
+    global _subprocess_hook_installed
+    if _subprocess_hook_installed:
+        return
+    _subprocess_hook_installed = True
+
+    def hook(event: str, args: tuple):
+        if event == "subprocess.Popen" and METRICS.enabled:
+            program = os.path.basename(os.fsdecode(args[0])) if args[0] else "unknown"
+            METRICS.increment("subprocesses_spawned_total", program=program)
+
+    sys.addaudithook(hook)
+
+
+class MetricsDumper:
+    """Periodically writes the metrics to a file for external scrapers.
+
+    Files ending in .json get the JSON report, others the Prometheus text
+    format. Writes are atomic so readers never see a partial file.
+
+    Attributes:
+        path: The dump file.
+        interval: Seconds between two writes.
+    """
+
+    def __init__(
+        self, path: str, interval: float = DEFAULT_DUMP_INTERVAL, metrics: Metrics = METRICS
+    ):
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self.metrics = metrics
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="trajectory-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the thread after a final write."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def write(self):
+        if self.path.endswith(".json"):
+            text = self.metrics.to_json()
+        else:
+            text = self.metrics.to_prometheus()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+
+    def _loop(self):
+        while True:
+            stopping = self._stop.wait(self.interval)
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning(f"Failed to write metrics to {self.path}: {e}")
+            if stopping:
+                return
@@ -0,0 +1,271 @@
+# SPDX-License-Identifier: MIT
+import hashlib
+import io
+import logging
+import os
+import stat
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import git
+from git.objects.fun import tree_entries_from_data, tree_to_stream
+from gitdb import GitDB, IStream, LooseObjectDB
+from gitdb.exc import BadObject
+
+from .large_files import FilePointer, LargeFilePolicy
+
+logger = logging.getLogger(__name__)
+
+MODE_FILE = 0o100644
+MODE_EXECUTABLE = 0o100755
+MODE_SYMLINK = 0o120000
+MODE_TREE = 0o040000
+
+# A tree entry as stored by git: (binary sha, mode).
+Entry = Tuple[bytes, int]
+# Marker file in the shadow git dir: the index no longer matches HEAD because
+# snapshots were written without it. Removed once the index is resynced.
+STALE_INDEX_MARKER = "trajectory-index-stale"
+
+# Nested description of the changes to apply to a tree. Leaves are the new
+# entry for a path, or None when the path was removed.
+ChangeTree = Dict[str, Union["ChangeTree", Optional[Entry]]]
+
+
+class RefUpdateError(Exception):
+    """Raised when the branch moved while a snapshot was being written."""
+
+
+class ObjectSnapshotWriter:
+    """Writes snapshot commits straight into the shadow repository's object store.
+
+    Blobs, trees and the commit are written as loose objects from this process,
+    parent trees are read from the loose objects and packs with gitdb, and the
+    branch ref is updated in place, so a snapshot never spawns git. The shadow
+    index is not updated; a marker file records that it has to be resynced
+    before git commands that rely on it run (see Recorder.sync_index).
+
+    Attributes:
+        repo: The shadow repository.
+        project_root: The worktree the snapshots are taken from.
+        large_files: Limits above which a pointer is stored instead of the content.
+    """
+
+    def __init__(
+        self, repo: git.Repo, project_root: str, large_files: Optional[LargeFilePolicy] = None
+    ):
+        self.repo = repo
+        self.project_root = project_root
+        self.large_files = large_files or LargeFilePolicy()
+        objects_dir = os.path.join(repo.git_dir, "objects")
+        self._loose_db = LooseObjectDB(objects_dir)
+        self._db = GitDB(objects_dir)
+        self._identity: Optional[bytes] = None
+
+    def write(
+        self, filepaths: List[str], build_message: Callable[[List[str]], str]
+    ) -> Optional[str]:
+        """Records the current content of filepaths as a new commit on HEAD.
+
+        Args:
+            filepaths: Absolute paths of the files to record.
+            build_message: Called with the absolute paths that actually changed,
+                returns the commit message.
+
+        Returns:
+            The hexsha of the new commit, or None if nothing changed.
+        """
+        ref_path, parent_sha = self._read_head()
+        parent_tree = self._commit_tree(parent_sha) if parent_sha else None
+
+        changes: ChangeTree = {}
+        for filepath in filepaths:
+            rel_path = os.path.relpath(filepath, self.project_root)
+            parts = rel_path.replace(os.sep, "/").split("/")
+            node = changes
+            for part in parts[:-1]:
+                child = node.setdefault(part, {})
+                if not isinstance(child, dict):
+                    child = node[part] = {}
+                node = child
+            node[parts[-1]] = self._write_entry(filepath)
+
+        changed: List[str] = []
+        new_tree = self._patch_tree(parent_tree, changes, "", changed)
+        if new_tree == parent_tree or (new_tree is None and parent_tree is None):
+            return None
+        if new_tree is None:
+            new_tree = self._store(b"tree", b"")
+
+        message = build_message(
+            [os.path.normpath(os.path.join(self.project_root, path)) for path in changed]
+        )
+        commit_sha = self._write_commit(new_tree, parent_sha, message)
+        self._mark_index_stale()
+        self._update_ref(ref_path, parent_sha, commit_sha)
+        return commit_sha.hex()
+
+    def _mark_index_stale(self):
+        path = os.path.join(self.repo.git_dir, STALE_INDEX_MARKER)
+        if not os.path.exists(path):
+            open(path, "w").close()
+
+    def _read(self, binsha: bytes) -> bytes:
+        """Reads an object from the loose objects or packs without spawning git."""
+        try:
+            return self._db.stream(binsha).read()
+        except BadObject:
+            # The object may live in a pack written after the pack list was cached.
+            self._db.update_cache(force=True)
+            return self._db.stream(binsha).read()
+
+    def _read_head(self) -> Tuple[str, Optional[bytes]]:
+        """Returns the ref HEAD points to and its current commit, if any."""
+        with open(os.path.join(self.repo.git_dir, "HEAD"), "r") as f:
+            head = f.read().strip()
+        if not head.startswith("ref: "):
+            return "HEAD", bytes.fromhex(head)
+
+        ref_path = head[len("ref: "):]
+        return ref_path, self._resolve_ref(ref_path)
+
+    def _resolve_ref(self, ref_path: str) -> Optional[bytes]:
+        """Reads a ref from its loose file or from packed-refs."""
+        try:
+            with open(os.path.join(self.repo.git_dir, ref_path), "r") as f:
+                return bytes.fromhex(f.read().strip())
+        except FileNotFoundError:
+            pass
+
+        try:
+            with open(os.path.join(self.repo.git_dir, "packed-refs"), "r") as f:
+                for line in f:
+                    if line.rstrip("\n").endswith(f" {ref_path}"):
+                        return bytes.fromhex(line[:40])
+        except FileNotFoundError:
+            pass
+        return None
+
+    def _commit_tree(self, commit_sha: bytes) -> bytes:
+        data = self._read(commit_sha)
+        # The first header line of a commit is always "tree <hexsha>".
+        return bytes.fromhex(data[5:45].decode("ascii"))
+
+    def _write_entry(self, filepath: str) -> Optional[Entry]:
+        """Stores the blob for filepath and returns its tree entry."""
+        try:
+            st = os.lstat(filepath)
+        except FileNotFoundError:
+            return None
+
+        if stat.S_ISLNK(st.st_mode):
+            return self._store(b"blob", os.fsencode(os.readlink(filepath))), MODE_SYMLINK
+        if not stat.S_ISREG(st.st_mode):
+            return None
+
+        if self.large_files.stores_pointer(filepath, st.st_size):
+            data = FilePointer.from_file(filepath).to_bytes()
+        else:
+            with open(filepath, "rb") as f:
+                data = f.read()
+        mode = MODE_EXECUTABLE if st.st_mode & stat.S_IXUSR else MODE_FILE
+        return self._store(b"blob", data), mode
+
+    def _patch_tree(
+        self,
+        tree_sha: Optional[bytes],
+        changes: ChangeTree,
+        prefix: str,
+        changed: List[str],
+    ) -> Optional[bytes]:
+        """Writes a copy of tree_sha with changes applied.
+
+        Only the trees along the changed paths are read and rewritten; all other
+        entries are carried over by sha. Returns None if the tree ends up empty.
+        """
+        entries: Dict[str, Entry] = {}
+        if tree_sha is not None:
+            data = self._read(tree_sha)
+            for binsha, mode, name in tree_entries_from_data(data):
+                entries[name] = (binsha, mode)
+
+        for name, change in changes.items():
+            path = f"{prefix}{name}"
+            current = entries.get(name)
+            if isinstance(change, dict):
+                subtree = current[0] if current and current[1] == MODE_TREE else None
+                new_subtree = self._patch_tree(subtree, change, f"{path}/", changed)
+                if new_subtree is None:
+                    entries.pop(name, None)
+                else:
+                    entries[name] = (new_subtree, MODE_TREE)
+            elif change != current:
+                if change is None:
+                    del entries[name]
+                else:
+                    entries[name] = change
+                changed.append(path)
+
+        if not entries:
+            return None
+
+        # Git sorts tree entries by name, comparing directories as "name/".
+        ordered = sorted(
+            entries.items(),
+            key=lambda item: item[0].encode() + (b"/" if item[1][1] == MODE_TREE else b""),
+        )
+        stream = io.BytesIO()
+        tree_to_stream([(binsha, mode, name) for name, (binsha, mode) in ordered], stream.write)
+        return self._store(b"tree", stream.getvalue())
+
+    def _write_commit(self, tree_sha: bytes, parent_sha: Optional[bytes], message: str) -> bytes:
+        lines = [b"tree " + tree_sha.hex().encode()]
+        if parent_sha:
+            lines.append(b"parent " + parent_sha.hex().encode())
+        stamp = self._signature()
+        lines.append(b"author " + stamp)
+        lines.append(b"committer " + stamp)
+        data = b"\n".join(lines) + b"\n\n" + message.encode("utf-8") + b"\n"
+        return self._store(b"commit", data)
+
+    def _signature(self) -> bytes:
+        """Returns the committer identity and current timestamp for a commit header."""
+        if self._identity is None:
+            actor = git.Actor.committer(self.repo.config_reader())
+            self._identity = f"{actor.name} <{actor.email}>".encode("utf-8")
+
+        now = int(time.time())
+        offset = time.localtime(now).tm_gmtoff // 60
+        sign = "+" if offset >= 0 else "-"
+        tz = f"{sign}{abs(offset) // 60:02d}{abs(offset) % 60:02d}"
+        return self._identity + f" {now} {tz}".encode("ascii")
+
+    def store_object(self, kind: bytes, data: bytes) -> str:
+        """Writes a prepared object (e.g. a rewritten commit) and returns its hexsha."""
+        return self._store(kind, data).hex()
+
+    def _store(self, kind: bytes, data: bytes) -> bytes:
+        """Writes a loose object unless it already exists and returns its sha."""
+        binsha = hashlib.sha1(kind + b" %d\0" % len(data) + data).digest()
+        if not self._loose_db.has_object(binsha):
+            self._loose_db.store(IStream(kind, len(data), io.BytesIO(data)))
+        return binsha
+
+    def _update_ref(self, ref_path: str, old_sha: Optional[bytes], new_sha: bytes):
+        """Moves ref_path from old_sha to new_sha using git's lock file protocol."""
+        path = os.path.join(self.repo.git_dir, ref_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock_path = f"{path}.lock"
+        fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            if self._resolve_ref(ref_path) != old_sha:
+                raise RefUpdateError(f"{ref_path} moved during snapshot")
+            os.write(fd, new_sha.hex().encode("ascii") + b"\n")
+            os.close(fd)
+            fd = -1
+            os.replace(lock_path, path)
+        finally:
+            if fd != -1:
+                os.close(fd)
+            if os.path.exists(lock_path):
+                os.remove(lock_path)
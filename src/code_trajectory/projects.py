@@ -0,0 +1,285 @@
+# SPDX-License-Identifier: MIT
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from watchdog.observers.api import BaseObserver
+
+from .large_files import LargeFilePolicy
+from .maintenance import MaintenanceScheduler
+from .recorder import Recorder
+from .scheduler import SnapshotScheduler
+from .trajectory import Trajectory
+from .watcher import Watcher, create_observer
+
+logger = logging.getLogger(__name__)
+
+# Projects beyond this many are stopped, least recently used first. None
+# tracks every project that was opened; a cap has to be asked for explicitly
+# since an evicted project's edits stop being recorded.
+DEFAULT_MAX_ACTIVE_PROJECTS: Optional[int] = None
+
+# Projects unused for this many seconds drop their caches and helper processes.
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+
+
+@dataclass
+class TrackedProject:
+    """A project tracked by the registry.
+
+    Attributes:
+        path: Absolute project root.
+        recorder: Records snapshots into the project's shadow repository.
+        watcher: Watches the project through the registry's shared observer.
+        trajectory: Renders the project's history.
+        last_used: Monotonic time of the last tool call for this project.
+        idle: True once idle resources have been released.
+        stopped: True once the project stopped being tracked.
+    """
+
+    path: str
+    recorder: Recorder
+    watcher: Watcher
+    trajectory: Trajectory
+    last_used: float = field(default_factory=time.monotonic)
+    idle: bool = False
+    stopped: bool = False
+    _users: int = 0
+    _users_changed: threading.Condition = field(default_factory=threading.Condition)
+
+    def acquire(self) -> bool:
+        """Marks the project as in use; returns False if it was stopped."""
+        with self._users_changed:
+            if self.stopped:
+                return False
+            self._users += 1
+            return True
+
+    def release(self):
+        with self._users_changed:
+            self._users -= 1
+            self._users_changed.notify_all()
+
+    def release_idle_resources(self):
+        """Drops caches and helper processes; watching continues."""
+        self.trajectory.cache.clear()
+        self.recorder.objects.close()
+        self.idle = True
+
+    def stop(self):
+        """Stops watching and closes the recorder once no caller uses the project."""
+        with self._users_changed:
+            self.stopped = True
+            while self._users:
+                self._users_changed.wait()
+        self.watcher.stop()
+        self.recorder.close()
+
+
+class ProjectRegistry:
+    """Tracks several projects in one process.
+
+    All projects using the same watch backend share one observer (one
+    dispatch thread) and all projects share one snapshot scheduler (one
+    timer and one snapshot worker thread), so the thread count does not grow
+    with the number of projects; one maintenance
+    thread keeps every shadow repository packed. Projects idle for
+    `idle_timeout` release their caches and cat-file processes. If
+    `max_active` is set, the least recently used project beyond it stops
+    being tracked until it is used again; callers holding it through `use`
+    finish first.
+
+    Attributes:
+        max_active: Maximum number of concurrently tracked projects, or None
+            for no limit.
+        idle_timeout: Seconds after which an unused project releases resources.
+        active: Path of the project used when a tool gets no project argument;
+            it is never evicted.
+        observer: The shared observer of the default "watchdog" backend.
+        scheduler: The shared snapshot scheduler.
+        maintenance: The shared shadow repository maintenance scheduler.
+    """
+
+    def __init__(
+        self,
+        max_active: Optional[int] = DEFAULT_MAX_ACTIVE_PROJECTS,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    ):
+        self.max_active = max_active
+        self.idle_timeout = idle_timeout
+        self.active: Optional[str] = None
+        self._observers: dict[str, BaseObserver] = {}
+        self.scheduler = SnapshotScheduler()
+        self.maintenance = MaintenanceScheduler()
+        self._projects: dict[str, TrackedProject] = {}
+        # Evicted under the lock, stopped after it is released.
+        self._evicted: list[TrackedProject] = []
+        self._lock = threading.RLock()
+        self._started = False
+
+    @property
+    def observer(self) -> BaseObserver:
+        return self.observer_for("watchdog")
+
+    def observer_for(self, backend: str) -> BaseObserver:
+        """Returns the shared observer of a watch backend, creating it on first use."""
+        with self._lock:
+            observer = self._observers.get(backend)
+            if observer is None:
+                observer = self._observers[backend] = create_observer(backend)
+                if self._started:
+                    observer.start()
+            return observer
+
+    @property
+    def paths(self) -> list[str]:
+        with self._lock:
+            return list(self._projects)
+
+    @property
+    def projects(self) -> list[TrackedProject]:
+        """The tracked projects, without marking them as used."""
+        with self._lock:
+            return list(self._projects.values())
+
+    def get(self, path: str) -> Optional[TrackedProject]:
+        """Returns the tracked project at path, marking it as used."""
+        with self._lock:
+            project = self._projects.get(os.path.abspath(path))
+            if project is not None:
+                self._touch(project)
+        self._stop_evicted()
+        return project
+
+    @contextmanager
+    def use(self, path: str, **options) -> Iterator[TrackedProject]:
+        """Opens the project at path and keeps it from being stopped while in use.
+
+        Args:
+            path: The project root.
+            **options: Passed to `open`.
+        """
+        while True:
+            project = self.open(path, **options)
+            if project.acquire():
+                break
+            # Evicted between open and acquire; track it again.
+        try:
+            yield project
+        finally:
+            project.release()
+
+    def open(
+        self,
+        path: str,
+        snapshot_engine: str = "cli",
+        large_files: Optional[LargeFilePolicy] = None,
+        watch_backend: str = "watchdog",
+    ) -> TrackedProject:
+        """Returns the project at path, starting to track it if needed.
+
+        The snapshot engine, large file policy and watch backend only apply
+        when the project starts being tracked.
+        """
+        path = os.path.abspath(path)
+        project = self.get(path)
+        if project is not None:
+            return project
+        with self._lock:
+            project = self._projects.get(path)
+            if project is not None:
+                return project
+            if not os.path.isdir(path):
+                raise ValueError(f"Target path does not exist: {path}")
+
+            self._start()
+            observer = self.observer_for(watch_backend)
+            recorder = Recorder(path, snapshot_engine=snapshot_engine, large_files=large_files)
+            watcher = Watcher(path, recorder, observer=observer, scheduler=self.scheduler)
+            project = TrackedProject(path, recorder, watcher, Trajectory(recorder))
+            watcher.start()
+            self.maintenance.register(recorder)
+            self._projects[path] = project
+            logger.info(f"Tracking {path} ({len(self._projects)} projects)")
+            self._evict()
+        self._stop_evicted()
+
+        # Changes made while nothing watched the project are recorded once,
+        # outside the lock so other projects stay usable during the scan.
+        try:
+            recorder.catch_up()
+        except Exception as e:
+            logger.error(f"Catch-up scan of {path} failed: {e}")
+        return project
+
+    def close(self, path: str):
+        """Stops tracking the project at path."""
+        with self._lock:
+            project = self._projects.pop(os.path.abspath(path), None)
+        if project is not None:
+            self.maintenance.unregister(project.recorder)
+            project.stop()
+            logger.info(f"Stopped tracking {project.path}")
+
+    def close_all(self):
+        """Stops tracking every project and the shared threads."""
+        for path in self.paths:
+            self.close(path)
+        with self._lock:
+            if self._started:
+                for observer in self._observers.values():
+                    observer.stop()
+                    observer.join()
+                self.scheduler.stop()
+                self.maintenance.stop()
+                self._started = False
+            # Observers cannot be restarted.
+            self._observers.clear()
+
+    def _start(self):
+        if not self._started:
+            for observer in self._observers.values():
+                observer.start()
+            self.scheduler.start()
+            self.maintenance.start()
+            self._started = True
+
+    def _touch(self, project: TrackedProject):
+        project.last_used = time.monotonic()
+        project.idle = False
+        self._evict()
+
+    def _evict(self):
+        """Releases idle projects and stops the least recently used beyond max_active."""
+        now = time.monotonic()
+        for project in self._projects.values():
+            if not project.idle and now - project.last_used > self.idle_timeout:
+                logger.info(f"Releasing resources of idle project {project.path}")
+                project.release_idle_resources()
+
+        if self.max_active is None:
+            return
+        candidates = sorted(
+            (p for p in self._projects.values() if p.path != self.active),
+            key=lambda p: p.last_used,
+        )
+        while len(self._projects) > self.max_active and candidates:
+            project = candidates.pop(0)
+            del self._projects[project.path]
+            self.maintenance.unregister(project.recorder)
+            logger.warning(
+                f"Stopped tracking {project.path}: more than {self.max_active} projects "
+                "are open; its changes are no longer recorded until it is used again"
+            )
+            self._evicted.append(project)
+
+    def _stop_evicted(self):
+        """Stops evicted projects, waiting for their callers, outside the registry lock."""
+        with self._lock:
+            evicted, self._evicted = self._evicted, []
+        for project in evicted:
+            project.stop()
@@ -1,23 +1,133 @@
 # SPDX-License-Identifier: MIT
 import git
 from git.exc import GitCommandError
+from gitdb.exc import BadObject
 import datetime
 import logging
 import os
-from typing import Optional
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .cat_file import CatFilePool, PooledObjectDB
+from .catch_up import STAT_CACHE_FILE, StatCache, find_changes, iter_worktree
+from .git_log import (
+    CommitStats,
+    FileRevision,
+    iter_file_log,
+    iter_log,
+    iter_log_subjects,
+    iter_log_with_stats,
+)
+from .history_index import HistoryIndex
+from .ignore import IgnoreMatcher
+from .large_files import FilePointer, LargeFilePolicy
+from .maintenance import (
+    MAINTENANCE_STATE_FILE,
+    MaintenancePolicy,
+    MaintenanceState,
+    needs_maintenance,
+    run_git_maintenance,
+)
+from .metrics import METRICS
+from .object_writer import STALE_INDEX_MARKER, ObjectSnapshotWriter
+from .retention import (
+    RetentionPolicy,
+    plan_retention,
+    recent_count,
+    replace_parent,
+    rewrite_chain,
+    walk_bound,
+)
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of file names listed in a batched snapshot commit message.
+SNAPSHOT_MESSAGE_MAX_FILES = 5
+
+# "cli" records snapshots through `git add`/`git commit`; "objects" writes the
+# git objects in-process and resyncs the shadow index only when git needs it,
+# so a shadow repository can switch between engines.
+SNAPSHOT_ENGINES = ("cli", "objects")
+
+# Points at the latest consolidate commit, where the next squash starts.
+CONSOLIDATED_REF = "refs/trajectory/consolidated"
+# Retention grafts the full-resolution chain onto the compacted history.
+REPLACE_REF_PREFIX = "refs/replace/"
+
+# SQLite sidecar indexing the shadow history, inside the shadow repo directory.
+HISTORY_INDEX_FILE = "history.sqlite3"
+
+# Paths passed per git invocation, by total size, well below ARG_MAX (and
+# Windows' 32 KiB command line) so a catch-up of any size cannot hit E2BIG.
+ARGV_CHUNK_BYTES = 24 * 1024
+
+
+def _argv_chunks(args: List[str]) -> Iterator[List[str]]:
+    """Splits args into consecutive chunks of at most ARGV_CHUNK_BYTES combined."""
+    max_bytes = ARGV_CHUNK_BYTES
+    chunk: List[str] = []
+    size = 0
+    for arg in args:
+        length = len(os.fsencode(arg)) + 1
+        if chunk and size + length > max_bytes:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(arg)
+        size += length
+    if chunk:
+        yield chunk
+
 
 class Recorder:
-    def __init__(self, repo_path: str):
+    def __init__(
+        self,
+        repo_path: str,
+        snapshot_engine: str = "cli",
+        maintenance_policy: Optional[MaintenancePolicy] = None,
+        retention_policy: Optional[RetentionPolicy] = None,
+        large_files: Optional[LargeFilePolicy] = None,
+    ):
+        if snapshot_engine not in SNAPSHOT_ENGINES:
+            raise ValueError(f"Unknown snapshot engine: {snapshot_engine}")
+
         self.project_root = os.path.abspath(repo_path)
         self.shadow_repo_path = os.path.join(self.project_root, ".trajectory")
         self.current_intent: Optional[str] = None
-        self.current_intent: Optional[str] = None
+        self.snapshot_engine = snapshot_engine
+        self.large_files = large_files or LargeFilePolicy()
+        # Serialises writes to the shadow repository across threads.
+        self._lock = threading.RLock()
 
         self._ensure_gitignore()
         self._init_shadow_repo()
+        self._object_writer = ObjectSnapshotWriter(
+            self.repo, self.project_root, self.large_files
+        )
+        self.ignore_matcher = IgnoreMatcher(self.project_root, self.repo)
+        self.history = HistoryIndex(
+            self.repo, os.path.join(self.shadow_repo_path, HISTORY_INDEX_FILE)
+        )
+        self._listeners: List[Callable[[str], None]] = []
+        self.maintenance_policy = maintenance_policy or MaintenancePolicy()
+        self.retention_policy = retention_policy or RetentionPolicy()
+        self._maintenance_state = MaintenanceState(
+            os.path.join(self.repo.git_dir, MAINTENANCE_STATE_FILE)
+        )
+        # Monotonic time of the last history change, to find idle periods.
+        self.last_write = time.monotonic()
+
+    @property
+    def objects(self) -> CatFilePool:
+        """Long-lived cat-file processes serving object reads from any thread."""
+        return self.repo.odb.pool
+
+    def close(self):
+        """Stops helper processes and closes the history index."""
+        self.objects.close()
+        self.history.close()
 
     def _ensure_gitignore(self):
         """Ensures .trajectory is ignored in the main project."""
@@ -38,17 +148,231 @@ class Recorder:
         """Initializes the shadow repository."""
         if not os.path.exists(self.shadow_repo_path):
             os.makedirs(self.shadow_repo_path)
-            self.repo = git.Repo.init(self.shadow_repo_path)
-            # Configure work tree to be the project root
-            # Configure work tree to be the project root
-            self.repo.git.config("core.worktree", self.project_root)
-            self.repo.git.config("advice.addIgnoredFile", "false")
+            self.repo = git.Repo.init(self.shadow_repo_path, odbt=PooledObjectDB)
             logger.info(f"Initialized shadow repo at {self.shadow_repo_path}")
         else:
-            self.repo = git.Repo(self.shadow_repo_path)
-            # Ensure worktree is set correctly (in case moved)
-            self.repo.git.config("core.worktree", self.project_root)
-            self.repo.git.config("advice.addIgnoredFile", "false")
+            self.repo = git.Repo(self.shadow_repo_path, odbt=PooledObjectDB)
+        # Configure work tree to be the project root (again, in case it moved).
+        self._ensure_config("core", "worktree", self.project_root)
+        self._ensure_config("advice", "addIgnoredFile", "false")
+
+    def _ensure_config(self, section: str, option: str, value: str):
+        """Writes a repository config value unless it is already set.
+
+        The config file is read in-process, so reopening an existing shadow
+        repository spawns no git process.
+        """
+        reader = self.repo.config_reader("repository")
+        if reader.get(section, option, fallback=None) == value:
+            return
+        self.repo.git.config(f"{section}.{option}", value)
+
+    def add_listener(self, callback: Callable[[str], None]):
+        """Registers callback to be called after the shadow history changes.
+
+        The callback receives "snapshot" when a commit was appended to HEAD,
+        "consolidate" when recent snapshots were squashed and "rewrite" when
+        retention rewrote older history.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, event: str):
+        self.last_write = time.monotonic()
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.warning(f"History listener failed on {event}: {e}")
+
+    def maintenance_due(self) -> bool:
+        """Returns True once no snapshot was written for the policy's idle time."""
+        return time.monotonic() - self.last_write >= self.maintenance_policy.idle_seconds
+
+    @METRICS.timed("maintenance_seconds")
+    def run_maintenance(self, force: bool = False) -> bool:
+        """Downsamples, repacks, prunes and indexes the shadow repository if due.
+
+        Runs without the write lock apart from the history rewrite: git's ref
+        and object locking and the prune grace period keep concurrent
+        snapshots safe.
+
+        Args:
+            force: Run now, with a full repack, regardless of the policy.
+
+        Returns:
+            True if a maintenance pass ran.
+        """
+        state = self._maintenance_state
+        if not force and not needs_maintenance(self.repo, self.maintenance_policy, state):
+            return False
+        try:
+            self.apply_retention()
+        except Exception as e:
+            logger.error(f"Retention failed: {e}")
+        ran = run_git_maintenance(self.repo, self.maintenance_policy, state, full_repack=force)
+        if ran:
+            # Let cat-file processes drop handles on the removed packs.
+            self.objects.close()
+        return ran
+
+    def apply_retention(self, now: Optional[float] = None) -> int:
+        """Downsamples old [AUTO-TRJ] snapshots following the retention policy.
+
+        Only the history younger than the previous run's hourly window is
+        walked, so the cost stays flat as history grows. The older history
+        is rewritten into a compacted chain, and the oldest commit of the
+        full-resolution window is grafted onto it with a replace ref, so
+        HEAD and every recent commit keep their shas. Once the policy's
+        reclaim interval has passed since the first graft, the grafted
+        chain is rewritten instead so the dropped snapshots can be pruned.
+
+        Args:
+            now: The time snapshot ages are measured from (defaults to now).
+
+        Returns:
+            The number of snapshots dropped.
+        """
+        now = time.time() if now is None else now
+        policy = self.retention_policy
+        state = self._maintenance_state
+        with self._write_lock():
+            head = self.history.head_sha()
+            if head is None:
+                return 0
+
+            grafts = self._retention_grafts()
+            reclaim = bool(grafts) and policy.reclaim_interval is not None and (
+                now - state.grafted_since >= policy.reclaim_interval
+            )
+            bound = walk_bound(state.last_retention, policy)
+            # A reclaiming run walks back to the oldest graft.
+            pending = set(grafts) if reclaim else set()
+            entries: List[CommitStats] = []
+            for entry in iter_log(self.repo, "--first-parent", head):
+                if bound is not None and entry.timestamp < bound and not pending:
+                    break
+                pending.discard(entry.sha)
+                entries.append(entry)
+
+            dropped = plan_retention(entries, now, policy)
+            if len(dropped) < policy.min_dropped and not reclaim:
+                return 0
+
+            recent = 0 if reclaim else recent_count(entries, now, policy)
+            rewritten = rewrite_chain(
+                entries[recent:],
+                dropped,
+                lambda sha: self.objects.read(sha)[2],
+                lambda data: self._object_writer.store_object(b"commit", data),
+                grafted=grafts if reclaim else (),
+            )
+            stale = set(grafts) if reclaim else set(grafts) & (dropped | set(rewritten))
+            remaining = set(grafts) - stale
+            if recent == 0:
+                # The newest commit is never dropped.
+                if head in rewritten:
+                    self.repo.git.update_ref("-m", "retention", "HEAD", rewritten[head], head)
+            elif recent < len(entries) and entries[recent].sha in rewritten:
+                # The first older commit is the newest of its bucket, so it is kept.
+                root = entries[recent - 1].sha
+                base = rewritten[entries[recent].sha]
+                graft = self._object_writer.store_object(
+                    b"commit", replace_parent(self.objects.read(root)[2], base)
+                )
+                self.repo.git.update_ref(f"{REPLACE_REF_PREFIX}{root}", graft)
+                self.history.reparent(root, base)
+                stale.discard(root)
+                remaining.add(root)
+            for sha in stale:
+                self.repo.git.update_ref("-d", f"{REPLACE_REF_PREFIX}{sha}")
+            if not remaining:
+                state.grafted_since = 0.0
+            elif not state.grafted_since:
+                state.grafted_since = now
+            try:
+                consolidated = self.repo.git.rev_parse("--verify", "-q", CONSOLIDATED_REF)
+                if consolidated in rewritten:
+                    self.repo.git.update_ref(CONSOLIDATED_REF, rewritten[consolidated])
+            except GitCommandError:
+                pass
+            self.history.forget([*dropped, *rewritten])
+            # git reads replace refs once per process.
+            self.objects.close()
+            self.repo.git.clear_cache()
+
+            state.last_retention = now
+            try:
+                state.save()
+            except OSError as e:
+                logger.warning(f"Failed to save maintenance state: {e}")
+        self._notify("rewrite")
+        logger.info(f"Retention dropped {len(dropped)} snapshots, rewrote {len(rewritten)}")
+        return len(dropped)
+
+    def _retention_grafts(self) -> List[str]:
+        """Returns the shas of the commits grafted by retention."""
+        output = self.repo.git.for_each_ref("--format=%(refname)", REPLACE_REF_PREFIX)
+        return [line[len(REPLACE_REF_PREFIX):] for line in output.splitlines() if line]
+
+    @METRICS.timed("catch_up_seconds")
+    def catch_up(self) -> Optional[str]:
+        """Records the changes made while the project was not being watched.
+
+        Compares the worktree with the shadow HEAD, hashing only files whose
+        stat changed since the previous scan, and records every difference
+        as one snapshot. Does nothing before the first snapshot, so starting
+        to track a project does not sweep its whole tree into history.
+
+        Returns:
+            The commit message of the catch-up snapshot, or None if nothing changed.
+        """
+        if self.history.head_sha() is None:
+            return None
+
+        head = {}
+        output = self.repo.git.ls_tree("-r", "-z", "--full-tree", "HEAD")
+        for item in output.split("\0"):
+            if not item:
+                continue
+            info, rel_path = item.split("\t", 1)
+            mode, kind, blob = info.split()
+            if kind == "blob":
+                head[rel_path] = (int(mode, 8), blob)
+
+        cache = StatCache(os.path.join(self.repo.git_dir, STAT_CACHE_FILE))
+        try:
+            result = find_changes(
+                self.project_root,
+                head,
+                cache.load(),
+                cache.exists,
+                self.ignore_matcher,
+                self.large_files,
+            )
+            METRICS.increment("catch_up_files_hashed_total", result.hashed)
+            logger.info(
+                f"Catch-up scan of {len(result.entries)} files hashed {result.hashed}, "
+                f"found {len(result.changed)} changed"
+            )
+            message = None
+            entries = result.entries
+            if result.changed:
+                message = self.create_batch_snapshot(
+                    [os.path.join(self.project_root, path) for path in result.changed]
+                )
+                if message is None:
+                    # Without their new stat in the cache, the changed files
+                    # are found again (and recorded) by the next scan.
+                    logger.warning(
+                        f"Catch-up snapshot of {len(result.changed)} files was not recorded; "
+                        "it is retried on the next scan"
+                    )
+                    failed = set(result.changed)
+                    entries = {p: e for p, e in entries.items() if p not in failed}
+            cache.replace(entries)
+            return message
+        finally:
+            cache.close()
 
     def set_intent(self, intent: str):
         """Sets the current coding intent.
@@ -68,37 +392,242 @@ class Recorder:
         Args:
             filepath: Absolute path to the modified file.
         """
+        self.create_batch_snapshot([filepath])
+
+    @METRICS.timed("snapshot_seconds")
+    def create_batch_snapshot(self, filepaths: List[str]) -> Optional[str]:
+        """Creates a single snapshot commit covering several modified files.
+
+        The cost is a constant number of git invocations (status, add, commit)
+        regardless of how many files are in the batch.
+
+        Args:
+            filepaths: Absolute paths to the modified files.
+
+        Returns:
+            The commit message of the created snapshot, or None if nothing changed.
+        """
+        if not filepaths:
+            return None
+
+        with self._write_lock():
+            result = self._record_batch(filepaths)
+        METRICS.increment(
+            "snapshots_total",
+            engine=self.snapshot_engine,
+            result="written" if result is not None else "unchanged",
+        )
+        return result
+
+    def _record_batch(self, filepaths: List[str]) -> Optional[str]:
+        """Records filepaths with the configured engine; the write lock must be held."""
         try:
-            # Check if there are changes to commit.
-            if not self.repo.is_dirty(path=filepath, untracked_files=True):
-                logger.info(f"No changes detected in {filepath}")
-                return
+            filepaths = self._expand_directories(filepaths)
+            if self.snapshot_engine == "objects":
+                return self._create_object_snapshot(filepaths)
 
-            # Use git command directly to handle worktree correctly.
-            self.repo.git.add(filepath)
+            self.sync_index()
 
-            timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+            # Files over the size limits are staged as pointers, never read whole.
+            regular, large = self._split_large_files(filepaths)
 
-            # Check for active intent (Persistent).
-            intent_str = ""
-            if self.current_intent:
-                intent_str = f" - {self.current_intent}"
+            # Check which of the files actually have changes to commit.
+            changed = self._changed_paths(regular) if regular else []
+            # Use git command directly to handle worktree correctly.
+            for chunk in _argv_chunks(changed):
+                self.repo.git.add("--", *chunk)
+            changed += self._stage_pointers(large)
+            if not changed:
+                logger.info(f"No changes detected in {', '.join(filepaths)}")
+                return None
 
-            commit_message = (
-                f"[AUTO-TRJ] {timestamp}{intent_str} - Snapshot of {filepath}"
-            )
+            commit_message = self._snapshot_message(changed)
 
             # Commit.
+            parent = self.history.head_sha()
             self.repo.git.commit("-m", commit_message)
-            logger.info(f"Created snapshot for {filepath}: {commit_message}")
+            self._record_in_history(commit_message, parent, changed)
+            self._notify("snapshot")
+            logger.info(f"Created snapshot for {len(changed)} file(s): {commit_message}")
+            return commit_message
 
         except GitCommandError as e:
             if "index.lock" in str(e):
-                logger.warning(f"Git lock contention for {filepath}: {e}")
+                METRICS.increment("git_lock_contention_total")
+                logger.warning(f"Git lock contention for {filepaths}: {e}")
+            else:
+                logger.error(f"Git error during snapshot of {filepaths}: {e}")
+        except Exception as e:
+            logger.error(f"Unexpected error during snapshot of {filepaths}: {e}")
+        return None
+
+    def _expand_directories(self, filepaths: List[str]) -> List[str]:
+        """Replaces existing directories with the files below them that are not ignored.
+
+        A directory that no longer exists is kept as is: both engines then
+        remove every recorded file below it.
+        """
+        expanded: Dict[str, None] = {}
+        for filepath in filepaths:
+            if os.path.isdir(filepath) and not os.path.islink(filepath):
+                for rel_path, _ in iter_worktree(filepath, self.ignore_matcher):
+                    expanded[os.path.join(filepath, rel_path)] = None
             else:
-                logger.error(f"Git error during snapshot of {filepath}: {e}")
+                expanded[filepath] = None
+        return list(expanded)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """Holds the write lock, counting how often another thread held it."""
+        if not self._lock.acquire(blocking=False):
+            METRICS.increment("recorder_lock_contention_total")
+            with METRICS.timer("recorder_lock_wait_seconds"):
+                self._lock.acquire()
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    def sync_index(self):
+        """Resets the shadow index to HEAD if the object engine left it stale."""
+        marker = os.path.join(self.repo.git_dir, STALE_INDEX_MARKER)
+        if not os.path.exists(marker):
+            return
+        with self._lock:
+            if self.repo.head.is_valid():
+                self.repo.git.read_tree("HEAD")
+            else:
+                self.repo.git.read_tree("--empty")
+            os.remove(marker)
+            logger.info("Resynced shadow index with HEAD")
+
+    def _create_object_snapshot(self, filepaths: List[str]) -> Optional[str]:
+        """Records filepaths through the in-process object writer."""
+        messages: List[str] = []
+        recorded: List[str] = []
+
+        def build_message(changed: List[str]) -> str:
+            recorded.extend(changed)
+            messages.append(self._snapshot_message(changed))
+            return messages[0]
+
+        parent = self.history.head_sha()
+        if self._object_writer.write(filepaths, build_message) is None:
+            logger.info(f"No changes detected in {', '.join(filepaths)}")
+            return None
+
+        self._record_in_history(messages[0], parent, recorded)
+        self._notify("snapshot")
+        logger.info(f"Created snapshot: {messages[0]}")
+        return messages[0]
+
+    def _record_in_history(
+        self, message: str, parent: Optional[str], changed_paths: Optional[List[str]]
+    ):
+        """Adds the commit just created at HEAD to the history index."""
+        try:
+            paths = None
+            if changed_paths is not None:
+                paths = [
+                    os.path.relpath(path, self.project_root).replace(os.sep, "/")
+                    for path in changed_paths
+                ]
+            self.history.record_commit(
+                self.repo.head.commit.hexsha, parent, int(time.time()), message, paths
+            )
         except Exception as e:
-            logger.error(f"Unexpected error during snapshot of {filepath}: {e}")
+            # The index is rebuilt from git on the next query, so this is not fatal.
+            logger.warning(f"Failed to update history index: {e}")
+
+    def _snapshot_message(self, filepaths: List[str]) -> str:
+        """Builds the [AUTO-TRJ] commit message for a snapshot of filepaths."""
+        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+
+        # Check for active intent (Persistent).
+        intent_str = ""
+        if self.current_intent:
+            intent_str = f" - {self.current_intent}"
+
+        return f"[AUTO-TRJ] {timestamp}{intent_str} - {self._describe_batch(filepaths)}"
+
+    def _changed_paths(self, filepaths: List[str]) -> List[str]:
+        """Returns the subset of filepaths that differ from the shadow HEAD.
+
+        Uses one `git status --porcelain` call per ARGV_CHUNK_BYTES of paths
+        (a single call for any ordinary batch).
+        """
+        changed = []
+        for chunk in _argv_chunks(filepaths):
+            output = self.repo.git.status(
+                "--porcelain", "-z", "--untracked-files=all", "--", *chunk
+            )
+            entries = iter(output.split("\0"))
+            for entry in entries:
+                if len(entry) < 4:
+                    continue
+                status, rel_path = entry[:2], entry[3:]
+                if "R" in status or "C" in status:
+                    # Renames and copies carry the original path as an extra entry.
+                    next(entries, None)
+                changed.append(os.path.normpath(os.path.join(self.project_root, rel_path)))
+        return changed
+
+    def _split_large_files(self, filepaths: List[str]) -> Tuple[List[str], List[str]]:
+        """Splits filepaths into regular files and files stored as pointers."""
+        regular: List[str] = []
+        large: List[str] = []
+        for filepath in filepaths:
+            try:
+                st = os.lstat(filepath)
+            except OSError:
+                regular.append(filepath)
+                continue
+            if stat.S_ISREG(st.st_mode) and self.large_files.stores_pointer(filepath, st.st_size):
+                large.append(filepath)
+            else:
+                regular.append(filepath)
+        return regular, large
+
+    def _stage_pointers(self, filepaths: List[str]) -> List[str]:
+        """Stages a pointer blob for each large file whose pointer changed.
+
+        Returns:
+            The paths that were staged.
+        """
+        # --cacheinfo values; paths are relative to the worktree root.
+        cacheinfo: List[str] = []
+        changed: List[str] = []
+        for filepath in filepaths:
+            rel_path = os.path.relpath(filepath, self.project_root).replace(os.sep, "/")
+            try:
+                pointer = FilePointer.from_file(filepath)
+                mode = "100755" if os.stat(filepath).st_mode & stat.S_IXUSR else "100644"
+            except OSError as e:
+                logger.warning(f"Failed to read {filepath}: {e}")
+                continue
+            blob = self._object_writer.store_object(b"blob", pointer.to_bytes())
+            try:
+                if self.objects.info(f"HEAD:{rel_path}")[0] == blob:
+                    continue
+            except BadObject:
+                pass
+            cacheinfo.append(f"{mode},{blob},{rel_path}")
+            changed.append(filepath)
+        for chunk in _argv_chunks(cacheinfo):
+            self.repo.git.update_index("--add", *[a for v in chunk for a in ("--cacheinfo", v)])
+        return changed
+
+    def _describe_batch(self, filepaths: List[str]) -> str:
+        """Builds the human-readable part of a snapshot commit message."""
+        if len(filepaths) == 1:
+            return f"Snapshot of {filepaths[0]}"
+
+        names = [os.path.relpath(path, self.project_root) for path in filepaths]
+        listed = ", ".join(names[:SNAPSHOT_MESSAGE_MAX_FILES])
+        remaining = len(names) - SNAPSHOT_MESSAGE_MAX_FILES
+        if remaining > 0:
+            listed += f" and {remaining} more"
+        return f"Snapshot of {len(names)} files: {listed}"
 
     def get_history(self, filepath: str, max_count: int = 5):
         """Retrieves the history of a file.
@@ -110,6 +639,39 @@ class Recorder:
         Returns:
             A list of Commit objects.
         """
+        abs_path = self._history_path(filepath)
+        if abs_path is None:
+            return []
+
+        # Use absolute path for git to avoid CWD issues with gitpython.
+        commits = list(self.repo.iter_commits(paths=abs_path, max_count=max_count))
+        return commits
+
+    def iter_file_history(
+        self,
+        filepath: str,
+        max_count: Optional[int] = None,
+        rev_range: Optional[str] = None,
+        patches: bool = True,
+    ) -> Iterator[FileRevision]:
+        """Streams the history of a file with its patches, newest first.
+
+        Args:
+            filepath: Path to the file (relative or absolute).
+            max_count: Maximum number of commits to retrieve.
+            rev_range: Revisions to walk (e.g. "abc123..HEAD"), HEAD by default.
+            patches: If False, skip computing diffs (patches are empty).
+
+        Yields:
+            A FileRevision per commit, read from a single `git log -p` process.
+        """
+        abs_path = self._history_path(filepath)
+        if abs_path is None or (rev_range is None and not self.repo.head.is_valid()):
+            return
+        yield from iter_file_log(self.repo, abs_path, max_count, rev_range or "HEAD", patches)
+
+    def _history_path(self, filepath: str) -> Optional[str]:
+        """Returns filepath as an absolute path, or None if it is outside the project."""
         # Normalize path to be relative to project root
         if not os.path.isabs(filepath):
             abs_path = os.path.join(self.project_root, filepath)
@@ -121,65 +683,128 @@ class Recorder:
             logger.error(
                 f"Path {filepath} is not within project root {self.project_root}"
             )
-            return []
+            return None
+        return abs_path
 
-        # Use absolute path for git to avoid CWD issues with gitpython.
-        commits = list(self.repo.iter_commits(paths=abs_path, max_count=max_count))
-        return commits
+    def iter_history_with_stats(
+        self,
+        rev_range: Optional[str] = None,
+        paths: Optional[List[str]] = None,
+        max_count: Optional[int] = None,
+    ) -> Iterator[CommitStats]:
+        """Streams commits with their per-file line counts, newest first.
+
+        All commits come from a single `git log --numstat` process instead of
+        one `commit.stats` diff per commit.
+
+        Args:
+            rev_range: Revisions to walk (e.g. "abc123..HEAD"), HEAD by default.
+            paths: Restrict the walk to these paths (relative or absolute).
+            max_count: Maximum number of commits to return.
 
+        Yields:
+            A CommitStats entry per commit.
+        """
+        if rev_range is None and not self.repo.head.is_valid():
+            return
+        args = [rev_range or "HEAD"]
+        if max_count is not None:
+            args.insert(0, f"--max-count={max_count}")
+        if paths:
+            # Absolute paths avoid CWD issues, as in get_history.
+            args.append("--")
+            args.extend(os.path.join(self.project_root, path) for path in paths)
+        yield from iter_log_with_stats(self.repo, *args)
+
+    @METRICS.timed("consolidate_seconds")
     def consolidate(self, intent: str):
         """Squashes recent [AUTO-TRJ] snapshots and creates a consolidate commit.
 
+        The squash base is read from CONSOLIDATED_REF, so only the snapshots
+        since the last consolidation are walked. The consolidate commit reuses
+        the tree of the latest snapshot; the worktree is not rescanned, so
+        changes that were never snapshotted are not included.
+
         Args:
             intent: Description of the consolidation.
 
         Returns:
             A status message indicating the result of the consolidate operation.
         """
-        try:
-            commits = list(self.repo.iter_commits())
-            if not commits:
-                return "No commits to consolidate."
-
-            # Find how many recent commits are AUTO-TRJ
-            auto_trj_count = 0
-            for commit in commits:
-                message = str(commit.message)
-                if message.startswith("[AUTO-TRJ]"):
-                    auto_trj_count += 1
-                else:
-                    break
+        with self._write_lock():
+            try:
+                head = self.history.head_sha()
+                if head is None:
+                    return "No commits to consolidate."
+
+                base, squashed = self._find_squash_base(head)
+                if not squashed:
+                    return "No changes to consolidate."
+
+                tree = self.repo.git.rev_parse(f"{head}^{{tree}}")
+                if base is not None and tree == self.repo.git.rev_parse(f"{base}^{{tree}}"):
+                    # The snapshots cancel out; drop them.
+                    self.repo.git.update_ref("HEAD", base, head)
+                    self.repo.git.update_ref(CONSOLIDATED_REF, base)
+                    self.history.forget(squashed)
+                    self._notify("consolidate")
+                    return "No changes to consolidate."
+
+                timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+                commit_message = f"[CONSOLIDATE] {timestamp} - {intent}"
+
+                parent_args = ["-p", base] if base is not None else []
+                sha = self.repo.git.commit_tree(tree, *parent_args, "-m", commit_message)
+                # Fails if a snapshot moved HEAD in the meantime.
+                self.repo.git.update_ref("HEAD", sha, head)
+                self.repo.git.update_ref(CONSOLIDATED_REF, sha)
+                self._record_in_history(commit_message, base, changed_paths=None)
+                self.history.forget(squashed)
+                self._notify("consolidate")
+
+                logger.info(f"Created consolidation: {commit_message}")
+                return (
+                    f"Successfully consolidated: '{intent}' (Squashed {len(squashed)} snapshots).\n"
+                    "NOTE: This consolidation is saved in the shadow repository (.trajectory) ONLY.\n"
+                    "You must still commit your changes to the main project git repository separately."
+                )
+
+            except Exception as e:
+                logger.error(f"Error creating consolidation: {e}")
+                return f"Error creating consolidation: {e}"
+
+    def _find_squash_base(self, head: str) -> Tuple[Optional[str], List[str]]:
+        """Finds the run of [AUTO-TRJ] snapshots leading to head.
 
-            if auto_trj_count > 0:
-                if auto_trj_count == len(commits):
-                    # We are squashing everything, including the root commit.
-                    # Use update-ref to clear HEAD but keep index/working tree.
-                    self.repo.git.update_ref("-d", "HEAD")
-                    logger.info(f"Squashed all {auto_trj_count} commits (root reset).")
-                else:
-                    # Soft reset to HEAD~N.
-                    self.repo.git.reset("--soft", f"HEAD~{auto_trj_count}")
-                    logger.info(f"Squashed {auto_trj_count} trajectory snapshots.")
-
-            # Check if there are changes to commit.
-            if not self.repo.is_dirty() and not self.repo.index.diff("HEAD"):
-                return "No changes to consolidate."
-
-            timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-            commit_message = f"[CONSOLIDATE] {timestamp} - {intent}"
-
-            # Add all files using -A to handle deletions and new files.
-            # Also rely on advice.addIgnoredFile=false to avoid errors with .trajectory.
-            self.repo.git.add("-A")
-            self.repo.git.commit("-m", commit_message)
-
-            logger.info(f"Created consolidation: {commit_message}")
-            return (
-                f"Successfully consolidated: '{intent}' (Squashed {auto_trj_count} snapshots).\n"
-                "NOTE: This consolidation is saved in the shadow repository (.trajectory) ONLY.\n"
-                "You must still commit your changes to the main project git repository separately."
-            )
-
-        except Exception as e:
-            logger.error(f"Error creating consolidation: {e}")
-            return f"Error creating consolidation: {e}"
+        Returns:
+            The commit the run starts from (None if it reaches the root commit)
+            and the snapshot shas, newest first.
+        """
+        try:
+            base: Optional[str] = self.repo.git.rev_parse("--verify", "-q", CONSOLIDATED_REF)
+        except GitCommandError:
+            base = None
+
+        if base is not None and self._is_ancestor(base, head):
+            entries = list(iter_log_subjects(self.repo, f"{base}..{head}"))
+            if all(subject.startswith("[AUTO-TRJ]") for _, subject in entries):
+                return base, [sha for sha, _ in entries]
+            logger.info(f"{CONSOLIDATED_REF} is not the last consolidation, walking history")
+
+        # No usable ref (older shadow repo, or history rewritten): walk back
+        # until the first commit that is not a snapshot and stop there.
+        squashed: List[str] = []
+        base = None
+        for sha, subject in iter_log_subjects(self.repo, head):
+            if not subject.startswith("[AUTO-TRJ]"):
+                base = sha
+                break
+            squashed.append(sha)
+        return base, squashed
+
+    def _is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        try:
+            self.repo.git.merge_base("--is-ancestor", ancestor, descendant)
+            return True
+        except GitCommandError:
+            return False
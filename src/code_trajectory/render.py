@@ -0,0 +1,149 @@
+# SPDX-License-Identifier: MIT
+import fnmatch
+import os
+from typing import Optional
+
+from .large_files import describe_pointer_patch
+
+# Rough size of a token for the text we emit (code and diffs).
+BYTES_PER_TOKEN = 4
+
+# Files whose diffs are noise for a reader: lockfiles, minified and generated code.
+GENERATED_FILE_PATTERNS = (
+    "*.lock",
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "pnpm-lock.yaml",
+    "go.sum",
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*_pb2.py",
+    "*.pb.go",
+)
+
+
+class OutputBudget:
+    """Tracks how much output a tool may still produce.
+
+    Attributes:
+        max_bytes: Total budget in UTF-8 bytes, or None for no limit.
+        used: Bytes spent so far.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    @classmethod
+    def from_limits(
+        cls, max_tokens: Optional[int] = None, max_bytes: Optional[int] = None
+    ) -> "OutputBudget":
+        """Builds a budget from a token and/or byte limit, whichever is smaller."""
+        limits = []
+        if max_bytes is not None:
+            limits.append(max_bytes)
+        if max_tokens is not None:
+            limits.append(max_tokens * BYTES_PER_TOKEN)
+        return cls(min(limits) if limits else None)
+
+    @property
+    def remaining(self) -> float:
+        if self.max_bytes is None:
+            return float("inf")
+        return max(0, self.max_bytes - self.used)
+
+    @property
+    def limited(self) -> bool:
+        return self.max_bytes is not None
+
+    def take(self, size: int) -> bool:
+        """Spends size bytes if they fit in the remaining budget."""
+        if size > self.remaining:
+            return False
+        self.used += size
+        return True
+
+    def reserve(self, size: int):
+        """Spends size bytes unconditionally, e.g. for a header or a trailing note."""
+        self.used += size
+
+    def share(self, parts_left: int) -> float:
+        """Returns an even share of the remaining budget for one of parts_left parts."""
+        return self.remaining / max(1, parts_left)
+
+
+def is_generated_file(path: str) -> bool:
+    """Returns True for lockfiles and generated files whose diffs are elided."""
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(name, pattern) for pattern in GENERATED_FILE_PATTERNS)
+
+
+def patch_stats(patch: str) -> tuple[int, int, int]:
+    """Counts added lines, removed lines and hunks in a patch."""
+    added = removed = hunks = 0
+    for line in patch.splitlines():
+        if line.startswith("@@"):
+            hunks += 1
+        elif line.startswith("+"):
+            added += 1
+        elif line.startswith("-"):
+            removed += 1
+    return added, removed, hunks
+
+
+def render_patch(patch: str, limit: float, path: str = "") -> str:
+    """Fits a patch into limit bytes.
+
+    Binary and generated files are reduced to a stat line and large files
+    stored as pointers to a stub. Otherwise hunks are
+    kept in order while they fit; the rest are collapsed to their header with
+    a line count, and if even that does not fit the whole patch becomes a
+    single stat line.
+
+    Args:
+        patch: Diff hunks without the diff headers.
+        limit: Bytes available for the rendered patch.
+        path: The file the patch belongs to, used to detect generated files.
+    """
+    if patch.startswith("Binary files"):
+        return "[Binary file changed]"
+    stub = describe_pointer_patch(patch)
+    if stub is not None:
+        return stub
+    if path and is_generated_file(path):
+        added, removed, _ = patch_stats(patch)
+        return f"[Generated file: +{added} -{removed} lines, diff elided]"
+    if text_size(patch) <= limit:
+        return patch
+
+    out: list[str] = []
+    used = 0
+    for hunk in _split_hunks(patch):
+        text = hunk
+        if used + text_size(text) + 1 > limit:
+            added, removed, _ = patch_stats(hunk)
+            header = hunk.split("\n", 1)[0]
+            text = f"{header} [collapsed: +{added} -{removed} lines]"
+        out.append(text)
+        used += text_size(text) + 1
+
+    if used <= limit:
+        return "\n".join(out)
+    added, removed, hunks = patch_stats(patch)
+    return f"[Diff collapsed: {hunks} hunks, +{added} -{removed} lines]"
+
+
+def _split_hunks(patch: str) -> list[str]:
+    hunks: list[list[str]] = []
+    for line in patch.split("\n"):
+        if line.startswith("@@") or not hunks:
+            hunks.append([])
+        hunks[-1].append(line)
+    return ["\n".join(hunk) for hunk in hunks]
+
+
+def text_size(text: str) -> int:
+    """Returns the UTF-8 size of text."""
+    # ASCII is the common case and needs no encoding pass.
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
@@ -0,0 +1,145 @@
+# SPDX-License-Identifier: MIT
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Callable, Collection, Dict, Hashable, List, Optional, Set
+
+from .git_log import CommitStats
+from .history_index import commit_kind
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionPolicy:
+    """How long snapshots keep their full granularity.
+
+    Only [AUTO-TRJ] snapshots are downsampled; consolidations and other
+    commits are always kept and split snapshot runs around them.
+
+    Attributes:
+        full_resolution: Snapshots younger than this (seconds) are all kept.
+        hourly_until: Older snapshots up to this age keep one per hour; older
+            ones keep one per day. The kept snapshot is the last of its bucket,
+            so its tree is the state at the end of that hour or day.
+        min_dropped: Rewrite history only once at least this many snapshots
+            can be dropped.
+        reclaim_interval: The full-resolution chain keeps its shas: its
+            oldest commit is grafted onto the compacted history with a
+            replace ref, which keeps the dropped snapshots reachable (and
+            disables git's commit-graph). This long after the first graft,
+            a run rewrites the chain onto its graft instead, so the dropped
+            snapshots can be pruned. None keeps the grafts.
+    """
+
+    full_resolution: float = 24 * 3600.0
+    hourly_until: float = 7 * 24 * 3600.0
+    min_dropped: int = 20
+    reclaim_interval: Optional[float] = 7 * 24 * 3600.0
+
+
+def bucket_key(entry: CommitStats, now: float, policy: RetentionPolicy) -> Optional[Hashable]:
+    """Returns the downsampling bucket of a commit, or None if it is always kept."""
+    if commit_kind(entry.message) != "AUTO-TRJ":
+        return None
+    age = now - entry.timestamp
+    if age < policy.full_resolution:
+        return None
+    if age < policy.hourly_until:
+        return ("hour", entry.timestamp // 3600)
+    return ("day", datetime.date.fromtimestamp(entry.timestamp))
+
+
+def plan_retention(entries: List[CommitStats], now: float, policy: RetentionPolicy) -> Set[str]:
+    """Returns the shas of the snapshots to drop.
+
+    Args:
+        entries: A first-parent chain of commits, newest first.
+        now: The time ages are measured from.
+        policy: The retention policy.
+    """
+    dropped: Set[str] = set()
+    previous: Optional[Hashable] = None
+    for entry in entries:
+        key = bucket_key(entry, now, policy)
+        # The newest snapshot of each bucket run is kept.
+        if key is not None and key == previous:
+            dropped.add(entry.sha)
+        previous = key
+    return dropped
+
+
+def recent_count(entries: List[CommitStats], now: float, policy: RetentionPolicy) -> int:
+    """Returns how many of the newest entries are in the full-resolution window."""
+    for count, entry in enumerate(entries):
+        if now - entry.timestamp >= policy.full_resolution:
+            return count
+    return len(entries)
+
+
+def walk_bound(last_run: float, policy: RetentionPolicy) -> Optional[int]:
+    """Returns the oldest commit time a run after last_run has to look at.
+
+    Snapshots older than this were already compacted to daily points by the
+    last run and cannot change, so each run only walks recent history. The
+    bound is moved to the start of its day so that a daily bucket is never
+    split. None means the whole history (no previous run).
+    """
+    if not last_run:
+        return None
+    bound = datetime.datetime.fromtimestamp(last_run - policy.hourly_until)
+    day_start = bound.replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(day_start.timestamp())
+
+
+def rewrite_chain(
+    entries: List[CommitStats],
+    dropped: Set[str],
+    read_commit: Callable[[str], bytes],
+    store_commit: Callable[[bytes], str],
+    grafted: Collection[str] = (),
+) -> Dict[str, str]:
+    """Rewrites a first-parent chain without the dropped commits.
+
+    Kept commits keep their tree, message, author and dates; only their
+    parent changes. Commits older than the first dropped or grafted one are
+    reused.
+
+    Args:
+        entries: The chain, newest first. The parent of the oldest entry is
+            the unchanged base.
+        dropped: Shas of the commits to leave out.
+        read_commit: Returns the raw content of a commit object.
+        store_commit: Writes a raw commit object and returns its sha.
+        grafted: Shas of commits with a replace ref. They are rewritten
+            with their grafted parent, so the replace ref can be deleted.
+
+    Returns:
+        A mapping from each rewritten commit's old sha to its new sha.
+    """
+    rewritten: Dict[str, str] = {}
+    parent = entries[-1].parent if entries else None
+    changed = False
+    for entry in reversed(entries):
+        if entry.sha in dropped:
+            changed = True
+            continue
+        if entry.sha in grafted:
+            changed = True
+        if not changed:
+            parent = entry.sha
+            continue
+        new_sha = store_commit(replace_parent(read_commit(entry.sha), parent))
+        rewritten[entry.sha] = new_sha
+        parent = new_sha
+    return rewritten
+
+
+def replace_parent(raw: bytes, parent: Optional[str]) -> bytes:
+    """Returns the raw commit with parent as its only parent."""
+    header, sep, message = raw.partition(b"\n\n")
+    lines = [line for line in header.split(b"\n") if not line.startswith(b"parent ")]
+    if parent is not None:
+        # The parent line follows the tree line.
+        lines.insert(1, b"parent " + parent.encode("ascii"))
+    return b"\n".join(lines) + sep + message
@@ -0,0 +1,303 @@
+# SPDX-License-Identifier: MIT
+import heapq
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Protocol
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest interval in a path's moving average of event intervals.
+EWMA_ALPHA = 0.3
+
+# A path waits this many times its average event interval before it settles.
+DEBOUNCE_FACTOR = 3.0
+
+# Write statistics of paths without events for this long are dropped.
+STATS_TTL = 600.0
+
+
+@dataclass
+class PathStats:
+    """Write frequency of one path.
+
+    Attributes:
+        last_event: Monotonic time of the latest event.
+        interval: Moving average of the time between events, None after a
+            single event.
+        ceiling_hits: Consecutive snapshots forced by the max-wait ceiling
+            because the path never went quiet.
+    """
+
+    last_event: float
+    interval: Optional[float] = None
+    ceiling_hits: int = 0
+
+
+class SnapshotSink(Protocol):
+    def create_batch_snapshot(self, filepaths: list[str]) -> Optional[str]: ...
+
+
+class SnapshotScheduler:
+    """Debounces file changes and records them on a single worker thread.
+
+    Pending paths are kept in a heap ordered by deadline and serviced by one
+    timer thread, which hands settled batches to one snapshot worker through a
+    bounded queue. When the worker falls behind the timer thread blocks on the
+    queue while new events keep coalescing into the pending set, so the number
+    of threads and queued batches stays constant however many events arrive.
+
+    The debounce delay adapts to each path's write frequency: a path written
+    rarely settles after `min_debounce`, a path written in bursts waits a few
+    times its average event interval, up to `debounce_interval`. A path that
+    never goes quiet is still recorded every `max_latency` seconds; once that
+    ceiling forced `hot_after` snapshots in a row the path is throttled to one
+    snapshot per `hot_interval` until it goes quiet again.
+
+    Attributes:
+        debounce_interval: Longest time in seconds a path must be quiet before it is recorded.
+        min_debounce: Quiet time required from rarely written paths.
+        max_batch_size: Maximum number of files recorded in one snapshot.
+        max_latency: Maximum time in seconds a change may stay pending.
+        hot_after: Consecutive forced snapshots after which a path is throttled.
+        hot_interval: Maximum time in seconds a change of a throttled path may stay pending.
+        coalesce_window: Paths due within this many seconds of a batch join it.
+    """
+
+    def __init__(
+        self,
+        debounce_interval: float = 2.0,
+        max_batch_size: int = 100,
+        max_latency: float = 10.0,
+        max_queue_size: int = 4,
+        min_debounce: float = 0.5,
+        hot_after: int = 3,
+        hot_interval: float = 60.0,
+    ):
+        self.debounce_interval = debounce_interval
+        self.min_debounce = min(min_debounce, debounce_interval)
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.hot_after = hot_after
+        self.hot_interval = max(hot_interval, max_latency)
+        self.coalesce_window = min(0.5, self.min_debounce / 4)
+
+        self._cond = threading.Condition()
+        self._heap: list[tuple[float, str]] = []
+        self._deadlines: dict[str, float] = {}
+        self._first_seen: dict[str, float] = {}
+        self._sinks: dict[str, SnapshotSink] = {}
+        self._stats: dict[str, PathStats] = {}
+        self._last_prune = time.monotonic()
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._in_flight = 0
+        self._running = False
+        self._timer_thread: Optional[threading.Thread] = None
+        self._worker_thread: Optional[threading.Thread] = None
+
+    @property
+    def pending_count(self) -> int:
+        """Number of paths waiting for their debounce deadline."""
+        with self._cond:
+            return len(self._deadlines)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of batches waiting for the snapshot worker."""
+        return self._queue.qsize()
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._timer_thread = threading.Thread(
+            target=self._timer_loop, name="trajectory-scheduler", daemon=True
+        )
+        self._worker_thread = threading.Thread(
+            target=self._worker_loop, name="trajectory-snapshot", daemon=True
+        )
+        self._timer_thread.start()
+        self._worker_thread.start()
+
+    def stop(self):
+        """Records everything still pending and stops both threads."""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        if self._timer_thread:
+            self._timer_thread.join()
+        self._queue.put(None)
+        if self._worker_thread:
+            self._worker_thread.join()
+
+    def touch(self, sink: SnapshotSink, filepath: str):
+        """Schedules filepath to be recorded by sink once it settles."""
+        self.touch_many(sink, [filepath])
+
+    def touch_many(self, sink: SnapshotSink, filepaths: list[str]):
+        """Schedules filepaths to be recorded by sink together once they settle.
+
+        The paths share one deadline, so the two sides of a rename end up in
+        the same snapshot and git sees a rename rather than a delete and an add.
+        """
+        now = time.monotonic()
+        with self._cond:
+            first_seen = min(self._first_seen.get(path, now) for path in filepaths)
+            delay = max(self._observe(path, now) for path in filepaths)
+            ceiling = max(self._max_wait(path) for path in filepaths)
+            deadline = min(now + delay, first_seen + ceiling)
+            for filepath in filepaths:
+                self._first_seen[filepath] = first_seen
+                self._deadlines[filepath] = deadline
+                self._sinks[filepath] = sink
+                heapq.heappush(self._heap, (deadline, filepath))
+            self._cond.notify()
+
+    def debounce_delay(self, filepath: str) -> float:
+        """Returns the quiet time currently required from filepath."""
+        with self._cond:
+            stats = self._stats.get(filepath)
+            return self._delay(stats)
+
+    def is_throttled(self, filepath: str) -> bool:
+        with self._cond:
+            stats = self._stats.get(filepath)
+            return stats is not None and stats.ceiling_hits >= self.hot_after
+
+    def _observe(self, filepath: str, now: float) -> float:
+        """Updates the write frequency of filepath and returns its debounce delay."""
+        stats = self._stats.get(filepath)
+        if stats is None:
+            stats = self._stats[filepath] = PathStats(now)
+        else:
+            # Long pauses only mean "quiet"; capping them lets a burst register quickly.
+            interval = min(now - stats.last_event, self.max_latency)
+            if stats.interval is None:
+                stats.interval = interval
+            else:
+                stats.interval += EWMA_ALPHA * (interval - stats.interval)
+            stats.last_event = now
+        return self._delay(stats)
+
+    def _delay(self, stats: Optional[PathStats]) -> float:
+        if stats is None or stats.interval is None or stats.interval > self.debounce_interval:
+            return self.min_debounce
+        return min(max(DEBOUNCE_FACTOR * stats.interval, self.min_debounce), self.debounce_interval)
+
+    def _max_wait(self, filepath: str) -> float:
+        stats = self._stats.get(filepath)
+        if stats is not None and stats.ceiling_hits >= self.hot_after:
+            return self.hot_interval
+        return self.max_latency
+
+    def _settled(self, filepath: str, deadline: float):
+        """Notes whether filepath was due because it went quiet or at the ceiling."""
+        stats = self._stats.get(filepath)
+        # Flushed paths (deadline 0) say nothing about the write pattern.
+        if stats is None or deadline == 0.0:
+            return
+        if deadline >= stats.last_event + self._delay(stats):
+            stats.ceiling_hits = 0
+            return
+        stats.ceiling_hits += 1
+        if stats.ceiling_hits == self.hot_after:
+            METRICS.increment("snapshot_throttled_paths_total")
+            logger.info(
+                f"{filepath} is written continuously; recording it at most "
+                f"every {self.hot_interval:.0f}s until it goes quiet"
+            )
+
+    def _prune_stats(self, now: float):
+        if now - self._last_prune < STATS_TTL:
+            return
+        self._last_prune = now
+        for filepath in [p for p, s in self._stats.items() if now - s.last_event > STATS_TTL]:
+            if filepath not in self._deadlines:
+                del self._stats[filepath]
+
+    def flush(self):
+        """Records all pending paths immediately and waits for the worker."""
+        with self._cond:
+            for filepath in self._deadlines:
+                self._deadlines[filepath] = 0.0
+                heapq.heappush(self._heap, (0.0, filepath))
+            self._cond.notify()
+
+            if self._running:
+                self._cond.wait_for(lambda: not self._deadlines and not self._in_flight)
+                return
+            due = self._take_due(float("inf"))
+
+        for sink, batch in due:
+            self._record(sink, batch)
+
+    def _timer_loop(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                if not self._running:
+                    due = self._take_due(float("inf"))
+                else:
+                    due = self._take_due(time.monotonic() + self.coalesce_window)
+
+            # Blocks while the worker is busy; new events keep coalescing meanwhile.
+            for item in due:
+                self._queue.put(item)
+            if not self._running and not self._deadlines:
+                return
+
+    def _take_due(self, horizon: float) -> list[tuple[SnapshotSink, list[str]]]:
+        """Pops every path due before horizon, grouped into batches per sink.
+
+        Must be called with the condition held (or before the threads start).
+        """
+        batches: dict[int, tuple[SnapshotSink, list[str]]] = {}
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= horizon:
+            deadline, filepath = heapq.heappop(self._heap)
+            # Entries superseded by a later event for the same path are stale.
+            if self._deadlines.get(filepath) != deadline:
+                continue
+            del self._deadlines[filepath]
+            # Time from the first event to the snapshot being queued.
+            METRICS.observe("snapshot_debounce_seconds", now - self._first_seen.pop(filepath))
+            self._settled(filepath, deadline)
+            sink = self._sinks.pop(filepath)
+            batches.setdefault(id(sink), (sink, []))[1].append(filepath)
+
+        self._prune_stats(now)
+        due = []
+        for sink, filepaths in batches.values():
+            for i in range(0, len(filepaths), self.max_batch_size):
+                due.append((sink, filepaths[i : i + self.max_batch_size]))
+        self._in_flight += len(due)
+        return due
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._record(*item)
+
+    def _record(self, sink: SnapshotSink, batch: list[str]):
+        try:
+            sink.create_batch_snapshot(batch)
+        except Exception as e:
+            logger.error(f"Error snapshotting {batch}: {e}")
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
@@ -1,11 +1,22 @@
 # SPDX-License-Identifier: MIT
 from mcp.server.fastmcp import FastMCP
+from anyio import CapacityLimiter, to_thread
 import argparse
+import asyncio
 import logging
 import os
-from .recorder import Recorder
-from .watcher import Watcher
-from .trajectory import Trajectory
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator, TypeVar
+from .large_files import LargeFilePolicy
+from .metrics import METRICS, MetricsDumper, count_subprocesses
+
+# GitPython and watchdog are imported with the registry, off the startup path.
+if TYPE_CHECKING:
+    from .projects import ProjectRegistry
+    from .recorder import Recorder
+    from .trajectory import Trajectory
+    from .watcher import Watcher
 
 # Configure logging
 logging.basicConfig(
@@ -14,17 +25,175 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Default output budget of the trajectory tools, so a single lockfile change
+# cannot flood the client's context window.
+DEFAULT_MAX_TOKENS = 8000
+
+
+def _token_limit(max_tokens: int) -> int | None:
+    return max_tokens if max_tokens > 0 else None
+
+
+# Maximum number of concurrent worker threads per tool. Git-heavy tools run
+# off the event loop so cheap calls such as set_trajectory_intent stay responsive.
+TOOL_CONCURRENCY = {
+    "configure_project": 1,
+    "get_file_trajectory": 4,
+    "get_global_trajectory": 2,
+    "get_session_summary": 2,
+    "consolidate": 1,
+    "set_trajectory_intent": 2,
+}
+
+_tool_limiters = {name: CapacityLimiter(limit) for name, limit in TOOL_CONCURRENCY.items()}
+
+T = TypeVar("T")
+
+
+class _ToolSlot:
+    """A worker slot borrowed from a tool's limiter.
+
+    anyio gives the slot back as soon as a call is abandoned. This one is
+    only given back once the function has returned, so abandoned threads
+    still count as busy; a function that never started frees it at once.
+    """
+
+    def __init__(self, limiter: CapacityLimiter):
+        self._limiter = limiter
+        self._lock = threading.Lock()
+        self._started = False
+        self._released = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def acquire(self):
+        self._loop = asyncio.get_running_loop()
+        await self._limiter.acquire_on_behalf_of(self)
+
+    def start(self) -> bool:
+        """Called in the worker thread; returns False if the call was cancelled first."""
+        with self._lock:
+            if self._released:
+                return False
+            self._started = True
+            return True
+
+    def finish(self):
+        """Called in the worker thread once the function returned."""
+        with self._lock:
+            self._released = True
+        assert self._loop is not None
+        try:
+            # The limiter is not thread-safe; an abandoned thread can no
+            # longer use anyio.from_thread, whose cancel scope is cancelled.
+            self._loop.call_soon_threadsafe(self._limiter.release_on_behalf_of, self)
+        except RuntimeError:
+            # The event loop is closed, so nothing else uses the limiter.
+            self._limiter.release_on_behalf_of(self)
+
+    def cancel(self):
+        """Called in the event loop when the call is cancelled."""
+        with self._lock:
+            if self._started:
+                return
+            self._released = True
+        self._limiter.release_on_behalf_of(self)
+
+
+async def _run_tool(name: str, func: Callable[..., T], *args, **kwargs) -> T:
+    """Runs func in a worker thread, bounded by the tool's concurrency limit.
+
+    If the client cancels the request the call returns immediately, but the
+    work is not interrupted: the thread finishes in the background, so a
+    rendered result still lands in the trajectory cache for the next call,
+    and it keeps its slot in the tool's limiter until then.
+    """
+    METRICS.increment("tool_calls_total", tool=name)
+    slot = _ToolSlot(_tool_limiters[name])
+
+    def run() -> T:
+        if not slot.start():
+            raise RuntimeError(f"{name} was cancelled before it started")
+        try:
+            return func(*args, **kwargs)
+        finally:
+            slot.finish()
+
+    # Includes the wait for a free worker.
+    with METRICS.timer("tool_seconds", tool=name):
+        await slot.acquire()
+        try:
+            return await to_thread.run_sync(run, abandon_on_cancel=True)
+        except BaseException:
+            slot.cancel()
+            raise
+
+
 # Global state
 class ServerState:
+    """Server-wide state.
+
+    recorder, watcher, trajectory and project_path belong to the active
+    project, which tools use when called without a `project` argument. Every
+    tracked project, including the active one, lives in the registry.
+
+    `ready` is cleared while the project given on the command line is set up
+    in the background; tools that need a project wait for it.
+    """
+
     def __init__(self):
-        self.recorder: Recorder | None = None
-        self.watcher: Watcher | None = None
-        self.trajectory: Trajectory | None = None
+        self.recorder: "Recorder | None" = None
+        self.watcher: "Watcher | None" = None
+        self.trajectory: "Trajectory | None" = None
         self.project_path: str | None = None
+        self.snapshot_engine: str = "cli"
+        self.watch_backend: str = "watchdog"
+        self.max_active_projects: int | None = None
+        self.large_files = LargeFilePolicy()
+        self.ready = threading.Event()
+        self.ready.set()
+        self.startup_error: str | None = None
+        # Intent set before the startup project was ready.
+        self.pending_intent: str | None = None
+        self.startup_lock = threading.Lock()
+        self._registry: "ProjectRegistry | None" = None
+        self._registry_lock = threading.Lock()
+
+    @property
+    def registry(self) -> "ProjectRegistry":
+        """The project registry, created (and its dependencies imported) on first use."""
+        with self._registry_lock:
+            if self._registry is None:
+                from .projects import ProjectRegistry
+
+                self._registry = ProjectRegistry(max_active=self.max_active_projects)
+                _register_registry_gauges(self._registry)
+            return self._registry
+
+    @registry.setter
+    def registry(self, registry: "ProjectRegistry"):
+        self._registry = registry
+
+    def loaded_registry(self) -> "ProjectRegistry | None":
+        """The registry if it was created, without creating it."""
+        return self._registry
 
 
 state = ServerState()
 
+for _name, _limiter in _tool_limiters.items():
+    METRICS.gauge("tool_workers_busy", lambda limiter=_limiter: limiter.borrowed_tokens, tool=_name)
+
+
+def _register_registry_gauges(registry: "ProjectRegistry"):
+    METRICS.gauge("snapshot_pending_paths", lambda: registry.scheduler.pending_count)
+    METRICS.gauge("snapshot_queue_depth", lambda: registry.scheduler.queue_depth)
+    METRICS.gauge("tracked_projects", lambda: len(registry.projects))
+    METRICS.gauge(
+        "trajectory_cache_bytes",
+        lambda: sum(project.trajectory.cache.size for project in registry.projects),
+    )
+
+
 # Initialize MCP Server
 mcp = FastMCP("code-trajectory")
 
@@ -36,9 +205,13 @@ def _ensure_configured(path: str | None = None) -> str:
     return f"Server is configured to track: {state.project_path}"
 
 
-def _check_configured() -> str | None:
-    """Checks if configured, returns error message if not."""
-    if state.trajectory is None:
+def _check_configured(project: str | None = None) -> str | None:
+    """Checks if configured, returns error message if not.
+
+    A project still being set up at startup counts as configured; the tool
+    waits for it in its worker thread.
+    """
+    if project is None and state.trajectory is None and state.ready.is_set():
         return (
             "Server is NOT configured. "
             "Please call 'configure_project(path=...)' with the absolute path to the project root."
@@ -46,35 +219,106 @@ def _check_configured() -> str | None:
     return None
 
 
-def _initialize_components(path: str) -> str:
+def _wait_ready():
+    """Blocks until the startup project is set up."""
+    if not state.ready.is_set():
+        logger.info("Waiting for startup configuration to finish...")
+        state.ready.wait()
+
+
+@contextmanager
+def _tracked(project: str | None) -> "Iterator[tuple[Recorder, Trajectory]]":
+    """Yields the recorder and trajectory of project, or of the active project.
+
+    A project that is not tracked yet starts being tracked. The project is
+    not stopped (e.g. evicted) until the block exits. Runs in the tool's
+    worker thread since opening a project touches git.
+    """
+    _wait_ready()
+    if project is None:
+        if state.trajectory is None:
+            raise RuntimeError(f"Startup configuration failed: {state.startup_error}")
+        tracked = state.registry.get(state.project_path) if state.project_path else None
+        if tracked is None or not tracked.acquire():
+            yield state.recorder, state.trajectory  # type: ignore[misc]
+            return
+        try:
+            yield state.recorder, state.trajectory  # type: ignore[misc]
+        finally:
+            tracked.release()
+        return
+    with state.registry.use(
+        project,
+        snapshot_engine=state.snapshot_engine,
+        large_files=state.large_files,
+        watch_backend=state.watch_backend,
+    ) as tracked:
+        yield tracked.recorder, tracked.trajectory
+
+
+def _configure(path: str, watch_backend: str | None = None) -> str:
+    _wait_ready()
+    return _initialize_components(path, watch_backend)
+
+
+def _start_background_configuration(path: str) -> threading.Thread:
+    """Sets up the startup project in a thread so the server answers immediately.
+
+    Opening the shadow repository and registering recursive watches can take
+    seconds on large trees, longer than some clients wait for `initialize`.
+    """
+    state.ready.clear()
+
+    def run():
+        try:
+            _initialize_components(path)
+        except Exception as e:
+            logger.error(f"Startup configuration failed: {e}")
+            state.startup_error = str(e)
+        finally:
+            with state.startup_lock:
+                if state.pending_intent is not None and state.recorder is not None:
+                    state.recorder.set_intent(state.pending_intent)
+                state.pending_intent = None
+                state.ready.set()
+
+    thread = threading.Thread(target=run, name="trajectory-startup", daemon=True)
+    thread.start()
+    return thread
+
+
+def _initialize_components(path: str, watch_backend: str | None = None) -> str:
     target_path = os.path.abspath(path)
     if not os.path.exists(target_path):
         raise ValueError(f"Target path does not exist: {target_path}")
 
     # Check if we are already watching this path AND the shadow repo exists
     shadow_repo_path = os.path.join(target_path, ".trajectory")
+    tracked = state.registry.get(target_path)
     if (
-        state.watcher
-        and state.project_path == target_path
+        tracked
+        and state.watcher is tracked.watcher
         and os.path.exists(shadow_repo_path)
     ):
         logger.info(f"Already watching {target_path}, skipping re-initialization.")
         return f"Already configured to track: {target_path}"
 
-    # Stop existing watcher if any (different path)
-    if state.watcher:
-        state.watcher.stop()
-
     # Check if this is a new initialization before creating the recorder (which creates the repo)
     is_new_initialization = not os.path.exists(shadow_repo_path)
 
     try:
-        state.recorder = Recorder(target_path)
-        state.watcher = Watcher(target_path, state.recorder)
-        state.trajectory = Trajectory(state.recorder)
+        # Other projects keep being tracked; this one becomes the active project.
+        tracked = state.registry.open(
+            target_path,
+            snapshot_engine=state.snapshot_engine,
+            large_files=state.large_files,
+            watch_backend=watch_backend or state.watch_backend,
+        )
+        state.registry.active = target_path
+        state.recorder = tracked.recorder
+        state.watcher = tracked.watcher
+        state.trajectory = tracked.trajectory
         state.project_path = target_path
-
-        state.watcher.start()
         logger.info(f"Initialized components for {target_path}")
 
         if is_new_initialization:
@@ -89,25 +333,36 @@ def _initialize_components(path: str) -> str:
 
 
 @mcp.tool()
-def configure_project(path: str) -> str:
+async def configure_project(path: str, watch_backend: str | None = None) -> str:
     """Configures the server to track a specific project path.
 
     This tool MUST be called before using any other tools.
-    It initializes the server to track the specified project directory.
+    It initializes the server to track the specified project directory and makes
+    it the default for tools called without a `project`. Previously configured
+    projects keep being tracked.
 
     Args:
         path: Absolute path to the target project directory.
+        watch_backend: How changes in this project are detected: "watchdog",
+            "stat" (for network filesystems and bind mounts) or "inotify"
+            (default: the server's --watch-backend). Only applies when the
+            project starts being tracked.
 
     Returns:
         A confirmation message indicating the server is configured.
     """
     if path:
-        return _initialize_components(path)
+        return await _run_tool("configure_project", _configure, path, watch_backend)
     return "Please provide a path."
 
 
 @mcp.tool()
-def get_file_trajectory(filepath: str, depth: int = 5) -> str:
+async def get_file_trajectory(
+    filepath: str,
+    depth: int = 5,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    project: str | None = None,
+) -> str:
     """Retrieves the evolutionary trajectory of a specific file.
 
     Use this tool before modifying a complex file to understand its recent history,
@@ -116,20 +371,34 @@ def get_file_trajectory(filepath: str, depth: int = 5) -> str:
     Args:
         filepath: Relative path to the file (e.g., "src/main.py").
         depth: Number of recent snapshots to retrieve (default: 5).
+        max_tokens: Approximate output limit (default: 8000, 0 for no limit).
+            Large hunks are collapsed and older snapshots dropped to fit.
+        project: Absolute path of the project to query (default: the configured project).
 
     Returns:
         A markdown-formatted narrative of the file's history, including timestamps,
         intents, and diff summaries. Reverts are annotated with `[Revert Detected]`.
     """
-    error = _check_configured()
+    error = _check_configured(project)
     if error:
         return error
-    assert state.trajectory is not None
-    return state.trajectory.get_file_trajectory(filepath, depth)
+
+    def run() -> str:
+        with _tracked(project) as (_, trajectory):
+            return trajectory.get_file_trajectory(
+                filepath, depth, max_tokens=_token_limit(max_tokens)
+            )
+
+    return await _run_tool("get_file_trajectory", run)
 
 
 @mcp.tool()
-def get_global_trajectory(limit: int = 20, since_consolidate: bool = False) -> str:
+async def get_global_trajectory(
+    limit: int = 20,
+    since_consolidate: bool = False,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    project: str | None = None,
+) -> str:
     """Retrieves the global trajectory (ripple effect) across the project.
 
     Use this to understand the broader context of recent changes or to detect
@@ -139,36 +408,52 @@ def get_global_trajectory(limit: int = 20, since_consolidate: bool = False) -> s
         limit: Maximum number of commits to retrieve (default: 20).
         since_consolidate: If True, retrieves all commits since the last consolidation.
             This overrides the 'limit' argument.
+        max_tokens: Approximate output limit (default: 8000, 0 for no limit).
+            Long file lists are shortened and older snapshots dropped to fit.
+        project: Absolute path of the project to query (default: the configured project).
 
     Returns:
         A summary of modified files and their relationships, grouped by time and intent.
     """
-    error = _check_configured()
+    error = _check_configured(project)
     if error:
         return error
-    assert state.trajectory is not None
-    return state.trajectory.get_global_trajectory(limit, since_consolidate)
+
+    def run() -> str:
+        with _tracked(project) as (_, trajectory):
+            return trajectory.get_global_trajectory(
+                limit, since_consolidate, max_tokens=_token_limit(max_tokens)
+            )
+
+    return await _run_tool("get_global_trajectory", run)
 
 
 @mcp.tool()
-def get_session_summary() -> str:
+async def get_session_summary(project: str | None = None) -> str:
     """Retrieves a summary of the last session and current context.
 
     Use this at the beginning of a chat session to "catch up" on what happened
     previously or to understand the last known state of the project.
 
+    Args:
+        project: Absolute path of the project to query (default: the configured project).
+
     Returns:
         A summary of the last recorded session, including the final intent and modified files.
     """
-    error = _check_configured()
+    error = _check_configured(project)
     if error:
         return error
-    assert state.trajectory is not None
-    return state.trajectory.get_session_summary()
+
+    def run() -> str:
+        with _tracked(project) as (_, trajectory):
+            return trajectory.get_session_summary()
+
+    return await _run_tool("get_session_summary", run)
 
 
 @mcp.tool()
-def consolidate(intent: str) -> str:
+async def consolidate(intent: str, project: str | None = None) -> str:
     """Consolidates recent snapshots into a single commit with a descriptive intent.
 
     Use this after completing a logical unit of work to "save" your progress semantically.
@@ -180,19 +465,24 @@ def consolidate(intent: str) -> str:
 
     Args:
         intent: A clear, past-tense description of what was accomplished (e.g., "Refactored auth middleware").
+        project: Absolute path of the project to consolidate (default: the configured project).
 
     Returns:
         A success message indicating the consolidation was created and how many snapshots were squashed.
     """
-    error = _check_configured()
+    error = _check_configured(project)
     if error:
         return error
-    assert state.recorder is not None
-    return state.recorder.consolidate(intent)
+
+    def run() -> str:
+        with _tracked(project) as (recorder, _):
+            return recorder.consolidate(intent)
+
+    return await _run_tool("consolidate", run)
 
 
 @mcp.tool()
-def set_trajectory_intent(intent: str) -> str:
+async def set_trajectory_intent(intent: str, project: str | None = None) -> str:
     """Sets the current coding intent.
 
     The intent will be attached to all subsequent [AUTO-TRJ] snapshots until it is
@@ -200,14 +490,30 @@ def set_trajectory_intent(intent: str) -> str:
 
     Args:
         intent: A short description of the task (e.g., "Debugging connection timeout").
+        project: Absolute path of the project to set the intent on (default: the
+            configured project).
 
     Returns:
         A confirmation message indicating the intent is set.
     """
-    error = _check_configured()
+    error = _check_configured(project)
     if error:
         return error
-    assert state.recorder is not None
+    if project is not None:
+
+        def run() -> str:
+            with _tracked(project) as (recorder, _):
+                recorder.set_intent(intent)
+            return f"Intent set to: '{intent}'"
+
+        return await _run_tool("set_trajectory_intent", run)
+    with state.startup_lock:
+        if not state.ready.is_set():
+            # Applied once the startup project is ready.
+            state.pending_intent = intent
+            return f"Intent set to: '{intent}'"
+    if state.recorder is None:
+        return f"Startup configuration failed: {state.startup_error}"
     state.recorder.set_intent(intent)
     return f"Intent set to: '{intent}'"
 
@@ -215,6 +521,26 @@ def set_trajectory_intent(intent: str) -> str:
 
 
 
+@mcp.tool()
+def get_server_metrics(format: str = "json") -> str:
+    """Reports the server's performance counters, latency histograms and queue depths.
+
+    Use this to find out whether slowness comes from file events, the debounce
+    delay, git subprocesses, lock contention or rendering.
+
+    Args:
+        format: "json" (default) or "prometheus" for the Prometheus text format.
+
+    Returns:
+        The current metrics of this server process.
+    """
+    if not METRICS.enabled:
+        return "Metrics are disabled (the server was started with --no-metrics)."
+    if format == "prometheus":
+        return METRICS.to_prometheus()
+    return METRICS.to_json()
+
+
 class BytesStdinWrapper:
     """
     Wraps stdin.buffer to ensure consistent line endings (LF) across platforms.
@@ -293,7 +619,63 @@ class BytesStdoutWrapper:
 def main():
     parser = argparse.ArgumentParser(description="Code Trajectory MCP Server")
     parser.add_argument("--path", help="Path to the target project to track (optional)")
+    parser.add_argument(
+        "--snapshot-engine",
+        choices=["cli", "objects"],
+        default="cli",
+        help="How snapshots are written: through the git CLI or in-process (default: cli)",
+    )
+    parser.add_argument(
+        "--watch-backend",
+        choices=["watchdog", "stat", "inotify"],
+        default="watchdog",
+        help="How file changes are detected: watchdog's native observer, a stat scanner "
+        "for network filesystems and bind mounts, or direct inotify on Linux "
+        "(default: watchdog)",
+    )
+    parser.add_argument(
+        "--max-projects",
+        type=int,
+        help="Stop tracking the least recently used project beyond this many "
+        "(default: no limit)",
+    )
+    parser.add_argument(
+        "--max-file-size",
+        type=float,
+        default=10,
+        help="Files larger than this many MiB are recorded as a hash pointer (default: 10)",
+    )
+    parser.add_argument(
+        "--max-binary-size",
+        type=float,
+        default=1,
+        help="Binary files larger than this many MiB are recorded as a hash pointer (default: 1)",
+    )
+    parser.add_argument(
+        "--no-metrics",
+        action="store_true",
+        help="Do not record performance metrics (get_server_metrics reports nothing)",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="Periodically write metrics to this file (JSON if it ends in .json, "
+        "Prometheus text otherwise)",
+    )
     args = parser.parse_args()
+    state.snapshot_engine = args.snapshot_engine
+    state.watch_backend = args.watch_backend
+    state.max_active_projects = args.max_projects
+    METRICS.enabled = not args.no_metrics
+    dumper = None
+    if METRICS.enabled:
+        count_subprocesses()
+        if args.metrics_file:
+            dumper = MetricsDumper(args.metrics_file)
+            dumper.start()
+    state.large_files = LargeFilePolicy(
+        max_file_bytes=int(args.max_file_size * 1024 * 1024),
+        max_binary_bytes=int(args.max_binary_size * 1024 * 1024),
+    )
 
     # Initial configuration
     try:
@@ -304,7 +686,7 @@ def main():
             raise RuntimeError("Git is not installed or not in PATH.")
 
         if args.path:
-            _initialize_components(args.path)
+            _start_background_configuration(args.path)
         else:
             logger.info("Server started. Waiting for 'configure_project' call.")
     except Exception as e:
@@ -359,8 +741,12 @@ def main():
     except KeyboardInterrupt:
         logger.info("Stopping server...")
     finally:
-        if state.watcher:
-            state.watcher.stop()
+        state.ready.wait()
+        registry = state.loaded_registry()
+        if registry is not None:
+            registry.close_all()
+        if dumper is not None:
+            dumper.stop()
 
 
 if __name__ == "__main__":
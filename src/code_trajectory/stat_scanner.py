@@ -0,0 +1,261 @@
+# SPDX-License-Identifier: MIT
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirMovedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+)
+
+from .event_source import EventSource, SourceEmitter, SourceObserver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCAN_INTERVAL = 1.0
+
+# Every file is re-stated at least once per sweep interval, spread over the scans.
+DEFAULT_SWEEP_INTERVAL = 30.0
+
+# Directories with a change this recent have their files re-stated on every scan.
+ACTIVE_SECONDS = 60.0
+
+# A directory entry: (is_dir, inode, mtime_ns, size).
+EntryStat = Tuple[bool, int, int, int]
+
+# A created or deleted path: (path, is_dir, inode).
+PathChange = Tuple[str, bool, int]
+
+
+@dataclass
+class ScannedDirectory:
+    """The last listing of a watched directory.
+
+    Attributes:
+        owner: The emitter whose watch covers the directory.
+        mtime_ns: The directory's modification time when it was listed.
+        entries: Stat of each entry, by name.
+    """
+
+    owner: SourceEmitter
+    mtime_ns: int
+    entries: Dict[str, EntryStat]
+
+
+class StatScanSource(EventSource):
+    """Finds changes by stat-ing the tree instead of waiting for kernel events.
+
+    Works wherever stat works: network filesystems and bind mounts that never
+    deliver inotify events. Unlike watchdog's PollingObserver, a scan does
+    not re-list the tree. It stats each watched directory and re-lists only
+    those whose mtime changed, which catches every creation, deletion,
+    rename and atomic save. In-place writes do not touch the directory, so
+    files are re-stated in slices: a full sweep every `sweep_interval`, and
+    on every scan in directories that changed recently.
+
+    Attributes:
+        interval: Seconds between two scans.
+        sweep_interval: Seconds within which every file is re-stated.
+    """
+
+    def __init__(
+        self,
+        interval: float = DEFAULT_SCAN_INTERVAL,
+        sweep_interval: float = DEFAULT_SWEEP_INTERVAL,
+    ):
+        super().__init__("trajectory-stat-scanner")
+        self.interval = interval
+        self.sweep_interval = sweep_interval
+        self.directories: Dict[str, ScannedDirectory] = {}
+        self._active: Dict[str, float] = {}
+        self._sweep_queue: List[str] = []
+
+    def watch_added(self, emitter: SourceEmitter):
+        self._track(emitter.watch.path, emitter)
+
+    def watch_removed(self, emitter: SourceEmitter):
+        for directory in [d for d, s in self.directories.items() if s.owner is emitter]:
+            del self.directories[directory]
+            self._active.pop(directory, None)
+
+    def poll(self, timeout: float):
+        if self.wait(self.interval):
+            return
+        with self.lock:
+            self.scan()
+
+    def scan(self):
+        """Compares the tree with the last scan and queues the differences."""
+        now = time.monotonic()
+        created: List[PathChange] = []
+        deleted: List[PathChange] = []
+        owners: Dict[str, SourceEmitter] = {}
+        sweep = self._sweep_slice()
+
+        for directory in list(self.directories):
+            state = self.directories.get(directory)
+            if state is None:
+                # Forgotten earlier in this scan along with a deleted parent.
+                continue
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                # The parent's listing reports the deletion.
+                self._forget(directory)
+                continue
+            if mtime_ns != state.mtime_ns:
+                self._relist(directory, state, mtime_ns, created, deleted, owners)
+                self._active[directory] = now
+            elif directory in sweep or now - self._active.get(directory, -math.inf) < ACTIVE_SECONDS:
+                if self._restat_files(directory, state):
+                    self._active[directory] = now
+
+        self._queue_changes(created, deleted, owners)
+
+    def _queue_changes(
+        self,
+        created: List[PathChange],
+        deleted: List[PathChange],
+        owners: Dict[str, SourceEmitter],
+    ):
+        """Queues created and deleted paths, pairing them by inode into moves."""
+        moved_from = {(is_dir, inode): path for path, is_dir, inode in deleted}
+        moved: Set[str] = set()
+        for path, is_dir, inode in created:
+            src = moved_from.pop((is_dir, inode), None)
+            if src is not None:
+                moved.add(src)
+                event_class = DirMovedEvent if is_dir else FileMovedEvent
+                owners[src].queue_event(event_class(src, path))
+            else:
+                event_class = DirCreatedEvent if is_dir else FileCreatedEvent
+                owners[path].queue_event(event_class(path))
+        for path, is_dir, _ in deleted:
+            if path not in moved:
+                event_class = DirDeletedEvent if is_dir else FileDeletedEvent
+                owners[path].queue_event(event_class(path))
+
+    def _relist(
+        self,
+        directory: str,
+        state: ScannedDirectory,
+        mtime_ns: int,
+        created: List[PathChange],
+        deleted: List[PathChange],
+        owners: Dict[str, SourceEmitter],
+    ):
+        entries = _list_directory(directory)
+        if entries is None:
+            return
+        recursive = state.owner.watch.is_recursive
+        for name, old in state.entries.items():
+            new = entries.get(name)
+            path = os.path.join(directory, name)
+            if new is not None and new[0] == old[0]:
+                if not new[0] and new != old:
+                    # Also covers a file atomically replaced by a rename.
+                    state.owner.queue_event(FileModifiedEvent(path))
+                continue
+            owners[path] = state.owner
+            deleted.append((path, old[0], old[1]))
+            if old[0]:
+                self._forget(path)
+        for name, new in entries.items():
+            old = state.entries.get(name)
+            if old is not None and old[0] == new[0]:
+                continue
+            path = os.path.join(directory, name)
+            owners[path] = state.owner
+            created.append((path, new[0], new[1]))
+            if new[0] and recursive:
+                self._track(path, state.owner)
+        state.mtime_ns = mtime_ns
+        state.entries = entries
+
+    def _restat_files(self, directory: str, state: ScannedDirectory) -> bool:
+        """Re-stats the files of directory and queues the modified ones."""
+        changed = False
+        for name, old in state.entries.items():
+            if old[0]:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path, follow_symlinks=False)
+            except OSError:
+                continue
+            new = (False, st.st_ino, st.st_mtime_ns, st.st_size)
+            if new != old:
+                state.entries[name] = new
+                state.owner.queue_event(FileModifiedEvent(path))
+                changed = True
+        return changed
+
+    def _sweep_slice(self) -> Set[str]:
+        """Returns the directories whose files are re-stated in this scan."""
+        if not self._sweep_queue:
+            self._sweep_queue = list(self.directories)
+        scans_per_sweep = max(1, int(self.sweep_interval / self.interval))
+        count = math.ceil(len(self.directories) / scans_per_sweep)
+        taken = self._sweep_queue[-count:] if count else []
+        del self._sweep_queue[len(self._sweep_queue) - len(taken):]
+        return set(taken)
+
+    def _track(self, directory: str, owner: SourceEmitter):
+        """Lists directory (and, for recursive watches, its subdirectories) as the baseline."""
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return
+        entries = _list_directory(directory)
+        if entries is None:
+            return
+        self.directories[directory] = ScannedDirectory(owner, mtime_ns, entries)
+        if owner.watch.is_recursive:
+            for name, entry in entries.items():
+                if entry[0]:
+                    self._track(os.path.join(directory, name), owner)
+
+    def _forget(self, directory: str):
+        prefix = directory.rstrip(os.sep) + os.sep
+        for path in [d for d in self.directories if d == directory or d.startswith(prefix)]:
+            del self.directories[path]
+            self._active.pop(path, None)
+
+
+def _list_directory(directory: str) -> Optional[Dict[str, EntryStat]]:
+    entries: Dict[str, EntryStat] = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    entries[entry.name] = (True, st.st_ino, 0, 0)
+                else:
+                    entries[entry.name] = (False, st.st_ino, st.st_mtime_ns, st.st_size)
+    except OSError as e:
+        logger.debug(f"Failed to list {directory}: {e}")
+        return None
+    return entries
+
+
+class StatScanObserver(SourceObserver):
+    """Observer backed by a StatScanSource."""
+
+    def __init__(
+        self,
+        interval: float = DEFAULT_SCAN_INTERVAL,
+        sweep_interval: float = DEFAULT_SWEEP_INTERVAL,
+    ):
+        super().__init__(StatScanSource(interval, sweep_interval))
@@ -3,230 +3,356 @@ from datetime import datetime
 import logging
 import os
 
+from typing import Callable, Hashable, Iterator, Optional
+
+from gitdb.exc import BadObject
+
+from .cache import DEFAULT_CACHE_MAX_BYTES, LRUCache
+from .git_log import FileRevision
+from .large_files import describe_pointer_patch
+from .metrics import METRICS
 from .recorder import Recorder
+from .render import OutputBudget, render_patch, text_size
 
 logger = logging.getLogger(__name__)
 
+# Shown when older snapshots did not fit in the output budget.
+OMITTED_NOTE = "_Older snapshots omitted: output budget reached._\n\n"
+
+# Room kept for a revert annotation, which is only known once all entries are read.
+REVERT_NOTE_RESERVE = len(" **[Revert Detected]** (Matches state from 2000-01-01 00:00:00)")
+
+# Separators and code fence around each file trajectory entry.
+ENTRY_OVERHEAD = len("\n\n```diff\n\n```\n\n")
+
+# Under a budget, diffs of files larger than this are not generated at all.
+LARGE_FILE_BYTES = 1024 * 1024
+
+GLOBAL_TITLE_RESERVE = "# Global Trajectory (Since Last Consolidation)\n"
+
+
+def _join_within(names: list[str], limit: float) -> str:
+    """Joins names with ", ", replacing those that do not fit by "and N more"."""
+    joined = ", ".join(names)
+    if text_size(joined) <= limit:
+        return joined
+    shown: list[str] = []
+    used = 0
+    for index, name in enumerate(names):
+        more = f" and {len(names) - index} more"
+        if used + text_size(name) + 2 + len(more) > limit:
+            return ", ".join(shown) + (more if shown else more.lstrip())
+        shown.append(name)
+        used += text_size(name) + 2
+    return joined
+
 
 class Trajectory:
-    def __init__(self, recorder: Recorder):
+    """Renders the shadow history for the MCP tools.
+
+    Rendered results are kept in an LRU cache keyed by the HEAD they were
+    built from, so repeated queries between snapshots return without touching
+    git. The revisions behind each file trajectory are cached as well: after
+    a snapshot only the commits added since the cached HEAD are read.
+
+    Attributes:
+        recorder: The Recorder whose history is rendered.
+        cache: Rendered results and revision lists.
+    """
+
+    def __init__(self, recorder: Recorder, cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
         self.recorder = recorder
+        self.cache = LRUCache(cache_max_bytes)
+        recorder.add_listener(self._on_history_change)
 
-    def get_file_trajectory(self, filepath: str, depth: int = 5) -> str:
+    def _on_history_change(self, event: str):
+        if event == "snapshot":
+            # Revision lists stay valid and are extended from their HEAD onwards.
+            self.cache.discard_where(lambda key: key[0] != "revisions")
+        else:
+            self.cache.clear()
+
+    def _cached(self, key: tuple, build: Callable[[], str]) -> str:
+        """Returns the cached result for key, building it on a miss."""
+        # key[1] is the HEAD the result depends on; nothing to cache without one.
+        if key[1] is None:
+            return build()
+        result = self.cache.get(key)
+        METRICS.increment(
+            "trajectory_cache_total", kind=key[0], result="miss" if result is None else "hit"
+        )
+        if result is None:
+            with METRICS.timer("trajectory_render_seconds", kind=key[0]):
+                result = build()
+            if not result.startswith("Error"):
+                self.cache.put(key, result, text_size(result))
+        return result
+
+    def _file_revisions(
+        self, filepath: str, depth: int, head: Optional[str], patches: bool = True
+    ) -> Iterator[FileRevision]:
+        """Yields the last depth revisions of filepath at head, newest first."""
+        if head is None:
+            return
+        key: Hashable = ("revisions", filepath, depth, patches)
+        cached = self.cache.get(key)
+        if cached is not None:
+            base_head, revisions = cached
+            if base_head != head:
+                # Snapshots only append to HEAD, so read just the new commits.
+                new = list(self.recorder.iter_file_history(
+                    filepath, max_count=depth, rev_range=f"{base_head}..{head}", patches=patches
+                ))
+                revisions = (new + revisions)[:depth]
+                self._cache_revisions(key, head, revisions)
+            yield from revisions
+            return
+
+        collected = []
+        stream = self.recorder.iter_file_history(
+            filepath, max_count=depth, rev_range=head, patches=patches
+        )
+        try:
+            for revision in stream:
+                collected.append(revision)
+                yield revision
+        finally:
+            stream.close()
+        # Only reached when the caller read the whole history.
+        self._cache_revisions(key, head, collected)
+
+    def _blob_size(self, rev: str) -> Optional[int]:
+        """Returns the size of a blob through the cat-file pool, or None if missing."""
+        try:
+            return self.recorder.objects.info(rev)[2]
+        except BadObject:
+            return None
+
+    def _cache_revisions(self, key: Hashable, head: str, revisions: list[FileRevision]):
+        size = sum(text_size(r.patch) + text_size(r.message) + 128 for r in revisions)
+        self.cache.put(key, (head, revisions), size)
+
+    @METRICS.timed("trajectory_seconds", method="get_file_trajectory")
+    def get_file_trajectory(
+        self,
+        filepath: str,
+        depth: int = 5,
+        max_tokens: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> str:
         """Generates a narrative trajectory for a specific file.
 
+        With a budget, snapshots are rendered newest first, each getting an
+        even share of what is left: large hunks are collapsed to stat lines,
+        binary and generated files are elided, and the git stream is stopped
+        as soon as the next snapshot no longer fits.
+
         Args:
             filepath: Path to the file.
             depth: Number of recent snapshots to include.
+            max_tokens: Approximate output limit in tokens (no limit if None).
+            max_bytes: Output limit in bytes (no limit if None).
 
         Returns:
             A markdown-formatted string containing the file's history.
         """
-        commits = self.recorder.get_history(filepath, max_count=depth)
-        if not commits:
+        budget = OutputBudget.from_limits(max_tokens, max_bytes)
+        head = self.recorder.history.head_sha()
+        return self._cached(
+            ("file", head, filepath, depth, budget.max_bytes),
+            lambda: self._build_file_trajectory(filepath, depth, budget, head),
+        )
+
+    def _build_file_trajectory(
+        self, filepath: str, depth: int, budget: OutputBudget, head: Optional[str]
+    ) -> str:
+        title = f"# Trajectory for {filepath}"
+        budget.reserve(text_size(title) + len(OMITTED_NOTE))
+
+        # (timestamp, message, blob, diff text), newest first.
+        entries: list[tuple[str, str, Optional[str], str]] = []
+        omitted = False
+        large = False
+        if budget.limited and head is not None:
+            # Checked with a cat-file --batch-check lookup before any diff is generated.
+            rel_path = os.path.relpath(
+                os.path.join(self.recorder.project_root, filepath), self.recorder.project_root
+            ).replace(os.sep, "/")
+            large = (self._blob_size(f"{head}:{rel_path}") or 0) > LARGE_FILE_BYTES
+        revisions = self._file_revisions(filepath, depth, head, patches=not large)
+        try:
+            for index, revision in enumerate(revisions):
+                timestamp = datetime.fromtimestamp(revision.timestamp).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                )
+                message = revision.message.strip()
+                header = f"## {timestamp} - {message}"
+
+                if not revision.parent:
+                    # First commit.
+                    diff_text = "[Initial Commit]"
+                elif large:
+                    size = self._blob_size(revision.blob) if revision.blob else None
+                    diff_text = (
+                        f"[Large file: {size} bytes, diff elided]" if size is not None
+                        else "[File deleted]"
+                    )
+                elif budget.limited:
+                    overhead = text_size(header) + ENTRY_OVERHEAD + REVERT_NOTE_RESERVE
+                    share = budget.share(depth - index) - overhead
+                    diff_text = render_patch(revision.patch, share, filepath)
+                else:
+                    diff_text = describe_pointer_patch(revision.patch) or revision.patch
+
+                size = text_size(header) + text_size(diff_text)
+                if not budget.take(size + ENTRY_OVERHEAD + REVERT_NOTE_RESERVE):
+                    omitted = True
+                    break
+                entries.append((timestamp, message, revision.blob, diff_text))
+        except Exception as e:
+            logger.error(f"Failed to fetch trajectory for {filepath}: {e}")
+            return f"Error fetching trajectory for {filepath}: {e}"
+        finally:
+            # Stops git once the budget is spent.
+            revisions.close()
+
+        if not entries:
+            if omitted:
+                return f"{title}\n\n{OMITTED_NOTE.strip()}"
             return f"No trajectory found for {filepath}."
 
-        trajectory = [f"# Trajectory for {filepath}"]
-
-        # Normalize filepath for tree access (must be relative to project root).
-        if os.path.isabs(filepath):
-            try:
-                rel_filepath = os.path.relpath(filepath, self.recorder.project_root)
-            except ValueError:
-                rel_filepath = filepath  # Fallback
-        else:
-            rel_filepath = filepath
+        trajectory = [title]
+        if omitted:
+            trajectory.append(OMITTED_NOTE.strip())
 
-        # Track content hashes to detect reverts.
-        # Map: content_hash -> (timestamp, message)
-        seen_states = {}
+        # Track blob shas to detect reverts: identical content has the same blob.
+        # Map: blob sha -> timestamp
+        seen_states: dict[str, str] = {}
 
         # Process from oldest to newest.
-        for commit in reversed(commits):
-            timestamp = datetime.fromtimestamp(commit.committed_date).strftime(
-                "%Y-%m-%d %H:%M:%S"
-            )
-            message = commit.message.strip()
-
-            # Calculate content hash.
-            try:
-                # gitpython: get blob for file at this commit.
-                blob = commit.tree / rel_filepath
-                content = blob.data_stream.read()
-                import hashlib
-
-                content_hash = hashlib.md5(content).hexdigest()
-            except KeyError:
-                # File might not exist in this commit (e.g. deleted).
-                content_hash = None
-            except Exception as e:
-                logger.warning(
-                    f"Failed to hash content for {filepath} at {commit.hexsha}: {e}"
-                )
-                content_hash = None
-
+        for timestamp, message, blob, diff_text in reversed(entries):
             revert_annotation = ""
-            if content_hash and content_hash in seen_states:
-                prev_ts, prev_msg = seen_states[content_hash]
+            if blob and blob in seen_states:
                 revert_annotation = (
-                    f" **[Revert Detected]** (Matches state from {prev_ts})"
+                    f" **[Revert Detected]** (Matches state from {seen_states[blob]})"
                 )
-
-            if content_hash:
-                seen_states[content_hash] = (timestamp, message)
-
-            # Get diff.
-            if commit.parents:
-                parent = commit.parents[0]
-                diffs = parent.diff(commit, paths=filepath, create_patch=True)
-                diff_text = ""
-                for diff in diffs:
-                    if diff.diff:
-                        # Ensure diff is bytes before decoding.
-                        if isinstance(diff.diff, bytes):
-                            diff_text = diff.diff.decode("utf-8")
-                        else:
-                            diff_text = str(diff.diff)
-                        break
-            else:
-                # First commit.
-                diff_text = "[Initial Commit]"
+            if blob:
+                seen_states[blob] = timestamp
 
             trajectory.append(f"## {timestamp} - {message}{revert_annotation}")
             trajectory.append(f"```diff\n{diff_text}\n```")
 
         return "\n\n".join(trajectory)
 
-    def get_global_trajectory(self, limit: int = 20, since_consolidate: bool = False) -> str:
+    @METRICS.timed("trajectory_seconds", method="get_global_trajectory")
+    def get_global_trajectory(
+        self,
+        limit: int = 20,
+        since_consolidate: bool = False,
+        max_tokens: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> str:
         """Generates a global trajectory summary.
 
         Args:
             limit: Maximum number of commits to retrieve (default: 20).
             since_consolidate: If True, retrieves all commits since the last consolidation.
                 This overrides the 'limit' argument.
+            max_tokens: Approximate output limit in tokens (no limit if None).
+            max_bytes: Output limit in bytes (no limit if None).
 
         Returns:
             A markdown-formatted summary of global activity.
         """
+        budget = OutputBudget.from_limits(max_tokens, max_bytes)
+        head = self.recorder.history.head_sha()
+        if head is None:
+            return "No history available"
+        return self._cached(
+            ("global", head, limit, since_consolidate, budget.max_bytes),
+            lambda: self._build_global_trajectory(limit, since_consolidate, budget),
+        )
+
+    def _build_global_trajectory(
+        self, limit: int, since_consolidate: bool, budget: OutputBudget
+    ) -> str:
         try:
-            # Fetch commits. We fetch a bit more than limit if checking for consolidation,
-            # but for simplicity in this iteration, we'll iterate from HEAD.
-            # If since_consolidate is True, we need to iterate until we find a consolidation.
-            
-            commits = []
+            history = self.recorder.history
+            history.sync()
+
             if since_consolidate:
-                # Iterate commits until we find a consolidation or hit a reasonable safety limit (e.g. 1000)
-                for commit in self.recorder.repo.iter_commits(max_count=1000):
-                    message = str(commit.message)
-                    if message.startswith("[CONSOLIDATE]") or message.startswith("[CHECKPOINT]"):
-                        # Backward compatibility: also check for [CHECKPOINT]
+                # Walk back to the last consolidation, with a safety limit of 1000.
+                rows = []
+                for row in history.chain(1000):
+                    if row.kind == "CONSOLIDATE":
                         break
-                    commits.append(commit)
+                    rows.append(row)
             else:
-                commits = list(self.recorder.repo.iter_commits(max_count=limit))
-
+                rows = history.chain(limit)
+            files = history.files([row.sha for row in rows])
         except Exception as e:
-            # Check for empty repo error (gitpython usually raises ValueError or GitCommandError)
-            error_msg = str(e)
-            # More specific checks for empty repository states
-            if "Reference at 'refs/heads/master' does not exist" in error_msg:
-                 return "No history available"
-
-            # Check for GitCommandError that indicates no commits (git log fails)
-            if hasattr(e, 'stderr') and "does not have any commits yet" in str(e.stderr):
-                 return "No history available"
-
-            # Check for BadObject (happens when HEAD is invalid)
-            if "BadObject" in error_msg and "HEAD" in error_msg:
-                 return "No history available"
-
             logger.error(f"Failed to fetch global trajectory: {e}")
             return f"Error fetching global trajectory: {e}"
 
-        if not commits:
+        if not rows:
             return "No global activity found."
 
+        budget.reserve(len(GLOBAL_TITLE_RESERVE) + len(OMITTED_NOTE))
+
+        # Render newest first so the budget goes to the most recent activity.
+        lines = []
+        for index, row in enumerate(rows):
+            timestamp = datetime.fromtimestamp(row.timestamp).strftime("%H:%M:%S")
+            message = row.message.strip()
+            prefix = f"- **{timestamp}**: {message} (Files: `"
+            share = budget.share(len(rows) - index) - text_size(prefix) - 2
+            line = f"{prefix}{_join_within(files[row.sha], share)}`)"
+            if not budget.take(text_size(line) + 1):
+                break
+            lines.append(line)
+        omitted = len(rows) - len(lines)
+
         trajectory = []
         if since_consolidate:
             trajectory.append("# Global Trajectory (Since Last Consolidation)")
         else:
-            trajectory.append(f"# Global Trajectory (Last {len(commits)} snapshots)")
-
-        for commit in reversed(commits):
-            timestamp = datetime.fromtimestamp(commit.committed_date).strftime(
-                "%H:%M:%S"
-            )
-            message = commit.message.strip()
-            files_changed = [str(f) for f in commit.stats.files.keys()]
-            files_str = ", ".join(files_changed)
-
-            trajectory.append(f"- **{timestamp}**: {message} (Files: `{files_str}`)")
+            trajectory.append(f"# Global Trajectory (Last {len(lines)} snapshots)")
+        if omitted:
+            trajectory.append(OMITTED_NOTE.strip())
+        trajectory.extend(reversed(lines))
 
         return "\n".join(trajectory)
 
+    @METRICS.timed("trajectory_seconds", method="get_session_summary")
     def get_session_summary(self) -> str:
         """Identifies session gaps and summarizes the last session.
 
         Returns:
             A markdown-formatted summary of the last session's activity.
         """
-        # Optimization: Fetch only timestamps first to find the gap efficiently.
-        # Look back up to 1000 commits to find a session boundary.
-        try:
-            # %ct = committer timestamp, unix epoch.
-            timestamps_output = self.recorder.repo.git.log("-n", "1000", "--format=%ct")
-            if not timestamps_output:
-                return "No session history found."
-            
-            timestamps = [int(ts) for ts in timestamps_output.splitlines()]
-        except Exception as e:
-            error_msg = str(e)
-            if "does not have any commits yet" in error_msg:
-                return "No history available"
-
-            logger.error(f"Failed to fetch commit timestamps: {e}")
-            return f"Error analyzing session history: {e}"
-
-        session_gap_threshold = 3600  # 1 hour
-        commit_count = len(timestamps)
-        last_session_count = commit_count # Default to all if no gap found
+        head = self.recorder.history.head_sha()
+        if head is None:
+            return "No history available"
+        return self._cached(("session", head), self._build_session_summary)
 
-        for i in range(commit_count - 1):
-            current_time = timestamps[i]
-            prev_time = timestamps[i + 1]
-
-            if (current_time - prev_time) > session_gap_threshold:
-                # Gap found at index i.
-                # The session includes commits 0 to i (inclusive), so count is i + 1.
-                last_session_count = i + 1
-                break
-
-        # Now fetch the actual commit objects for the identified session.
+    def _build_session_summary(self) -> str:
         try:
-            last_session_commits = list(self.recorder.repo.iter_commits(max_count=last_session_count))
+            session = self.recorder.history.session()
         except Exception as e:
-             return f"Error fetching session commits: {e}"
-
-        if not last_session_commits:
-             return "No session history found."
+            logger.error(f"Failed to read the session model: {e}")
+            return f"Error analyzing session history: {e}"
 
-        # Summarize last session
-        start_time = datetime.fromtimestamp(
-            last_session_commits[-1].committed_date
-        ).strftime("%Y-%m-%d %H:%M:%S")
-        end_time = datetime.fromtimestamp(
-            last_session_commits[0].committed_date
-        ).strftime("%H:%M:%S")
+        if session is None:
+            return "No session history found."
 
-        files_touched: set[str] = set()
-        for c in last_session_commits:
-            # Manually iterate to avoid type checker confusion with GitPython's dict_keys.
-            for file_path in c.stats.files.keys():
-                files_touched.add(str(file_path))
+        start_time = datetime.fromtimestamp(session.start).strftime("%Y-%m-%d %H:%M:%S")
+        end_time = datetime.fromtimestamp(session.end).strftime("%H:%M:%S")
 
         summary = ["# Last Session Summary"]
         summary.append(f"**Time:** {start_time} to {end_time}")
-        summary.append(f"**Files Modified:** {', '.join(files_touched)}")
-        summary.append(f"**Commit Count:** {len(last_session_commits)}")
+        summary.append(f"**Files Modified:** {', '.join(session.files)}")
+        if session.intents:
+            summary.append(f"**Intents:** {', '.join(session.intents)}")
+        summary.append(f"**Commit Count:** {session.commits}")
 
         return "\n".join(summary)
@@ -1,80 +1,373 @@
 # SPDX-License-Identifier: MIT
 import logging
+import os
+from typing import Optional
 from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver, ObservedWatch
 from watchdog.events import FileSystemEventHandler
-from threading import Timer
+from .event_source import SourceObserver
+from .metrics import METRICS
 from .recorder import Recorder
+from .scheduler import SnapshotScheduler
 
 logger = logging.getLogger(__name__)
 
+# "watchdog" uses the platform's native watchdog observer, "stat" scans
+# directory mtimes (for network filesystems and bind mounts that lose
+# inotify events) and "inotify" reads inotify directly through one fd.
+WATCH_BACKENDS = ("watchdog", "stat", "inotify")
+
+# watchdog's native observers run one emitter thread (and, on Linux, one
+# inotify instance) per watch, so a project is split into at most this many
+# watches; past it, one recursive watch covers the project and ignored paths
+# are dropped by the handler. Observers serving every watch from one thread
+# have no limit.
+DEFAULT_MAX_WATCHES = 32
+
+
+def create_observer(backend: str = "watchdog") -> BaseObserver:
+    """Returns an unstarted observer for backend."""
+    if backend == "watchdog":
+        return Observer()
+    if backend == "stat":
+        from .stat_scanner import StatScanObserver
+
+        return StatScanObserver()
+    if backend == "inotify":
+        from .inotify_direct import InotifyObserver
+
+        return InotifyObserver()
+    raise ValueError(f"Unknown watch backend: {backend}")
+
 
 class DebouncedEventHandler(FileSystemEventHandler):
     """Handles file system events with debouncing to prevent excessive snapshots.
 
+    Changes are handed to a SnapshotScheduler, which waits until each file has
+    been quiet for a delay adapted to its write frequency (between
+    `min_debounce` and `debounce_interval` seconds) and records settled files
+    in batches from a single worker thread. Creations, deletions and moves are
+    recorded too; both sides of a move go into the same snapshot.
+
     Attributes:
         recorder: The Recorder instance to use for snapshots.
-        debounce_interval: Time in seconds to wait before processing a change.
-        timers: Dictionary of active timers for each file.
+        scheduler: The SnapshotScheduler debouncing and recording changes.
     """
-    def __init__(self, recorder: Recorder, debounce_interval: float = 2.0):
+    def __init__(
+        self,
+        recorder: Recorder,
+        debounce_interval: float = 2.0,
+        max_batch_size: int = 100,
+        max_latency: float = 10.0,
+        scheduler: Optional[SnapshotScheduler] = None,
+        min_debounce: float = 0.5,
+    ):
         self.recorder = recorder
-        self.debounce_interval = debounce_interval
-        self.timers = {}
+        self._owns_scheduler = scheduler is None
+        if scheduler is None:
+            scheduler = SnapshotScheduler(
+                debounce_interval=debounce_interval,
+                max_batch_size=max_batch_size,
+                max_latency=max_latency,
+                min_debounce=min_debounce,
+            )
+            scheduler.start()
+        self.scheduler = scheduler
 
     def on_modified(self, event):
         if event.is_directory:
             return
-
         filepath = event.src_path
-        # Ignore .git directory.
-        if ".git" in filepath:
-            return
+        matcher = self.recorder.ignore_matcher
+        if matcher.is_ignore_file(filepath):
+            matcher.invalidate(filepath)
+        self._touch([(filepath, False)])
 
-        # Check if ignored by git.
-        try:
-            if self.recorder.repo.ignored(filepath):
-                logger.debug(f"Ignoring {filepath} (git ignored)")
-                return
-        except Exception as e:
-            logger.warning(f"Failed to check ignore status for {filepath}: {e}")
+    def on_created(self, event):
+        # A directory moved in from outside the project arrives as a single
+        # created event; its files are listed when the snapshot is taken.
+        self._touch([(event.src_path, event.is_directory)])
 
-        if filepath in self.timers:
-            self.timers[filepath].cancel()
+    def on_deleted(self, event):
+        # Removing a directory removes every recorded file below it.
+        self._touch([(event.src_path, event.is_directory)])
 
-        timer = Timer(self.debounce_interval, self._snapshot, [filepath])
-        self.timers[filepath] = timer
-        timer.start()
+    def on_moved(self, event):
+        """Records a rename, or a plain modification for an atomic save.
 
-    def _snapshot(self, filepath):
-        try:
-            self.recorder.create_snapshot(filepath)
-            if filepath in self.timers:
-                del self.timers[filepath]
-        except Exception as e:
-            logger.error(f"Error snapshotting {filepath}: {e}")
+        Editors that save by writing a temporary file and renaming it over
+        the original produce a move from a path that was never recorded; it
+        contributes nothing to the snapshot, which then only modifies the
+        destination. A move of a recorded file stages both sides in the same
+        snapshot, so git's rename detection (and `log --follow`) sees a rename.
+        """
+        self._touch([(event.src_path, event.is_directory), (event.dest_path, event.is_directory)])
+
+    def _touch(self, paths: list[tuple[str, bool]]):
+        """Schedules the paths that are not ignored, in the same snapshot."""
+        matcher = self.recorder.ignore_matcher
+        accepted = []
+        for path, is_dir in paths:
+            METRICS.increment("watcher_events_total", result="received")
+            # Check if ignored by git (.git and .trajectory are always ignored).
+            try:
+                if matcher.is_ignored(path, is_dir=is_dir):
+                    logger.debug(f"Ignoring {path} (git ignored)")
+                    METRICS.increment("watcher_events_total", result="ignored")
+                    continue
+            except Exception as e:
+                logger.warning(f"Failed to check ignore status for {path}: {e}")
+            accepted.append(path)
+        if accepted:
+            self.scheduler.touch_many(self.recorder, accepted)
+
+    def flush(self):
+        """Records all pending changes immediately."""
+        self.scheduler.flush()
+
+    def close(self):
+        """Records pending changes and stops the scheduler if this handler owns it."""
+        if self._owns_scheduler:
+            self.scheduler.stop()
+        else:
+            self.scheduler.flush()
+
+
+class WatchScopeHandler(FileSystemEventHandler):
+    """Keeps the set of watched directories in sync with the project tree.
+
+    Attributes:
+        watcher: The Watcher whose watches are adjusted.
+    """
+    def __init__(self, watcher: "Watcher"):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if event.is_directory:
+            self.watcher.add_directory(event.src_path)
+        else:
+            self._check_ignore_file(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._check_ignore_file(event.src_path)
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self.watcher.remove_directory(event.src_path)
+        else:
+            self._check_ignore_file(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            self.watcher.remove_directory(event.src_path)
+            self.watcher.add_directory(event.dest_path)
+        else:
+            self._check_ignore_file(event.src_path)
+            self._check_ignore_file(event.dest_path)
+
+    def _check_ignore_file(self, path: str):
+        matcher = self.watcher.recorder.ignore_matcher
+        if matcher.is_ignore_file(path):
+            matcher.invalidate(path)
+            self.watcher.refresh()
 
 
 class Watcher:
     """Monitors the project directory for file changes.
 
+    Instead of one recursive watch on the project root, the tree is walked once
+    and only directories that are not ignored are registered: a directory with
+    no ignored directory below it gets a single recursive watch, any other
+    directory gets a non-recursive watch and its children are planned in turn.
+    Ignored trees such as node_modules, .venv or .trajectory never get a watch
+    descriptor. Watches follow directories as they are created, removed or
+    become ignored. If the plan needs more than `max_watches` watches, the
+    watcher falls back to a single recursive watch on the project root for
+    as long as it runs; the handler still drops events for ignored paths.
+
+    Several watchers can share one observer and one snapshot scheduler; a
+    watcher only starts and stops the ones it created itself. Without an
+    observer, one is created for `backend` (see WATCH_BACKENDS).
+
     Attributes:
         path: The root directory to watch.
         recorder: The Recorder instance to handle snapshots.
         observer: The watchdog Observer instance.
         handler: The event handler for file changes.
+        watches: Watched directories, mapped to their watchdog watch.
+        max_watches: Maximum number of watches, or None for no limit. Defaults
+            to DEFAULT_MAX_WATCHES for watchdog's native observers and to no
+            limit for the single-threaded backends.
+        collapsed: True once the watcher fell back to one recursive watch.
     """
-    def __init__(self, path: str, recorder: Recorder):
-        self.path = path
+    def __init__(
+        self,
+        path: str,
+        recorder: Recorder,
+        observer: Optional[BaseObserver] = None,
+        scheduler: Optional[SnapshotScheduler] = None,
+        backend: str = "watchdog",
+        max_watches: Optional[int] = DEFAULT_MAX_WATCHES,
+    ):
+        self.path = os.path.abspath(path)
         self.recorder = recorder
-        self.observer = Observer()
-        self.handler = DebouncedEventHandler(recorder)
+        self._owns_observer = observer is None
+        self.observer = observer if observer is not None else create_observer(backend)
+        if isinstance(self.observer, SourceObserver) and max_watches == DEFAULT_MAX_WATCHES:
+            max_watches = None
+        self.max_watches = max_watches
+        self.collapsed = False
+        self.handler = DebouncedEventHandler(recorder, scheduler=scheduler)
+        self.scope_handler = WatchScopeHandler(self)
+        # Only mutated from the observer's dispatch thread once started.
+        self.watches: dict[str, ObservedWatch] = {}
 
     def start(self):
-        self.observer.schedule(self.handler, self.path, recursive=True)
-        self.observer.start()
-        logger.info(f"Started watching {self.path}")
+        plan = self.plan_watches(self.path)
+        if self._over_limit(len(plan)):
+            self._collapse(len(plan))
+        else:
+            for directory, recursive in plan.items():
+                self._schedule(directory, recursive)
+        if self._owns_observer:
+            self.observer.start()
+        logger.info(f"Started watching {self.path} ({len(self.watches)} watches)")
 
     def stop(self):
-        self.observer.stop()
-        self.observer.join()
+        if self._owns_observer:
+            self.observer.stop()
+            self.observer.join()
+        else:
+            for directory in list(self.watches):
+                self._unschedule(directory)
+        self.handler.close()
         logger.info("Stopped watcher")
+
+    def plan_watches(self, root: str) -> dict[str, bool]:
+        """Walks root once and returns the directories to watch.
+
+        Returns:
+            A mapping of directory path to whether it is watched recursively.
+        """
+        plan, _ = self._plan_directory(root)
+        return plan
+
+    def _plan_directory(self, directory: str) -> tuple[dict[str, bool], bool]:
+        matcher = self.recorder.ignore_matcher
+        children: list[str] = []
+        clean = True
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.is_dir(follow_symlinks=False):
+                        continue
+                    if matcher.is_ignored(entry.path, is_dir=True):
+                        clean = False
+                    else:
+                        children.append(entry.path)
+        except OSError as e:
+            logger.warning(f"Failed to scan {directory}: {e}")
+            return {}, False
+
+        plan: dict[str, bool] = {}
+        for child in children:
+            child_plan, child_clean = self._plan_directory(child)
+            clean = clean and child_clean
+            plan.update(child_plan)
+
+        if clean:
+            return {directory: True}, True
+        plan[directory] = False
+        return plan, False
+
+    def refresh(self, root: Optional[str] = None):
+        """Re-plans the watches below root (the whole project by default)."""
+        if self.collapsed:
+            return
+        root = root or self.path
+        plan = self.plan_watches(root)
+        kept = sum(1 for directory in self.watches if not _is_within(directory, root))
+        if self._over_limit(kept + len(plan)):
+            self._collapse(kept + len(plan))
+            return
+        for directory in list(self.watches):
+            if _is_within(directory, root) and (
+                directory not in plan or plan[directory] != self.watches[directory].is_recursive
+            ):
+                self._unschedule(directory)
+        for directory, recursive in plan.items():
+            if directory not in self.watches:
+                self._schedule(directory, recursive)
+
+    def add_directory(self, directory: str):
+        """Starts watching a newly created directory if it is not already covered."""
+        if self.collapsed or not _is_within(directory, self.path):
+            return
+        owner = self._owning_watch(directory)
+        if self.recorder.ignore_matcher.is_ignored(directory, is_dir=True):
+            # A recursive watch would descend into it, so split that watch.
+            if owner and self.watches[owner].is_recursive:
+                self.refresh(owner)
+            return
+        if owner and self.watches[owner].is_recursive:
+            return
+        plan = {
+            path: recursive
+            for path, recursive in self.plan_watches(directory).items()
+            if path not in self.watches
+        }
+        if self._over_limit(len(self.watches) + len(plan)):
+            self._collapse(len(self.watches) + len(plan))
+            return
+        for path, recursive in plan.items():
+            self._schedule(path, recursive)
+
+    def remove_directory(self, directory: str):
+        """Stops watching a removed directory and everything below it."""
+        for path in list(self.watches):
+            if _is_within(path, directory):
+                self._unschedule(path)
+
+    def _over_limit(self, count: int) -> bool:
+        return self.max_watches is not None and count > self.max_watches
+
+    def _collapse(self, needed: int):
+        """Replaces every watch with one recursive watch on the project root."""
+        logger.info(
+            f"{self.path} needs {needed} watches (limit {self.max_watches}); "
+            "watching it recursively instead"
+        )
+        for directory in list(self.watches):
+            self._unschedule(directory)
+        self.collapsed = True
+        self._schedule(self.path, True)
+
+    def _owning_watch(self, path: str) -> Optional[str]:
+        parent = os.path.dirname(path)
+        while _is_within(parent, self.path):
+            if parent in self.watches:
+                return parent
+            if parent == self.path:
+                break
+            parent = os.path.dirname(parent)
+        return None
+
+    def _schedule(self, directory: str, recursive: bool):
+        try:
+            watch = self.observer.schedule(self.handler, directory, recursive=recursive)
+            self.observer.add_handler_for_watch(self.scope_handler, watch)
+            self.watches[directory] = watch
+        except OSError as e:
+            logger.warning(f"Failed to watch {directory}: {e}")
+
+    def _unschedule(self, directory: str):
+        watch = self.watches.pop(directory)
+        try:
+            self.observer.unschedule(watch)
+        except KeyError:
+            pass
+
+
+def _is_within(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
@@ -45,3 +45,11 @@ def recorder(temp_project_dir):
 def trajectory(recorder):
     """Returns a Trajectory instance."""
     return Trajectory(recorder)
+
+@pytest.fixture
+def object_recorder(temp_project_dir):
+    """Returns a Recorder that writes snapshots with the in-process object engine."""
+    rec = Recorder(temp_project_dir, snapshot_engine="objects")
+    rec.repo.git.config("user.name", "Test User")
+    rec.repo.git.config("user.email", "test@example.com")
+    return rec
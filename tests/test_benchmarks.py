@@ -0,0 +1,30 @@
+# SPDX-License-Identifier: MIT
+import importlib.util
+import json
+import os
+
+RUNNER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks", "run.py")
+
+
+def _load_runner():
+    spec = importlib.util.spec_from_file_location("benchmark_runner", RUNNER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_benchmark_runner_smoke(tmp_path, capsys):
+    """Test that a tiny benchmark run writes comparable results."""
+    runner = _load_runner()
+    output = tmp_path / "results.json"
+    args = ["--files", "30", "--snapshots", "60", "--large-file-mb", "0", "--repeat", "1"]
+
+    assert runner.main([*args, "--output", str(output)]) == 0
+
+    report = json.loads(output.read_text())
+    assert report["params"]["snapshots"] == 60
+    assert {"create_snapshot_cli", "consolidate_20_snapshots", "watcher_save_to_commit"} <= set(
+        report["results"]
+    )
+    assert runner.main(["--compare", str(output), str(output)]) == 0
+    assert "REGRESSION" not in capsys.readouterr().out
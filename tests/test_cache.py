@@ -0,0 +1,94 @@
+# SPDX-License-Identifier: MIT
+import os
+
+from code_trajectory.cache import LRUCache
+
+
+def test_lru_cache_evicts_by_size():
+    """Test that the least recently used entries are evicted first."""
+    cache = LRUCache(max_bytes=10)
+    cache.put("a", "A", 4)
+    cache.put("b", "B", 4)
+    assert cache.get("a") == "A"
+    cache.put("c", "C", 4)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert cache.size == 8
+
+    cache.put("huge", "H", 11)
+    assert cache.get("huge") is None
+    assert len(cache) == 2
+
+
+def test_lru_cache_discard_where():
+    """Test dropping entries by key."""
+    cache = LRUCache()
+    cache.put(("file", 1), "x", 1)
+    cache.put(("revisions", 1), "y", 1)
+    cache.discard_where(lambda key: key[0] == "file")
+    assert cache.get(("file", 1)) is None
+    assert cache.get(("revisions", 1)) == "y"
+
+
+def _snapshot(recorder, path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    recorder.create_snapshot(path)
+
+
+def test_repeat_queries_hit_cache(recorder, trajectory, temp_project_dir, monkeypatch):
+    """Test that a repeated query does not read the history again."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    _snapshot(recorder, test_file, "v1\n")
+    first = trajectory.get_file_trajectory(test_file)
+    global_first = trajectory.get_global_trajectory()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("history must not be read")
+
+    monkeypatch.setattr(recorder, "iter_file_history", fail)
+    monkeypatch.setattr(recorder.history, "sync", fail)
+    assert trajectory.get_file_trajectory(test_file) == first
+    assert trajectory.get_global_trajectory() == global_first
+
+
+def test_snapshot_reads_only_new_commits(recorder, trajectory, temp_project_dir, monkeypatch):
+    """Test that after a snapshot only the new commits are read."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    _snapshot(recorder, test_file, "v1\n")
+    _snapshot(recorder, test_file, "v2\n")
+    trajectory.get_file_trajectory(test_file, depth=2)
+    old_head = recorder.repo.head.commit.hexsha
+
+    ranges = []
+    original = recorder.iter_file_history
+
+    def spy(*args, **kwargs):
+        ranges.append(kwargs.get("rev_range"))
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(recorder, "iter_file_history", spy)
+    _snapshot(recorder, test_file, "v3\n")
+    traj = trajectory.get_file_trajectory(test_file, depth=2)
+
+    assert ranges == [f"{old_head}..{recorder.repo.head.commit.hexsha}"]
+    assert traj.count("## ") == 2
+    assert "+v3" in traj and "+v2" in traj
+    assert "[Initial Commit]" not in traj
+
+
+def test_consolidate_clears_cache(recorder, trajectory, temp_project_dir):
+    """Test that rewriting history drops cached results."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    _snapshot(recorder, test_file, "v1\n")
+    _snapshot(recorder, test_file, "v2\n")
+    trajectory.get_file_trajectory(test_file)
+
+    recorder.consolidate("Done")
+
+    assert len(trajectory.cache) == 0
+    traj = trajectory.get_file_trajectory(test_file)
+    assert traj.count("## ") == 1
+    assert "[CONSOLIDATE]" in traj
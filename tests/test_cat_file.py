@@ -0,0 +1,112 @@
+# SPDX-License-Identifier: MIT
+import os
+import threading
+
+import pytest
+from gitdb.exc import BadObject
+
+from code_trajectory import trajectory as trajectory_module
+
+
+def _snapshot(recorder, path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    recorder.create_snapshot(path)
+
+
+def test_pool_reads_objects(recorder, temp_project_dir):
+    """Test info and read requests against the shadow repository."""
+    _snapshot(recorder, os.path.join(temp_project_dir, "test.py"), "hello")
+    pool = recorder.objects
+
+    sha, typename, size = pool.info("HEAD:test.py")
+    assert (typename, size) == ("blob", 5)
+    assert pool.read(sha) == (sha, "blob", b"hello")
+
+    with pytest.raises(BadObject):
+        pool.info("HEAD:missing.py")
+    # A missing object does not break the process.
+    assert pool.read("HEAD:test.py")[2] == b"hello"
+
+
+def test_pool_handles_paths_with_spaces(recorder, temp_project_dir):
+    """Test that a missing path with a space is reported as a missing object."""
+    _snapshot(recorder, os.path.join(temp_project_dir, "my file.py"), "spaced")
+    pool = recorder.objects
+
+    assert pool.read("HEAD:my file.py")[1:] == ("blob", b"spaced")
+    with pytest.raises(BadObject):
+        pool.info("HEAD:other file.py")
+    with pytest.raises(BadObject):
+        pool.info("HEAD:a b c d.py")
+    assert pool.info("HEAD:my file.py")[1:] == ("blob", 6)
+
+
+def test_budgeted_trajectory_of_missing_path_with_space(recorder, trajectory, temp_project_dir):
+    """Test that a budgeted trajectory of an unrecorded path does not raise."""
+    _snapshot(recorder, os.path.join(temp_project_dir, "test.py"), "x")
+
+    traj = trajectory.get_file_trajectory("gone file.txt", max_tokens=1000)
+    assert "gone file.txt" in traj
+
+
+def test_pool_is_thread_safe(recorder, temp_project_dir):
+    """Test that concurrent readers get their own replies."""
+    paths = []
+    for i in range(8):
+        path = os.path.join(temp_project_dir, f"f{i}.py")
+        with open(path, "w") as f:
+            f.write(f"content {i}" * (i + 1))
+        paths.append(path)
+    recorder.create_batch_snapshot(paths)
+
+    errors = []
+
+    def read(i):
+        for _ in range(20):
+            data = recorder.objects.read(f"HEAD:f{i}.py")[2]
+            if data != f"content {i}".encode() * (i + 1):
+                errors.append(i)
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert recorder.objects._count["--batch"] <= recorder.objects.size
+
+
+def test_pool_restarts_after_close(recorder, temp_project_dir):
+    """Test that a closed pool starts new processes on demand."""
+    _snapshot(recorder, os.path.join(temp_project_dir, "test.py"), "v1")
+    recorder.objects.read("HEAD:test.py")
+    recorder.objects.close()
+    assert recorder.objects.read("HEAD:test.py")[2] == b"v1"
+
+
+def test_gitpython_reads_use_pool(recorder, temp_project_dir, monkeypatch):
+    """Test that GitPython object access is served by the pool."""
+    _snapshot(recorder, os.path.join(temp_project_dir, "test.py"), "pooled")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("GitPython's own cat-file must not be used")
+
+    monkeypatch.setattr(type(recorder.repo.git), "stream_object_data", fail)
+    monkeypatch.setattr(type(recorder.repo.git), "get_object_header", fail)
+    commit = next(recorder.repo.iter_commits())
+    assert (commit.tree / "test.py").data_stream.read() == b"pooled"
+
+
+def test_large_file_diff_is_not_generated(recorder, trajectory, temp_project_dir, monkeypatch):
+    """Test that a budgeted trajectory of a large file skips diff generation."""
+    monkeypatch.setattr(trajectory_module, "LARGE_FILE_BYTES", 100)
+    test_file = os.path.join(temp_project_dir, "data.txt")
+    _snapshot(recorder, test_file, "x" * 50)
+    _snapshot(recorder, test_file, "y" * 200)
+
+    traj = trajectory.get_file_trajectory(test_file, max_tokens=1000)
+
+    assert "[Large file: 200 bytes, diff elided]" in traj
+    assert "yyyy" not in traj
@@ -0,0 +1,112 @@
+# SPDX-License-Identifier: MIT
+import os
+import time
+
+import pytest
+
+from code_trajectory.metrics import METRICS
+
+
+def _write(path, content, age=60):
+    with open(path, "w") as f:
+        f.write(content)
+    # Old enough that the scan trusts its hash.
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+
+
+def _head_files(recorder):
+    return recorder.repo.git.ls_tree("-r", "--name-only", "--full-tree", "HEAD").splitlines()
+
+
+@pytest.mark.parametrize("engine", ["recorder", "object_recorder"])
+def test_catch_up_records_offline_changes(request, engine, temp_project_dir):
+    """Test that edits, deletions and new files are recorded as one snapshot."""
+    recorder = request.getfixturevalue(engine)
+    paths = {name: os.path.join(temp_project_dir, name) for name in ("a.py", "b.py", "c.py")}
+    _write(paths["a.py"], "a1")
+    _write(paths["b.py"], "b1")
+    recorder.create_batch_snapshot([paths["a.py"], paths["b.py"]])
+    _write(os.path.join(temp_project_dir, "untracked.py"), "old")
+
+    # The first scan only builds the stat cache.
+    assert recorder.catch_up() is None
+    head = recorder.repo.head.commit
+
+    _write(paths["a.py"], "a2", age=30)
+    os.remove(paths["b.py"])
+    _write(paths["c.py"], "c1", age=30)
+    message = recorder.catch_up()
+
+    assert message is not None and "Snapshot of 3 files" in message
+    assert recorder.repo.head.commit.parents == (head,)
+    assert sorted(_head_files(recorder)) == ["a.py", "c.py"]
+    assert recorder.repo.git.show("HEAD:a.py") == "a2"
+
+
+def test_catch_up_hashes_only_changed_files(recorder, temp_project_dir):
+    """Test that files with an unchanged stat are not rehashed."""
+    paths = [os.path.join(temp_project_dir, f"f{i}.py") for i in range(5)]
+    for i, path in enumerate(paths):
+        _write(path, f"v{i}")
+    recorder.create_batch_snapshot(paths)
+    recorder.catch_up()
+
+    METRICS.reset()
+    assert recorder.catch_up() is None
+    assert METRICS.counter("catch_up_files_hashed_total") == 0
+
+    # Same size and content, new mtime: hashed but not recorded.
+    _write(paths[0], "v0", age=30)
+    _write(paths[1], "xx", age=30)
+    assert "Snapshot of" in recorder.catch_up()
+    assert METRICS.counter("catch_up_files_hashed_total") == 2
+    assert recorder.repo.git.show("HEAD:f1.py") == "xx"
+
+
+def test_catch_up_skips_new_projects(recorder, temp_project_dir):
+    """Test that a project without snapshots is not swept into history."""
+    _write(os.path.join(temp_project_dir, "main.py"), "print()")
+
+    assert recorder.catch_up() is None
+    assert not recorder.repo.head.is_valid()
+
+
+def test_failed_catch_up_is_retried(recorder, temp_project_dir, monkeypatch):
+    """Test that files of a catch-up snapshot that failed are found again."""
+    first = os.path.join(temp_project_dir, "first.py")
+    _write(first, "v1")
+    recorder.create_batch_snapshot([first])
+    recorder.catch_up()
+    head = recorder.repo.head.commit
+
+    _write(first, "v2", age=30)
+    _write(os.path.join(temp_project_dir, "new.py"), "new", age=30)
+    with monkeypatch.context() as patch:
+        patch.setattr(recorder, "_record_batch", lambda filepaths: None)
+        assert recorder.catch_up() is None
+    assert recorder.repo.head.commit == head
+
+    message = recorder.catch_up()
+    assert message is not None and "Snapshot of 2 files" in message
+    assert sorted(_head_files(recorder)) == ["first.py", "new.py"]
+
+
+def test_catch_up_splits_large_batches(recorder, temp_project_dir, monkeypatch):
+    """Test that a catch-up of more paths than fit on one command line is recorded."""
+    from code_trajectory import recorder as recorder_module
+
+    first = os.path.join(temp_project_dir, "first.py")
+    _write(first, "v1")
+    recorder.create_batch_snapshot([first])
+    recorder.catch_up()
+
+    # A few paths per git call stand in for a batch beyond ARG_MAX.
+    monkeypatch.setattr(recorder_module, "ARGV_CHUNK_BYTES", 200)
+    for i in range(30):
+        _write(os.path.join(temp_project_dir, f"new{i:02}.py"), f"n{i}", age=30)
+    message = recorder.catch_up()
+
+    assert message is not None and "Snapshot of 30 files" in message
+    assert len(_head_files(recorder)) == 31
+    assert recorder.repo.head.commit.parents[0].parents == ()
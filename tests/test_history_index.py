@@ -0,0 +1,195 @@
+# SPDX-License-Identifier: MIT
+import os
+
+from code_trajectory.recorder import Recorder
+
+
+def _write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_index_records_commits_with_stats(recorder, temp_project_dir):
+    """Test that snapshots are indexed with kind, intent and line counts."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    recorder.set_intent("Add feature")
+    _write(test_file, "a\nb\n")
+    recorder.create_snapshot(test_file)
+
+    recorder.history.sync()
+    rows = recorder.history.chain(10)
+
+    assert len(rows) == 1
+    assert rows[0].kind == "AUTO-TRJ"
+    assert rows[0].intent == "Add feature"
+    assert rows[0].sha == recorder.repo.head.commit.hexsha
+    stats = recorder.history._conn.execute(
+        "SELECT path, added, removed FROM files WHERE sha = ?", (rows[0].sha,)
+    ).fetchall()
+    assert stats == [("test.py", 2, 0)]
+
+
+def test_index_backfills_existing_history(recorder, temp_project_dir):
+    """Test that history recorded before the index existed is backfilled."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for i in range(3):
+        _write(test_file, f"v{i}")
+        recorder.create_snapshot(test_file)
+    recorder.history.close()
+    os.remove(recorder.history.path)
+
+    fresh = Recorder(temp_project_dir)
+    _write(test_file, "v3")
+    fresh.create_snapshot(test_file)
+    fresh.history.sync()
+
+    shas = [row.sha for row in fresh.history.chain(10)]
+    assert shas == [c.hexsha for c in fresh.repo.iter_commits()]
+
+
+def test_sync_of_indexed_head_skips_the_chain(recorder, temp_project_dir, monkeypatch):
+    """Test that a sync with HEAD already indexed does not walk the history."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    _write(test_file, "v0")
+    recorder.create_snapshot(test_file)
+    recorder.history.sync()
+
+    def fail(head):
+        raise AssertionError("an indexed HEAD must not walk the chain")
+
+    monkeypatch.setattr(recorder.history, "_backfill_start", fail)
+    for i in range(1, 3):
+        _write(test_file, f"v{i}")
+        recorder.create_snapshot(test_file)
+        recorder.history.sync()
+    assert len(recorder.history.chain(10)) == 3
+
+    # A squash forgets the synced commit, so the next sync walks again.
+    monkeypatch.undo()
+    recorder.consolidate("Done")
+    recorder.history.sync()
+    assert [row.kind for row in recorder.history.chain(10)] == ["CONSOLIDATE"]
+
+
+def test_pending_stats_are_resolved_in_chunks(recorder, temp_project_dir, monkeypatch):
+    """Test that pending commits are passed to git in bounded chunks."""
+    from code_trajectory import history_index
+
+    monkeypatch.setattr(history_index, "PENDING_CHUNK_SIZE", 2)
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for i in range(5):
+        _write(test_file, "x\n" * (i + 1))
+        recorder.create_snapshot(test_file)
+    recorder.history.sync()
+
+    conn = recorder.history._conn
+    assert conn.execute("SELECT COUNT(*) FROM commits WHERE stats_pending = 1").fetchone() == (0,)
+    added = [row[0] for row in conn.execute("SELECT added FROM files ORDER BY rowid")]
+    assert sorted(added) == [1, 1, 1, 1, 1]
+
+
+def test_index_forgets_squashed_snapshots(recorder, temp_project_dir):
+    """Test that consolidation removes squashed snapshots from the index."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for i in range(2):
+        _write(test_file, f"v{i}")
+        recorder.create_snapshot(test_file)
+
+    recorder.consolidate("Done")
+    recorder.history.sync()
+
+    rows = recorder.history.chain(10)
+    assert [row.kind for row in rows] == ["CONSOLIDATE"]
+    assert rows[0].intent == "Done"
+    assert recorder.history.files([rows[0].sha]) == {rows[0].sha: ["test.py"]}
+    count = recorder.history._conn.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+    assert count == 1
+
+
+def test_global_trajectory_without_commit_stats(recorder, trajectory, temp_project_dir, monkeypatch):
+    """Test that the global trajectory never computes per-commit stats."""
+    from git.objects.commit import Commit
+
+    test_file = os.path.join(temp_project_dir, "test.py")
+    _write(test_file, "v1")
+    recorder.create_snapshot(test_file)
+
+    def fail(self):
+        raise AssertionError("commit.stats must not be used")
+
+    monkeypatch.setattr(Commit, "stats", property(fail))
+    assert "test.py" in trajectory.get_global_trajectory()
+    assert "test.py" in trajectory.get_session_summary()
+
+
+def _no_chain(history, monkeypatch):
+    def fail(limit):
+        raise AssertionError("the session model must not walk the chain")
+
+    monkeypatch.setattr(history, "chain", fail)
+
+
+def test_session_model_is_extended_by_snapshots(recorder, temp_project_dir, monkeypatch):
+    """Test that the session summary is read from the model, not the history."""
+    first = os.path.join(temp_project_dir, "a.py")
+    second = os.path.join(temp_project_dir, "b.py")
+    recorder.set_intent("Add parser")
+    _write(first, "a")
+    recorder.create_snapshot(first)
+    recorder.set_intent("Fix parser")
+    _write(second, "b")
+    recorder.create_snapshot(second)
+    _write(first, "a2")
+    recorder.create_snapshot(first)
+
+    _no_chain(recorder.history, monkeypatch)
+    session = recorder.history.session()
+    assert session.head == recorder.repo.head.commit.hexsha
+    assert session.commits == 3
+    assert session.files == ["a.py", "b.py"]
+    assert session.intents == ["Add parser", "Fix parser"]
+
+    # The model survives a restart.
+    reopened = Recorder(temp_project_dir)
+    try:
+        _no_chain(reopened.history, monkeypatch)
+        assert reopened.history.session() == session
+    finally:
+        reopened.close()
+
+
+def test_session_model_starts_over_after_a_gap(recorder, temp_project_dir, monkeypatch):
+    """Test that a commit an hour after the last one starts a new session."""
+    history = recorder.history
+    heads = iter(["c1", "c2", "c3"])
+    head = None
+
+    def record(sha, parent, timestamp, paths):
+        nonlocal head
+        history.record_commit(sha, parent, timestamp, "[AUTO-TRJ] 10:00:00 - x", paths)
+        head = sha
+
+    monkeypatch.setattr(history, "head_sha", lambda: head)
+    record(next(heads), None, 1000, ["a.py"])
+    record(next(heads), "c1", 2000, ["b.py"])
+    assert history.session().commits == 2
+    record(next(heads), "c2", 2000 + 3601, ["c.py"])
+
+    _no_chain(history, monkeypatch)
+    session = history.session()
+    assert (session.start, session.commits, session.files) == (5601, 1, ["c.py"])
+
+
+def test_session_model_is_rebuilt_after_consolidation(recorder, temp_project_dir):
+    """Test that squashing history invalidates the model and it is rebuilt."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for content in ["v1", "v2"]:
+        _write(test_file, content)
+        recorder.create_snapshot(test_file)
+    recorder.consolidate("Done")
+
+    session = recorder.history.session()
+    assert session.head == recorder.repo.head.commit.hexsha
+    assert session.commits == 1
+    assert session.files == ["test.py"]
+    assert session.intents == ["Done"]
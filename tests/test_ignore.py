@@ -0,0 +1,111 @@
+# SPDX-License-Identifier: MIT
+import os
+
+import pytest
+
+PATTERNS = """\
+# comment
+node_modules/
+*.log
+!keep.log
+/build
+docs/**/*.tmp
+cache[0-9]
+src/**/generated
+[]a].txt
+[!]x]y.md
+"""
+
+PATHS = [
+    ("node_modules/pkg/index.js", False),
+    ("node_modules", True),
+    ("web/node_modules/lib.js", False),
+    ("app.log", False),
+    ("keep.log", False),
+    ("logs/debug.log", False),
+    ("build/out.bin", False),
+    ("src/build/out.bin", False),
+    ("docs/a/b/page.tmp", False),
+    ("docs/page.tmp", False),
+    ("cache1", False),
+    ("cacheX", False),
+    ("src/generated/x.py", False),
+    ("src/deep/er/generated/x.py", False),
+    ("src/main.py", False),
+    ("sub/local.txt", False),
+    ("sub/other.txt", False),
+    ("].txt", False),
+    ("a.txt", False),
+    ("b.txt", False),
+    ("zy.md", False),
+    ("]y.md", False),
+]
+
+
+@pytest.fixture
+def ignore_project(recorder, temp_project_dir):
+    with open(os.path.join(temp_project_dir, ".gitignore"), "a") as f:
+        f.write(PATTERNS)
+    os.makedirs(os.path.join(temp_project_dir, "sub"))
+    with open(os.path.join(temp_project_dir, "sub", ".gitignore"), "w") as f:
+        f.write("local.txt\n")
+    recorder.ignore_matcher.invalidate()
+    return recorder
+
+
+@pytest.mark.parametrize("rel_path,is_dir", PATHS)
+def test_matcher_agrees_with_git(ignore_project, temp_project_dir, rel_path, is_dir):
+    """Test that the in-process matcher gives the same answer as git check-ignore."""
+    abs_path = os.path.join(temp_project_dir, rel_path)
+    if is_dir:
+        os.makedirs(abs_path)
+    expected = bool(ignore_project.repo.ignored(abs_path))
+    assert ignore_project.ignore_matcher.is_ignored(abs_path, is_dir=is_dir) == expected
+
+
+def test_matcher_always_ignores_shadow_repo(recorder, temp_project_dir):
+    """Test that .git and .trajectory contents are never recorded."""
+    matcher = recorder.ignore_matcher
+    assert matcher.is_ignored(os.path.join(temp_project_dir, ".trajectory", "x"), is_dir=False)
+    assert matcher.is_ignored(os.path.join(temp_project_dir, ".git", "HEAD"), is_dir=False)
+
+
+def test_matcher_invalidates_on_ignore_file_change(recorder, temp_project_dir):
+    """Test that cached decisions are refreshed when .gitignore changes."""
+    matcher = recorder.ignore_matcher
+    target = os.path.join(temp_project_dir, "out.tmp")
+    assert not matcher.is_ignored(target, is_dir=False)
+
+    gitignore = os.path.join(temp_project_dir, ".gitignore")
+    with open(gitignore, "a") as f:
+        f.write("*.tmp\n")
+    assert matcher.is_ignore_file(gitignore)
+    matcher.invalidate(gitignore)
+
+    assert matcher.is_ignored(target, is_dir=False)
+
+
+def test_matcher_reloads_changed_exclude_file(recorder, temp_project_dir, monkeypatch):
+    """Test that info/exclude changes are picked up without a watcher event."""
+    from code_trajectory import ignore
+
+    monkeypatch.setattr(ignore, "BASE_CHECK_SECONDS", 0)
+    matcher = recorder.ignore_matcher
+    target = os.path.join(temp_project_dir, "out.log")
+    assert not matcher.is_ignored(target, is_dir=False)
+
+    exclude = os.path.join(recorder.repo.git_dir, "info", "exclude")
+    os.makedirs(os.path.dirname(exclude), exist_ok=True)
+    with open(exclude, "a") as f:
+        f.write("\n*.log\n")
+    assert not matcher.is_ignore_file(exclude)
+
+    assert matcher.is_ignored(target, is_dir=False)
+
+
+def test_matcher_skips_invalid_patterns(recorder, temp_project_dir):
+    """Test that one broken line does not disable the rest of the file."""
+    from code_trajectory.ignore import IgnoreFile
+
+    ignore_file = IgnoreFile("", ["*.log\n", "[z-a]\n"])
+    assert ignore_file.match("debug.log", False) is True
@@ -0,0 +1,101 @@
+# SPDX-License-Identifier: MIT
+import os
+
+import pytest
+
+from code_trajectory.large_files import FilePointer, LargeFilePolicy, describe_pointer_patch
+
+SMALL_LIMITS = LargeFilePolicy(max_file_bytes=1000, max_binary_bytes=100)
+
+
+@pytest.fixture(params=["recorder", "object_recorder"])
+def limited_recorder(request):
+    rec = request.getfixturevalue(request.param)
+    rec.large_files = SMALL_LIMITS
+    rec._object_writer.large_files = SMALL_LIMITS
+    return rec
+
+
+def _stored(recorder, rel_path):
+    return (recorder.repo.head.commit.tree / rel_path).data_stream.read()
+
+
+def test_policy_detects_large_and_binary_files(tmp_path):
+    """Test the size thresholds for text and binary files."""
+    text = tmp_path / "data.csv"
+    text.write_text("x" * 500)
+    binary = tmp_path / "model.bin"
+    binary.write_bytes(b"\0" * 500)
+
+    assert not SMALL_LIMITS.stores_pointer(str(text), 500)
+    assert SMALL_LIMITS.stores_pointer(str(binary), 500)
+    assert SMALL_LIMITS.stores_pointer(str(text), 5000)
+
+
+def test_large_file_is_stored_as_pointer(limited_recorder, temp_project_dir):
+    """Test that a large file's content never enters the shadow repository."""
+    path = os.path.join(temp_project_dir, "weights.bin")
+    with open(path, "wb") as f:
+        f.write(b"\0\1" * 5000)
+    limited_recorder.create_snapshot(path)
+
+    pointer = FilePointer.parse(_stored(limited_recorder, "weights.bin"))
+    assert pointer is not None
+    assert pointer.size == 10000
+    assert pointer.oid == FilePointer.from_file(path).oid
+
+    # Saving the same pointer again records nothing.
+    head = limited_recorder.repo.head.commit
+    assert limited_recorder.create_batch_snapshot([path]) is None
+    assert limited_recorder.repo.head.commit == head
+
+
+def test_large_file_with_space_in_name(limited_recorder, temp_project_dir):
+    """Test that a new large file whose name has a space is recorded."""
+    first = os.path.join(temp_project_dir, "first.txt")
+    with open(first, "w") as f:
+        f.write("first")
+    limited_recorder.create_snapshot(first)
+
+    path = os.path.join(temp_project_dir, "my model.bin")
+    with open(path, "wb") as f:
+        f.write(b"\0\1" * 5000)
+    assert limited_recorder.create_batch_snapshot([path]) is not None
+
+    pointer = FilePointer.parse(_stored(limited_recorder, "my model.bin"))
+    assert pointer is not None and pointer.size == 10000
+
+
+def test_file_shrinking_below_limit_stores_content(limited_recorder, temp_project_dir):
+    """Test switching between pointer and content as a file changes size."""
+    path = os.path.join(temp_project_dir, "data.txt")
+    with open(path, "w") as f:
+        f.write("a" * 5000)
+    limited_recorder.create_snapshot(path)
+    with open(path, "w") as f:
+        f.write("small")
+    limited_recorder.create_snapshot(path)
+
+    assert _stored(limited_recorder, "data.txt") == b"small"
+
+
+def test_pointer_rendered_as_stub(recorder, trajectory, temp_project_dir):
+    """Test that trajectories show a stub instead of the pointer diff."""
+    recorder.large_files = SMALL_LIMITS
+    path = os.path.join(temp_project_dir, "data.txt")
+    for content in ("small", "a" * 5000, "b" * 6000):
+        with open(path, "w") as f:
+            f.write(content)
+        recorder.create_snapshot(path)
+
+    traj = trajectory.get_file_trajectory("data.txt")
+    assert "[Large file: 6000 bytes, sha256" in traj
+    assert "[Large file: 5000 bytes, sha256" in traj
+    assert "oid sha256" not in traj
+    limited = trajectory.get_file_trajectory("data.txt", max_tokens=2000)
+    assert "[Large file: 6000 bytes, sha256" in limited
+
+
+def test_regular_patch_is_not_a_pointer():
+    """Test that ordinary diffs are rendered as they are."""
+    assert describe_pointer_patch("@@ -1 +1 @@\n-a\n+b") is None
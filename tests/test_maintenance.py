@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: MIT
+import os
+import time
+
+from code_trajectory.maintenance import (
+    MaintenancePolicy,
+    MaintenanceScheduler,
+    count_loose_objects,
+)
+
+
+def _snapshot(recorder, path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    recorder.create_snapshot(path)
+
+
+def test_forced_maintenance_packs_and_prunes(recorder, temp_project_dir):
+    """Test that maintenance packs history and drops squashed snapshots."""
+    recorder.maintenance_policy = MaintenancePolicy(reflog_expire="now", prune_expire="now")
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for i in range(3):
+        _snapshot(recorder, test_file, f"v{i}")
+    squashed = recorder.repo.head.commit.parents[0].hexsha
+    recorder.consolidate("Done")
+    assert count_loose_objects(recorder.repo) > 0
+
+    assert recorder.run_maintenance(force=True)
+
+    assert count_loose_objects(recorder.repo) == 0
+    assert recorder.repo.git.cat_file("-t", "HEAD") == "commit"
+    assert not _exists(recorder, squashed)
+    graph = os.path.join(recorder.repo.git_dir, "objects", "info", "commit-graph")
+    assert os.path.exists(graph)
+    # Reads keep working after the packs changed under the cat-file pool.
+    assert (recorder.repo.head.commit.tree / "test.py").data_stream.read() == b"v2"
+    assert "Done" in recorder.get_history(test_file)[0].message
+
+
+def _exists(recorder, sha):
+    status, _, _ = recorder.repo.git.cat_file(
+        "-e", sha, with_extended_output=True, with_exceptions=False
+    )
+    return status == 0
+
+
+def test_policy_skips_maintenance_below_thresholds(recorder, temp_project_dir):
+    """Test that a repository with few loose objects is left alone."""
+    _snapshot(recorder, os.path.join(temp_project_dir, "test.py"), "v1")
+    recorder._maintenance_state.last_run = time.time() - 3600
+    assert not recorder.run_maintenance()
+
+    recorder.maintenance_policy = MaintenancePolicy(loose_objects=1)
+    assert recorder.run_maintenance()
+    # Too soon after the last run.
+    _snapshot(recorder, os.path.join(temp_project_dir, "test.py"), "v2")
+    assert not recorder.run_maintenance()
+
+
+def test_scheduler_only_maintains_idle_repositories(recorder, temp_project_dir):
+    """Test that repositories written to recently are skipped."""
+    recorder.maintenance_policy = MaintenancePolicy(idle_seconds=60, loose_objects=1)
+    _snapshot(recorder, os.path.join(temp_project_dir, "test.py"), "v1")
+    scheduler = MaintenanceScheduler()
+    scheduler.register(recorder)
+
+    scheduler.run_pending()
+    assert count_loose_objects(recorder.repo) > 0
+
+    recorder.maintenance_policy.idle_seconds = 0
+    scheduler.run_pending()
+    assert count_loose_objects(recorder.repo) == 0
@@ -0,0 +1,125 @@
+# SPDX-License-Identifier: MIT
+import json
+import os
+import subprocess
+import threading
+
+import pytest
+
+from code_trajectory import server
+from code_trajectory.metrics import METRICS, Metrics, MetricsDumper, count_subprocesses
+
+
+@pytest.fixture
+def metrics():
+    METRICS.reset()
+    METRICS.enabled = True
+    yield METRICS
+    METRICS.enabled = True
+    METRICS.reset()
+
+
+def test_counters_histograms_and_gauges():
+    """Test recording and reporting in both formats."""
+    m = Metrics()
+    m.increment("events_total", result="ignored")
+    m.increment("events_total", 2, result="ignored")
+    m.observe("op_seconds", 0.003)
+    m.observe("op_seconds", 20)
+    m.gauge("queue_depth", lambda: 7)
+
+    assert m.counter("events_total", result="ignored") == 3
+    histogram = m.histogram("op_seconds")
+    assert histogram.count == 2
+    assert histogram.to_dict()["buckets"]["0.005"] == 1
+    assert histogram.to_dict()["buckets"]["+Inf"] == 2
+
+    text = m.to_prometheus()
+    assert '# TYPE events_total counter' in text
+    assert 'events_total{result="ignored"} 3' in text
+    assert 'op_seconds_bucket{le="+Inf"} 2' in text
+    assert "queue_depth 7" in text
+    assert json.loads(m.to_json())["gauges"][0]["value"] == 7
+
+
+def test_disabled_metrics_record_nothing():
+    """Test that disabled metrics skip all bookkeeping."""
+    m = Metrics(enabled=False)
+    calls = []
+
+    @m.timed("call_seconds")
+    def call():
+        calls.append(1)
+        return "ok"
+
+    assert call() == "ok"
+    m.increment("events_total")
+    with m.timer("block_seconds"):
+        pass
+    assert calls == [1]
+    assert m.snapshot()["counters"] == [] and m.snapshot()["histograms"] == []
+
+
+def test_hot_paths_are_instrumented(metrics, recorder, trajectory, temp_project_dir):
+    """Test snapshot, lock contention, cache and tool timings."""
+    path = os.path.join(temp_project_dir, "test.py")
+    with open(path, "w") as f:
+        f.write("v1")
+    recorder.create_snapshot(path)
+    recorder.create_snapshot(path)
+
+    locked = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        with recorder._lock:
+            locked.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    locked.wait(5)
+    with open(path, "w") as f:
+        f.write("v2")
+    snapshot = threading.Thread(target=recorder.create_snapshot, args=(path,))
+    snapshot.start()
+    while not metrics.counter("recorder_lock_contention_total"):
+        pass
+    release.set()
+    holder.join()
+    snapshot.join()
+
+    trajectory.get_file_trajectory("test.py")
+    trajectory.get_file_trajectory("test.py")
+
+    assert metrics.counter("snapshots_total", engine="cli", result="written") == 2
+    assert metrics.counter("snapshots_total", engine="cli", result="unchanged") == 1
+    assert metrics.histogram("snapshot_seconds").count == 3
+    assert metrics.histogram("recorder_lock_wait_seconds").count == 1
+    assert metrics.counter("trajectory_cache_total", kind="file", result="hit") == 1
+    assert metrics.histogram("trajectory_seconds", method="get_file_trajectory").count == 2
+
+
+def test_subprocesses_are_counted(metrics):
+    """Test that spawned processes are counted by program."""
+    count_subprocesses()
+    before = metrics.counter("subprocesses_spawned_total", program="git")
+    subprocess.run(["git", "--version"], capture_output=True, check=True)
+    assert metrics.counter("subprocesses_spawned_total", program="git") == before + 1
+
+
+def test_metrics_tool_and_dump_file(metrics, tmp_path):
+    """Test the MCP tool and the periodic dump file."""
+    metrics.increment("events_total")
+    report = json.loads(server.get_server_metrics())
+    assert {"name": "events_total", "labels": {}, "value": 1} in report["counters"]
+    assert "# TYPE events_total counter" in server.get_server_metrics("prometheus")
+
+    dump = tmp_path / "metrics.prom"
+    dumper = MetricsDumper(str(dump), interval=60)
+    dumper.start()
+    dumper.stop()
+    assert "events_total 1" in dump.read_text()
+
+    metrics.enabled = False
+    assert "disabled" in server.get_server_metrics()
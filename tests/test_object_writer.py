@@ -0,0 +1,126 @@
+# SPDX-License-Identifier: MIT
+import os
+
+
+def test_object_snapshot_creates_commit(object_recorder, temp_project_dir):
+    """Test that the object engine records a file without touching the index."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    with open(test_file, "w") as f:
+        f.write("print('hello')")
+
+    object_recorder.create_snapshot(test_file)
+
+    commits = object_recorder.get_history(test_file)
+    assert len(commits) == 1
+    assert "[AUTO-TRJ]" in commits[0].message
+    assert "Snapshot of" in commits[0].message
+    blob = commits[0].tree / "test.py"
+    assert blob.data_stream.read() == b"print('hello')"
+    assert not os.path.exists(os.path.join(object_recorder.repo.git_dir, "index"))
+
+
+def test_object_snapshot_patches_nested_tree(object_recorder, temp_project_dir):
+    """Test that only the changed path is replaced in the parent tree."""
+    os.makedirs(os.path.join(temp_project_dir, "src", "pkg"))
+    first = os.path.join(temp_project_dir, "src", "pkg", "a.py")
+    second = os.path.join(temp_project_dir, "src", "b.py")
+    with open(first, "w") as f:
+        f.write("a = 1")
+    with open(second, "w") as f:
+        f.write("b = 1")
+    object_recorder.create_batch_snapshot([first, second])
+
+    with open(first, "w") as f:
+        f.write("a = 2")
+    object_recorder.create_snapshot(first)
+
+    head = object_recorder.repo.head.commit
+    assert (head.tree / "src/pkg/a.py").data_stream.read() == b"a = 2"
+    assert (head.tree / "src/b.py").data_stream.read() == b"b = 1"
+    assert list(head.stats.files) == ["src/pkg/a.py"]
+    # The tree must be well-formed for git itself.
+    object_recorder.repo.git.fsck("--strict")
+
+
+def test_object_snapshot_skips_unchanged(object_recorder, temp_project_dir):
+    """Test that unchanged content does not produce a commit."""
+    test_file = os.path.join(temp_project_dir, "same.py")
+    with open(test_file, "w") as f:
+        f.write("same")
+    object_recorder.create_snapshot(test_file)
+
+    assert object_recorder.create_batch_snapshot([test_file]) is None
+    assert len(list(object_recorder.repo.iter_commits())) == 1
+
+
+def test_object_snapshot_records_deletion(object_recorder, temp_project_dir):
+    """Test that a removed file is dropped from the snapshot tree."""
+    keep = os.path.join(temp_project_dir, "keep.py")
+    gone = os.path.join(temp_project_dir, "gone.py")
+    for path in (keep, gone):
+        with open(path, "w") as f:
+            f.write(path)
+    object_recorder.create_batch_snapshot([keep, gone])
+
+    os.remove(gone)
+    object_recorder.create_snapshot(gone)
+
+    tree = object_recorder.repo.head.commit.tree
+    assert [blob.path for blob in tree.blobs] == ["keep.py"]
+
+
+def test_object_snapshot_consolidate_root(object_recorder, temp_project_dir):
+    """Test consolidating when every commit is an object-engine snapshot."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for i in range(2):
+        with open(test_file, "w") as f:
+            f.write(f"print({i})")
+        object_recorder.create_snapshot(test_file)
+
+    result = object_recorder.consolidate("done")
+
+    assert "Successfully consolidated" in result
+    commits = list(object_recorder.repo.iter_commits())
+    assert len(commits) == 1
+    assert "[CONSOLIDATE]" in commits[0].message
+    assert (commits[0].tree / "test.py").data_stream.read() == b"print(1)"
+
+
+def test_object_snapshot_consolidate_onto_parent(object_recorder, temp_project_dir):
+    """Test consolidating object-engine snapshots on top of a consolidation."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    with open(test_file, "w") as f:
+        f.write("base")
+    object_recorder.create_snapshot(test_file)
+    object_recorder.consolidate("base")
+
+    for i in range(2):
+        with open(test_file, "w") as f:
+            f.write(f"print({i})")
+        object_recorder.create_snapshot(test_file)
+    result = object_recorder.consolidate("second")
+
+    assert "Squashed 2 snapshots" in result
+    commits = list(object_recorder.repo.iter_commits())
+    assert [c.message.split(" - ")[-1].strip() for c in commits] == ["second", "base"]
+    assert (commits[0].tree / "test.py").data_stream.read() == b"print(1)"
+
+
+def test_switching_engines_keeps_index_in_sync(object_recorder, temp_project_dir):
+    """Test that a cli snapshot after object snapshots keeps earlier files."""
+    from code_trajectory.recorder import Recorder
+
+    first = os.path.join(temp_project_dir, "first.py")
+    with open(first, "w") as f:
+        f.write("first")
+    object_recorder.create_snapshot(first)
+
+    cli_recorder = Recorder(temp_project_dir, snapshot_engine="cli")
+    second = os.path.join(temp_project_dir, "second.py")
+    with open(second, "w") as f:
+        f.write("second")
+    cli_recorder.create_snapshot(second)
+
+    tree = cli_recorder.repo.head.commit.tree
+    assert sorted(blob.path for blob in tree.blobs) == ["first.py", "second.py"]
+    assert cli_recorder.repo.git.status("--porcelain", "--", first) == ""
@@ -0,0 +1,209 @@
+# SPDX-License-Identifier: MIT
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import git
+import pytest
+from watchdog.observers.api import EventEmitter
+
+from code_trajectory import server
+from code_trajectory.projects import ProjectRegistry
+from code_trajectory.server import state
+
+
+@pytest.fixture
+def project_dirs():
+    """Creates three temporary git projects."""
+    dirs = []
+    for _ in range(3):
+        path = tempfile.mkdtemp()
+        repo = git.Repo.init(path)
+        repo.git.config("user.name", "Test User")
+        repo.git.config("user.email", "test@example.com")
+        dirs.append(path)
+    yield dirs
+    for path in dirs:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _service_threads() -> int:
+    # watchdog runs an emitter thread per watched directory; everything else is shared.
+    return sum(
+        1
+        for thread in threading.enumerate()
+        if not isinstance(thread, EventEmitter) and type(thread).__name__ != "InotifyBuffer"
+    )
+
+
+def _identify(project):
+    project.recorder.repo.git.config("user.name", "Test User")
+    project.recorder.repo.git.config("user.email", "test@example.com")
+    return project
+
+
+@pytest.fixture
+def registry():
+    registry = ProjectRegistry()
+    yield registry
+    registry.close_all()
+
+
+def test_projects_share_observer_and_scheduler(registry, project_dirs):
+    """Test that tracking more projects does not start more dispatch or worker threads."""
+    first = registry.open(project_dirs[0])
+    threads = _service_threads()
+    second = registry.open(project_dirs[1])
+    third = registry.open(project_dirs[2])
+
+    assert _service_threads() == threads
+    assert first.watcher.observer is second.watcher.observer is third.watcher.observer
+    assert first.watcher.handler.scheduler is third.watcher.handler.scheduler
+    assert registry.open(project_dirs[0]) is first
+
+
+def test_projects_share_observer_per_backend(registry, project_dirs):
+    """Test that each watch backend gets one observer shared by its projects."""
+    first = registry.open(project_dirs[0], watch_backend="stat")
+    threads = _service_threads()
+    second = registry.open(project_dirs[1], watch_backend="stat")
+    third = registry.open(project_dirs[2])
+
+    assert first.watcher.observer is second.watcher.observer
+    assert first.watcher.observer is not third.watcher.observer
+    assert third.watcher.observer is registry.observer
+    # The stat scanner serves every watch from one thread.
+    assert _service_threads() == threads + 1
+
+
+def test_snapshots_land_in_their_own_project(registry, project_dirs):
+    """Test that changes in two projects are recorded in their own shadow repos."""
+    first = _identify(registry.open(project_dirs[0]))
+    second = _identify(registry.open(project_dirs[1]))
+
+    for path in project_dirs[:2]:
+        with open(os.path.join(path, "a.txt"), "w") as f:
+            f.write(path)
+        registry.scheduler.touch(registry.get(path).recorder, os.path.join(path, "a.txt"))
+    registry.scheduler.flush()
+
+    for project in (first, second):
+        blob = project.recorder.repo.head.commit.tree / "a.txt"
+        assert blob.data_stream.read().decode() == project.path
+
+
+def test_least_recently_used_project_is_evicted(project_dirs):
+    """Test that projects beyond max_active are stopped, sparing the active one."""
+    registry = ProjectRegistry(max_active=2)
+    try:
+        registry.open(project_dirs[0])
+        registry.active = project_dirs[0]
+        registry.open(project_dirs[1])
+        registry.open(project_dirs[2])
+
+        assert sorted(registry.paths) == sorted([project_dirs[0], project_dirs[2]])
+        assert registry.get(project_dirs[1]) is None
+    finally:
+        registry.close_all()
+
+
+def test_projects_are_not_evicted_by_default(registry, project_dirs):
+    """Test that without a cap every opened project keeps being watched."""
+    for path in project_dirs:
+        registry.open(path)
+    assert sorted(registry.paths) == sorted(project_dirs)
+
+
+def test_eviction_waits_for_callers_in_flight(project_dirs):
+    """Test that an evicted project is only closed once its users are done."""
+    registry = ProjectRegistry(max_active=1)
+    try:
+        with registry.use(project_dirs[0]) as first:
+            opener = threading.Thread(target=registry.open, args=(project_dirs[1],))
+            opener.start()
+            opener.join(0.3)
+
+            assert opener.is_alive()
+            assert first.stopped
+            assert project_dirs[0] not in registry.paths
+            # The recorder is still open for the caller holding it.
+            assert first.recorder.history.head_sha() is None
+        opener.join(5)
+        assert not opener.is_alive()
+
+        # Using it again tracks it again.
+        with registry.use(project_dirs[0]) as reopened:
+            assert reopened is not first
+            assert not reopened.stopped
+    finally:
+        registry.close_all()
+
+
+def test_idle_project_releases_resources(project_dirs):
+    """Test that an idle project drops its cache but keeps being tracked."""
+    registry = ProjectRegistry(idle_timeout=0.05)
+    try:
+        idle = registry.open(project_dirs[0])
+        idle.trajectory.cache.put(("summary", "head"), "text", 4)
+        time.sleep(0.1)
+        registry.open(project_dirs[1])
+
+        assert idle.idle
+        assert len(idle.trajectory.cache) == 0
+        assert project_dirs[0] in registry.paths
+        assert registry.get(project_dirs[0]) is idle
+        assert not idle.idle
+    finally:
+        registry.close_all()
+
+
+def test_tools_accept_a_project(monkeypatch, project_dirs):
+    """Test that tools can query a project other than the configured one."""
+    monkeypatch.setattr(state, "registry", ProjectRegistry())
+    for name in ("recorder", "watcher", "trajectory", "project_path"):
+        monkeypatch.setattr(state, name, None)
+    try:
+        asyncio.run(server.configure_project(project_dirs[0]))
+        asyncio.run(server.configure_project(project_dirs[1]))
+        assert state.project_path == project_dirs[1]
+        # The first project is still watched.
+        assert project_dirs[0] in state.registry.paths
+
+        with open(os.path.join(project_dirs[0], "main.py"), "w") as f:
+            f.write("print('first')\n")
+        recorder = _identify(state.registry.get(project_dirs[0])).recorder
+        recorder.create_snapshot(os.path.join(project_dirs[0], "main.py"))
+
+        result = asyncio.run(server.get_file_trajectory("main.py", project=project_dirs[0]))
+        assert "Snapshot of" in result
+        result = asyncio.run(server.get_file_trajectory("main.py"))
+        assert "Snapshot of" not in result
+
+        asyncio.run(server.set_trajectory_intent("Other work", project=project_dirs[0]))
+        assert recorder.current_intent == "Other work"
+        assert state.recorder.current_intent != "Other work"
+    finally:
+        state.registry.close_all()
+
+
+def test_configure_project_selects_backend_per_project(monkeypatch, project_dirs):
+    """Test that two projects can be watched with different backends."""
+    from code_trajectory.stat_scanner import StatScanObserver
+
+    monkeypatch.setattr(state, "registry", ProjectRegistry())
+    for name in ("recorder", "watcher", "trajectory", "project_path"):
+        monkeypatch.setattr(state, name, None)
+    try:
+        asyncio.run(server.configure_project(project_dirs[0], watch_backend="stat"))
+        asyncio.run(server.configure_project(project_dirs[1]))
+
+        mounted = state.registry.get(project_dirs[0]).watcher.observer
+        local = state.registry.get(project_dirs[1]).watcher.observer
+        assert isinstance(mounted, StatScanObserver)
+        assert local is state.registry.observer
+        assert not isinstance(local, StatScanObserver)
+    finally:
+        state.registry.close_all()
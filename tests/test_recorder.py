@@ -2,6 +2,8 @@
 import os
 import time
 
+from code_trajectory.recorder import Recorder
+
 def test_recorder_initialization(recorder, temp_project_dir):
     """Test that the recorder initializes the shadow repo correctly."""
     shadow_repo_path = os.path.join(temp_project_dir, ".trajectory")
@@ -103,3 +105,123 @@ def test_consolidate(recorder, temp_project_dir):
     assert len(commits) == 1
     assert "[CONSOLIDATE]" in commits[0].message
     assert "Completed feature" in commits[0].message
+
+def test_consolidate_starts_from_consolidated_ref(recorder, temp_project_dir, monkeypatch):
+    """Test that consolidation only walks the snapshots since the last one."""
+    from code_trajectory.recorder import CONSOLIDATED_REF
+
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for i in range(2):
+        with open(test_file, "w") as f:
+            f.write(f"print({i})")
+        recorder.create_snapshot(test_file)
+    recorder.consolidate("First")
+    first = recorder.repo.head.commit
+    assert recorder.repo.git.rev_parse(CONSOLIDATED_REF) == first.hexsha
+
+    for i in range(3):
+        with open(test_file, "w") as f:
+            f.write(f"print({i + 10})")
+        recorder.create_snapshot(test_file)
+    # Unsnapshotted changes are not swept into the consolidation.
+    with open(os.path.join(temp_project_dir, "unsaved.py"), "w") as f:
+        f.write("x")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("consolidate walked the whole history")
+
+    monkeypatch.setattr(type(recorder.repo), "iter_commits", fail)
+    result = recorder.consolidate("Second")
+
+    assert "Squashed 3 snapshots" in result
+    head = recorder.repo.head.commit
+    assert head.parents == (first,)
+    assert [blob.path for blob in head.tree.blobs] == ["test.py"]
+    assert (head.tree / "test.py").data_stream.read() == b"print(12)"
+    assert recorder.repo.git.rev_parse(CONSOLIDATED_REF) == head.hexsha
+
+
+def test_consolidate_without_ref_walks_back(recorder, temp_project_dir):
+    """Test that a shadow repo without the ref finds the squash base by walking."""
+    from code_trajectory.recorder import CONSOLIDATED_REF
+
+    test_file = os.path.join(temp_project_dir, "test.py")
+    with open(test_file, "w") as f:
+        f.write("base")
+    recorder.create_snapshot(test_file)
+    recorder.consolidate("Base")
+    base = recorder.repo.head.commit.hexsha
+    recorder.repo.git.update_ref("-d", CONSOLIDATED_REF)
+
+    for i in range(2):
+        with open(test_file, "w") as f:
+            f.write(f"print({i})")
+        recorder.create_snapshot(test_file)
+    result = recorder.consolidate("Next")
+
+    assert "Squashed 2 snapshots" in result
+    assert recorder.repo.head.commit.parents[0].hexsha == base
+
+
+def test_consolidate_dropping_cancelled_snapshots(recorder, temp_project_dir):
+    """Test that snapshots that end where they started leave no commit."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    with open(test_file, "w") as f:
+        f.write("base")
+    recorder.create_snapshot(test_file)
+    recorder.consolidate("Base")
+    base = recorder.repo.head.commit.hexsha
+
+    for content in ("changed", "base"):
+        with open(test_file, "w") as f:
+            f.write(content)
+        recorder.create_snapshot(test_file)
+
+    assert recorder.consolidate("Nothing") == "No changes to consolidate."
+    assert recorder.repo.head.commit.hexsha == base
+
+
+def test_iter_history_with_stats(recorder, temp_project_dir):
+    """Test streaming commits with line counts from a single git log."""
+    first = os.path.join(temp_project_dir, "first file.py")
+    second = os.path.join(temp_project_dir, "second.py")
+    with open(first, "w") as f:
+        f.write("a\nb\n")
+    with open(second, "wb") as f:
+        f.write(b"\0\1")
+    recorder.create_batch_snapshot([first, second])
+    with open(first, "w") as f:
+        f.write("a\n")
+    recorder.create_snapshot(first)
+
+    entries = list(recorder.iter_history_with_stats())
+    commits = list(recorder.repo.iter_commits())
+    assert [e.sha for e in entries] == [c.hexsha for c in commits]
+    assert entries[0].files == [("first file.py", 0, 1)]
+    assert entries[1].files == [("first file.py", 2, 0), ("second.py", None, None)]
+    assert entries[0].parent == entries[1].sha
+    assert entries[1].parent is None
+    assert entries[0].message == commits[0].message
+
+    only_second = list(recorder.iter_history_with_stats(paths=["second.py"]))
+    assert [e.sha for e in only_second] == [entries[1].sha]
+    assert len(list(recorder.iter_history_with_stats(max_count=1))) == 1
+    assert list(recorder.iter_history_with_stats(f"{entries[1].sha}..HEAD"))[0].sha == entries[0].sha
+
+def test_iter_history_with_stats_empty_repo(recorder):
+    """Test that an empty shadow repository yields no history."""
+    assert list(recorder.iter_history_with_stats()) == []
+
+
+def test_reopening_skips_config_writes(temp_project_dir):
+    """Test that reopening a shadow repository spawns no git config writes."""
+    from code_trajectory.metrics import METRICS, count_subprocesses
+
+    Recorder(temp_project_dir).close()
+    count_subprocesses()
+    METRICS.reset()
+    recorder = Recorder(temp_project_dir)
+    recorder.close()
+
+    assert METRICS.counter("subprocesses_spawned_total", program="git") == 0
+    assert recorder.repo.git.config("core.worktree") == temp_project_dir
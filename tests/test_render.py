@@ -0,0 +1,42 @@
+# SPDX-License-Identifier: MIT
+from code_trajectory.render import OutputBudget, is_generated_file, render_patch
+
+PATCH = "\n".join(
+    ["@@ -1,2 +1,3 @@", " a", "+b", " c"]
+    + ["@@ -10,1 +11,50 @@"]
+    + [f"+line {i}" for i in range(50)]
+)
+
+
+def test_budget_from_limits():
+    """Test that the smaller of the token and byte limits wins."""
+    assert OutputBudget.from_limits(max_tokens=100).max_bytes == 400
+    assert OutputBudget.from_limits(max_tokens=100, max_bytes=50).max_bytes == 50
+    assert OutputBudget.from_limits().remaining == float("inf")
+
+    budget = OutputBudget(10)
+    assert budget.take(6)
+    assert not budget.take(6)
+    assert budget.remaining == 4
+
+
+def test_render_patch_collapses_large_hunks():
+    """Test that hunks that do not fit are reduced to their header and counts."""
+    assert render_patch(PATCH, 10_000) == PATCH
+
+    rendered = render_patch(PATCH, 120)
+    assert rendered.startswith("@@ -1,2 +1,3 @@\n a\n+b\n c\n")
+    assert "@@ -10,1 +11,50 @@ [collapsed: +50 -0 lines]" in rendered
+    assert len(rendered) <= 120
+
+    assert render_patch(PATCH, 10) == "[Diff collapsed: 2 hunks, +51 -0 lines]"
+
+
+def test_render_patch_elides_binary_and_generated_files():
+    """Test that binary and generated files never show their diff."""
+    assert render_patch("Binary files a/x and b/x differ", 1000) == "[Binary file changed]"
+    assert render_patch(PATCH, 10_000, "web/package-lock.json") == (
+        "[Generated file: +51 -0 lines, diff elided]"
+    )
+    assert is_generated_file("poetry.lock")
+    assert not is_generated_file("src/lock.py")
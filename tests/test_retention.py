@@ -0,0 +1,144 @@
+# SPDX-License-Identifier: MIT
+import datetime
+import os
+import time
+
+from code_trajectory.git_log import CommitStats
+from code_trajectory.maintenance import MaintenancePolicy
+from code_trajectory.recorder import CONSOLIDATED_REF
+from code_trajectory.retention import RetentionPolicy, plan_retention, walk_bound
+
+DAY = 24 * 3600
+
+
+def _snapshot(recorder, path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    recorder.create_snapshot(path)
+
+
+def _entry(sha, timestamp, kind="AUTO-TRJ"):
+    return CommitStats(sha, None, timestamp, f"[{kind}] 12:00:00 - Snapshot of {sha}")
+
+
+def test_plan_keeps_last_snapshot_per_bucket():
+    """Test hourly and daily downsampling, split by consolidations."""
+    now = 100 * DAY
+    policy = RetentionPolicy()
+    hour = now - 2 * DAY
+    hour -= hour % 3600
+    entries = [  # Newest first.
+        _entry("recent1", now - 60),
+        _entry("recent2", now - 120),
+        _entry("h1", hour + 50),
+        _entry("h2", hour + 40),
+        _entry("h3", hour - 10),
+        _entry("c", hour - 20, kind="CONSOLIDATE"),
+        _entry("h4", hour - 30),
+        _entry("d1", now - 20 * DAY + 43200),
+        _entry("d2", now - 20 * DAY + 43100),
+    ]
+
+    dropped = plan_retention(entries, now, policy)
+
+    assert dropped == {"h2", "d2"}
+
+
+def test_walk_bound_starts_at_day_boundary():
+    """Test that a run only walks back to the day before the last hourly window."""
+    policy = RetentionPolicy()
+    last_run = time.time()
+    bound = walk_bound(last_run, policy)
+
+    start = datetime.datetime.fromtimestamp(bound)
+    assert (start.hour, start.minute, start.second) == (0, 0, 0)
+    assert last_run - policy.hourly_until - DAY < bound <= last_run - policy.hourly_until
+    assert walk_bound(0, policy) is None
+
+
+def test_retention_rewrites_old_snapshots(recorder, trajectory, temp_project_dir):
+    """Test that old snapshots are compacted while content and metadata survive."""
+    recorder.retention_policy = RetentionPolicy(min_dropped=1)
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for i in range(2):
+        _snapshot(recorder, test_file, f"base{i}")
+    recorder.consolidate("Base")
+    consolidation = recorder.repo.head.commit
+    for i in range(3):
+        _snapshot(recorder, test_file, f"v{i}")
+    head = recorder.repo.head.commit
+    trajectory.get_global_trajectory()
+
+    # Nothing is old enough yet.
+    assert recorder.apply_retention() == 0
+    assert recorder.repo.head.commit == head
+
+    assert recorder.apply_retention(now=time.time() + 10 * DAY) == 2
+
+    commits = list(recorder.repo.iter_commits())
+    assert commits[1] == consolidation
+    assert len(commits) == 2
+    assert commits[0].tree == head.tree
+    assert commits[0].message == head.message
+    assert commits[0].authored_date == head.authored_date
+    assert recorder.repo.git.rev_parse(CONSOLIDATED_REF) == consolidation.hexsha
+
+    recorder.history.sync()
+    assert [row.sha for row in recorder.history.chain(10)] == [c.hexsha for c in commits]
+    assert len(trajectory.cache) == 0
+    assert trajectory.get_global_trajectory().count("[AUTO-TRJ]") == 1
+
+
+def test_retention_waits_for_enough_snapshots(recorder, temp_project_dir):
+    """Test that history is not rewritten for a handful of droppable snapshots."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for i in range(3):
+        _snapshot(recorder, test_file, f"v{i}")
+    head = recorder.repo.head.commit
+
+    assert recorder.apply_retention(now=time.time() + 10 * DAY) == 0
+    assert recorder.repo.head.commit == head
+
+
+def test_retention_keeps_recent_shas(recorder, trajectory, temp_project_dir, monkeypatch):
+    """Test that the full-resolution chain is grafted rather than rewritten."""
+    recorder.retention_policy = RetentionPolicy(min_dropped=1)
+    recorder.maintenance_policy = MaintenancePolicy(reflog_expire="now", prune_expire="now")
+    test_file = os.path.join(temp_project_dir, "test.py")
+    old = int(time.time()) - 3 * DAY
+    old -= old % 3600
+    for i in range(3):
+        monkeypatch.setenv("GIT_COMMITTER_DATE", f"{old + i} +0000")
+        _snapshot(recorder, test_file, f"old{i}")
+    dropped = recorder.repo.head.commit.parents[0].hexsha
+    monkeypatch.delenv("GIT_COMMITTER_DATE")
+    for i in range(3):
+        _snapshot(recorder, test_file, f"new{i}")
+    recent = [c.hexsha for c in recorder.repo.iter_commits(max_count=3)]
+    head = recorder.repo.head.commit.hexsha
+
+    assert recorder.apply_retention() == 2
+
+    commits = [c.hexsha for c in recorder.repo.iter_commits()]
+    assert commits[:3] == recent
+    assert len(commits) == 4
+    assert dropped not in commits
+    assert recorder.repo.head.commit.hexsha == head
+    assert recorder.repo.git.for_each_ref("refs/replace/")
+    recorder.history.sync()
+    assert [row.sha for row in recorder.history.chain(10)] == commits
+    assert trajectory.get_global_trajectory().count("[AUTO-TRJ]") == 4
+    # Maintenance keeps working while a graft exists.
+    assert recorder.run_maintenance(force=True)
+
+    # Past the reclaim interval the graft is folded into a real parent.
+    recorder.retention_policy.reclaim_interval = DAY
+    recorder.apply_retention(now=time.time() + 2 * DAY)
+    assert recorder.repo.git.for_each_ref("refs/replace/") == ""
+    assert recorder._maintenance_state.grafted_since == 0
+    assert recorder.repo.head.commit.tree.hexsha == recorder.repo.commit(head).tree.hexsha
+    assert recorder.run_maintenance(force=True)
+    status, _, _ = recorder.repo.git.cat_file(
+        "-e", dropped, with_extended_output=True, with_exceptions=False
+    )
+    assert status != 0
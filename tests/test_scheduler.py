@@ -0,0 +1,131 @@
+# SPDX-License-Identifier: MIT
+import threading
+import time
+
+from code_trajectory.scheduler import SnapshotScheduler
+
+
+class FakeSink:
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def create_batch_snapshot(self, filepaths):
+        time.sleep(self.delay)
+        with self.lock:
+            self.batches.append(list(filepaths))
+        return "ok"
+
+
+def test_scheduler_debounces_repeated_events():
+    """Test that repeated events for one path produce a single batch entry."""
+    sink = FakeSink()
+    scheduler = SnapshotScheduler(debounce_interval=0.1)
+    scheduler.start()
+    for _ in range(10):
+        scheduler.touch(sink, "/project/a.py")
+    scheduler.flush()
+    scheduler.stop()
+
+    assert sink.batches == [["/project/a.py"]]
+
+
+def test_scheduler_groups_batches_per_sink():
+    """Test that paths owned by different sinks are recorded separately."""
+    first, second = FakeSink(), FakeSink()
+    scheduler = SnapshotScheduler(debounce_interval=10.0)
+    scheduler.touch(first, "/one/a.py")
+    scheduler.touch(second, "/two/b.py")
+    scheduler.touch(first, "/one/c.py")
+    scheduler.flush()
+
+    assert first.batches == [["/one/a.py", "/one/c.py"]]
+    assert second.batches == [["/two/b.py"]]
+
+
+def test_scheduler_applies_backpressure():
+    """Test that a slow worker bounds the queue while events keep coalescing."""
+    sink = FakeSink(delay=0.05)
+    scheduler = SnapshotScheduler(debounce_interval=0.01, max_queue_size=1)
+    scheduler.start()
+    for i in range(100):
+        scheduler.touch(sink, f"/project/{i % 10}.py")
+        assert scheduler.queue_depth <= 1
+        time.sleep(0.002)
+    scheduler.stop()
+
+    recorded = {path for batch in sink.batches for path in batch}
+    assert recorded == {f"/project/{i}.py" for i in range(10)}
+
+
+def test_scheduler_enforces_max_latency():
+    """Test that a continuously touched path is still recorded."""
+    sink = FakeSink()
+    scheduler = SnapshotScheduler(debounce_interval=0.2, max_latency=0.3)
+    scheduler.start()
+    deadline = time.time() + 0.6
+    while time.time() < deadline and not sink.batches:
+        scheduler.touch(sink, "/project/hot.log")
+        time.sleep(0.02)
+    scheduler.stop()
+
+    assert sink.batches
+
+
+def test_scheduler_keeps_touched_paths_together():
+    """Test that paths touched together share a batch despite earlier events."""
+    sink = FakeSink()
+    scheduler = SnapshotScheduler(debounce_interval=10.0, max_latency=0.2)
+    scheduler.start()
+    scheduler.touch(sink, "/project/old.py")
+    time.sleep(0.1)
+    scheduler.touch_many(sink, ["/project/old.py", "/project/new.py"])
+    # Both become due when the first event reaches max_latency.
+    time.sleep(0.3)
+    batches = list(sink.batches)
+    scheduler.stop()
+
+    assert [sorted(batch) for batch in batches] == [["/project/new.py", "/project/old.py"]]
+
+
+def test_scheduler_adapts_debounce_to_write_frequency():
+    """Test that rarely written paths settle quickly and bursts wait longer."""
+    sink = FakeSink()
+    scheduler = SnapshotScheduler(debounce_interval=2.0, min_debounce=0.1)
+    scheduler.start()
+    scheduler.touch(sink, "/project/quiet.py")
+    assert scheduler.debounce_delay("/project/quiet.py") == 0.1
+    for _ in range(10):
+        scheduler.touch(sink, "/project/burst.py")
+        time.sleep(0.05)
+    burst_delay = scheduler.debounce_delay("/project/burst.py")
+    time.sleep(0.3)
+    batches = list(sink.batches)
+    scheduler.stop()
+
+    assert 0.1 < burst_delay < 0.5
+    assert "/project/quiet.py" in batches[0]
+
+
+def test_scheduler_throttles_continuous_writers():
+    """Test that a path that never goes quiet is recorded less and less often."""
+    sink = FakeSink()
+    scheduler = SnapshotScheduler(
+        debounce_interval=0.2, min_debounce=0.05, max_latency=0.1, hot_after=2, hot_interval=0.6
+    )
+    scheduler.start()
+    deadline = time.monotonic() + 1.5
+    while time.monotonic() < deadline:
+        scheduler.touch(sink, "/project/app.log")
+        time.sleep(0.01)
+    throttled = scheduler.is_throttled("/project/app.log")
+    recorded = len(sink.batches)
+    # Once quiet, the path is recorded and no longer throttled.
+    time.sleep(0.5)
+    scheduler.stop()
+
+    assert throttled
+    # Unthrottled, the 0.1 s ceiling would record it about 15 times.
+    assert 3 <= recorded <= 6
+    assert not scheduler.is_throttled("/project/app.log")
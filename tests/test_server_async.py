@@ -0,0 +1,102 @@
+# SPDX-License-Identifier: MIT
+import asyncio
+import threading
+
+import anyio
+
+from code_trajectory import server
+from code_trajectory.server import state
+
+
+class BlockingTrajectory:
+    """Stands in for Trajectory with a global trajectory that blocks until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def get_global_trajectory(self, limit, since_consolidate, max_tokens=None):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(5)
+        with self._lock:
+            self.running -= 1
+        return "done"
+
+
+class FakeRecorder:
+    def set_intent(self, intent):
+        self.intent = intent
+
+
+def test_slow_tool_does_not_block_cheap_tools(monkeypatch):
+    """Test that a slow git-heavy tool leaves the event loop free."""
+    trajectory = BlockingTrajectory()
+    monkeypatch.setattr(state, "trajectory", trajectory)
+    monkeypatch.setattr(state, "recorder", FakeRecorder())
+
+    async def scenario():
+        slow = asyncio.create_task(server.get_global_trajectory())
+        await asyncio.sleep(0.05)
+        assert not slow.done()
+        assert await server.set_trajectory_intent("quick") == "Intent set to: 'quick'"
+        trajectory.release.set()
+        return await slow
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_tool_concurrency_is_bounded(monkeypatch):
+    """Test that concurrent calls of one tool respect its limiter."""
+    trajectory = BlockingTrajectory()
+    monkeypatch.setattr(state, "trajectory", trajectory)
+
+    async def scenario():
+        tasks = [asyncio.create_task(server.get_global_trajectory()) for _ in range(5)]
+        await asyncio.sleep(0.1)
+        trajectory.release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(scenario()) == ["done"] * 5
+    assert trajectory.max_running == server.TOOL_CONCURRENCY["get_global_trajectory"]
+
+
+def test_cancelled_call_returns_immediately(monkeypatch):
+    """Test that a cancelled request does not wait for its worker thread."""
+    trajectory = BlockingTrajectory()
+    monkeypatch.setattr(state, "trajectory", trajectory)
+
+    async def scenario():
+        with anyio.move_on_after(0.05) as scope:
+            await server.get_global_trajectory()
+        return scope.cancelled_caught
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        trajectory.release.set()
+
+
+def test_abandoned_call_keeps_its_worker_slot(monkeypatch):
+    """Test that a cancelled call's thread counts as busy until it finishes."""
+    trajectory = BlockingTrajectory()
+    monkeypatch.setattr(state, "trajectory", trajectory)
+    limiter = server._tool_limiters["get_global_trajectory"]
+
+    async def scenario():
+        with anyio.move_on_after(0.05):
+            await server.get_global_trajectory()
+        busy_while_running = limiter.borrowed_tokens
+        trajectory.release.set()
+        with anyio.fail_after(5):
+            while limiter.borrowed_tokens:
+                await anyio.sleep(0.01)
+        return busy_while_running
+
+    try:
+        assert asyncio.run(scenario()) == 1
+    finally:
+        trajectory.release.set()
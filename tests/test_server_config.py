@@ -1,4 +1,5 @@
 # SPDX-License-Identifier: MIT
+import asyncio
 from unittest.mock import patch
 from code_trajectory.server import state, configure_project, _check_configured
 
@@ -10,7 +11,7 @@ def test_explicit_configuration(temp_project_dir):
     state.trajectory = None
     state.project_path = None
 
-    result = configure_project(temp_project_dir)
+    result = asyncio.run(configure_project(temp_project_dir))
     
     # Check for either success message (existing) or new init message
     assert "Successfully configured" in result or "New project initialized" in result
@@ -37,7 +38,7 @@ def test_no_auto_configuration(temp_project_dir):
 def test_reconfiguration(temp_project_dir):
     """Test switching projects."""
     # 1. Configure first project
-    configure_project(temp_project_dir)
+    asyncio.run(configure_project(temp_project_dir))
     old_watcher = state.watcher
     
     # 2. Create second project
@@ -46,7 +47,7 @@ def test_reconfiguration(temp_project_dir):
     second_dir = tempfile.mkdtemp()
     try:
         # Configure second project
-        result = configure_project(second_dir)
+        result = asyncio.run(configure_project(second_dir))
         
         assert "Successfully configured" in result or "New project initialized" in result
         assert state.project_path == second_dir
@@ -66,3 +67,39 @@ def test_check_configured_returns_error():
     error = _check_configured()
     assert error is not None
     assert "Server is NOT configured" in error
+
+def test_background_startup_configuration(temp_project_dir):
+    """Test that tools wait for a project being set up at startup."""
+    import threading
+    from code_trajectory import server
+
+    state.recorder = None
+    state.watcher = None
+    state.trajectory = None
+    state.project_path = None
+    release = threading.Event()
+    initialize = server._initialize_components
+
+    def slow_initialize(path):
+        release.wait(5)
+        return initialize(path)
+
+    with patch.object(server, "_initialize_components", slow_initialize):
+        thread = server._start_background_configuration(temp_project_dir)
+        assert _check_configured() is None
+        assert asyncio.run(server.set_trajectory_intent("Warming up")) == "Intent set to: 'Warming up'"
+
+        async def query():
+            task = asyncio.create_task(server.get_session_summary())
+            await asyncio.sleep(0.2)
+            assert not task.done()
+            release.set()
+            return await task
+
+        result = asyncio.run(query())
+        thread.join(5)
+
+    assert state.ready.is_set()
+    assert state.project_path == temp_project_dir
+    assert state.recorder.current_intent == "Warming up"
+    assert "NOT configured" not in result
@@ -90,3 +90,71 @@ def test_get_session_summary(recorder, trajectory, temp_project_dir):
     summary = trajectory.get_session_summary()
     assert "Last Session Summary" in summary
     assert "Commit Count" in summary
+
+def test_file_trajectory_streams_without_blob_reads(recorder, trajectory, temp_project_dir, monkeypatch):
+    """Test that the file trajectory is built from one git log stream."""
+    from git.objects.blob import Blob
+
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for content in ["a\n", "a\nb\n", "a\n"]:
+        with open(test_file, "w") as f:
+            f.write(content)
+        recorder.create_snapshot(test_file)
+
+    def fail(self):
+        raise AssertionError("blob content must not be read")
+
+    monkeypatch.setattr(Blob, "data_stream", property(fail))
+    traj = trajectory.get_file_trajectory(test_file, depth=3)
+    assert traj.count("[Revert Detected]") == 1
+    assert "[Initial Commit]" in traj
+    assert "@@ -1 +1,2 @@\n a\n+b" in traj
+    assert "diff --git" not in traj
+
+def test_file_trajectory_depth(recorder, trajectory, temp_project_dir):
+    """Test that only the last depth snapshots are rendered."""
+    test_file = os.path.join(temp_project_dir, "test.py")
+    for i in range(4):
+        with open(test_file, "w") as f:
+            f.write(f"v{i}\n")
+        recorder.create_snapshot(test_file)
+
+    traj = trajectory.get_file_trajectory(test_file, depth=2)
+    assert traj.count("## ") == 2
+    assert "+v3" in traj
+    assert "[Initial Commit]" not in traj
+
+def test_file_trajectory_respects_budget(recorder, trajectory, temp_project_dir):
+    """Test that a budget collapses large diffs and drops old snapshots."""
+    test_file = os.path.join(temp_project_dir, "big.py")
+    for i in range(5):
+        with open(test_file, "w") as f:
+            f.write("".join(f"line {i} {n}\n" for n in range(500)))
+        recorder.create_snapshot(test_file)
+
+    unlimited = trajectory.get_file_trajectory(test_file)
+    limited = trajectory.get_file_trajectory(test_file, max_bytes=2000)
+
+    assert len(unlimited) > 20000
+    assert len(limited.encode()) <= 2000
+    assert "collapsed" in limited
+    assert limited.count("## ") == 5
+
+    tiny = trajectory.get_file_trajectory(test_file, max_bytes=300)
+    assert "Older snapshots omitted" in tiny
+    assert len(tiny.encode()) <= 300
+
+def test_global_trajectory_respects_budget(recorder, trajectory, temp_project_dir):
+    """Test that long file lists are shortened to fit the budget."""
+    paths = []
+    for i in range(40):
+        path = os.path.join(temp_project_dir, f"module_{i}.py")
+        with open(path, "w") as f:
+            f.write(str(i))
+        paths.append(path)
+    recorder.create_batch_snapshot(paths)
+
+    traj = trajectory.get_global_trajectory(max_bytes=400)
+
+    assert "more`)" in traj
+    assert len(traj.encode()) <= 400
@@ -0,0 +1,186 @@
+# SPDX-License-Identifier: MIT
+import os
+import struct
+import sys
+import time
+
+import pytest
+from watchdog.events import (
+    DirCreatedEvent,
+    DirMovedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+)
+from watchdog.observers.api import EventQueue, ObservedWatch
+
+from code_trajectory.event_source import SourceEmitter
+from code_trajectory.stat_scanner import StatScanSource
+from code_trajectory.watcher import Watcher, create_observer
+
+linux_only = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is only available on Linux"
+)
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def _attach(source, path):
+    queue = EventQueue()
+    emitter = SourceEmitter(source, queue, ObservedWatch(path, recursive=True))
+    emitter.start()
+    return queue
+
+
+def _drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get()[0])
+    return events
+
+
+def _poll_until(source, queue, predicate, timeout=5.0):
+    events = []
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        source.poll(0.1)
+        events.extend(_drain(queue))
+        if predicate(events):
+            break
+    return events
+
+
+def test_stat_scan_reports_changes(temp_project_dir):
+    """Test that a scan reports creations, edits, deletions and renames."""
+    root = temp_project_dir
+    _write(os.path.join(root, "src", "a.py"), "a")
+    _write(os.path.join(root, "src", "b.py"), "b")
+    _write(os.path.join(root, "gone.py"), "gone")
+    source = StatScanSource(interval=0.05, sweep_interval=0.05)
+    queue = _attach(source, root)
+
+    source.scan()
+    assert _drain(queue) == []
+
+    # Same-size edits are told apart by mtime.
+    time.sleep(0.01)
+    _write(os.path.join(root, "src", "a.py"), "A")
+    _write(os.path.join(root, "new", "c.py"), "c")
+    os.remove(os.path.join(root, "gone.py"))
+    os.rename(os.path.join(root, "src", "b.py"), os.path.join(root, "b.py"))
+    source.scan()
+    events = _drain(queue)
+
+    assert FileModifiedEvent(os.path.join(root, "src", "a.py")) in events
+    assert DirCreatedEvent(os.path.join(root, "new")) in events
+    assert FileDeletedEvent(os.path.join(root, "gone.py")) in events
+    assert FileMovedEvent(os.path.join(root, "src", "b.py"), os.path.join(root, "b.py")) in events
+
+    # Directories created since the last scan are scanned from now on.
+    _write(os.path.join(root, "new", "d.py"), "d")
+    source.scan()
+    assert FileCreatedEvent(os.path.join(root, "new", "d.py")) in _drain(queue)
+
+
+def test_stat_scan_reports_atomic_saves_and_directory_moves(temp_project_dir):
+    """Test that replacing a file is a modification and a moved directory a move."""
+    root = temp_project_dir
+    target = os.path.join(root, "main.py")
+    _write(target, "old")
+    _write(os.path.join(root, "pkg", "mod.py"), "mod")
+    source = StatScanSource()
+    queue = _attach(source, root)
+
+    _write(target + ".tmp", "new content")
+    os.replace(target + ".tmp", target)
+    os.rename(os.path.join(root, "pkg"), os.path.join(root, "lib"))
+    source.scan()
+    events = _drain(queue)
+
+    assert FileModifiedEvent(target) in events
+    assert not any(isinstance(e, FileDeletedEvent) and e.src_path == target for e in events)
+    assert DirMovedEvent(os.path.join(root, "pkg"), os.path.join(root, "lib")) in events
+    assert os.path.join(root, "lib") in source.directories
+    assert os.path.join(root, "pkg") not in source.directories
+
+
+def test_stat_scan_sweeps_in_place_writes(temp_project_dir):
+    """Test that an edit that leaves the directory untouched is found by the sweep."""
+    root = temp_project_dir
+    path = os.path.join(root, "pkg", "mod.py")
+    _write(path, "one")
+    source = StatScanSource(interval=1.0, sweep_interval=2.0)
+    queue = _attach(source, root)
+
+    with open(path, "a") as f:
+        f.write("two")
+    events = []
+    for _ in range(2):
+        source.scan()
+        events.extend(_drain(queue))
+    assert FileModifiedEvent(path) in events
+
+
+@linux_only
+def test_parse_inotify_events():
+    """Test that a raw read is split into events with their names."""
+    from code_trajectory.inotify_direct import IN_CREATE, IN_MODIFY, parse_events
+
+    data = struct.pack("iIII", 1, IN_CREATE, 0, 16) + b"file.py".ljust(16, b"\0")
+    data += struct.pack("iIII", 2, IN_MODIFY, 0, 0)
+    assert parse_events(data) == [(1, IN_CREATE, 0, "file.py"), (2, IN_MODIFY, 0, "")]
+
+
+@linux_only
+def test_inotify_source_reports_changes(temp_project_dir):
+    """Test that one inotify fd follows the tree and pairs renames."""
+    from code_trajectory.inotify_direct import InotifySource
+
+    root = temp_project_dir
+    _write(os.path.join(root, "src", "a.py"), "a")
+    source = InotifySource()
+    try:
+        queue = _attach(source, root)
+        _write(os.path.join(root, "src", "a.py"), "changed")
+        os.rename(os.path.join(root, "src", "a.py"), os.path.join(root, "b.py"))
+        os.makedirs(os.path.join(root, "new"))
+        events = _poll_until(
+            source, queue, lambda es: any(isinstance(e, DirCreatedEvent) for e in es)
+        )
+        assert FileModifiedEvent(os.path.join(root, "src", "a.py")) in events
+        assert FileMovedEvent(os.path.join(root, "src", "a.py"), os.path.join(root, "b.py")) in events
+
+        # New directories are watched as they appear.
+        _write(os.path.join(root, "new", "c.py"), "c")
+        new_file = FileCreatedEvent(os.path.join(root, "new", "c.py"))
+        assert new_file in _poll_until(source, queue, lambda es: new_file in es)
+    finally:
+        source.close()
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_observer("fanotify")
+
+
+@pytest.mark.parametrize(
+    "backend", ["stat", pytest.param("inotify", marks=linux_only)]
+)
+def test_watcher_records_with_backend(backend, recorder, temp_project_dir):
+    """Test that a watcher on another backend records snapshots."""
+    watcher = Watcher(temp_project_dir, recorder, backend=backend)
+    watcher.start()
+    try:
+        _write(os.path.join(temp_project_dir, "main.py"), "print('hi')")
+        deadline = time.time() + 15
+        while time.time() < deadline and not recorder.repo.head.is_valid():
+            time.sleep(0.1)
+        assert recorder.repo.head.is_valid()
+        assert "main.py" in recorder.repo.head.commit.stats.files
+    finally:
+        watcher.stop()
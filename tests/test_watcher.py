@@ -0,0 +1,341 @@
+# SPDX-License-Identifier: MIT
+import os
+import shutil
+import threading
+import time
+
+import pytest
+from watchdog.events import (
+    DirDeletedEvent,
+    DirMovedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+)
+
+from code_trajectory.watcher import DebouncedEventHandler, Watcher
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_batch_snapshot_single_commit(recorder, temp_project_dir):
+    """Test that several files are recorded in one snapshot commit."""
+    paths = []
+    for i in range(5):
+        path = os.path.join(temp_project_dir, f"file{i}.py")
+        with open(path, "w") as f:
+            f.write(f"print({i})")
+        paths.append(path)
+
+    message = recorder.create_batch_snapshot(paths)
+
+    commits = list(recorder.repo.iter_commits())
+    assert len(commits) == 1
+    assert message is not None
+    assert "Snapshot of 5 files" in commits[0].message
+    assert len(commits[0].stats.files) == 5
+
+
+def test_batch_snapshot_skips_unchanged(recorder, temp_project_dir):
+    """Test that a batch without changes does not create a commit."""
+    path = os.path.join(temp_project_dir, "same.py")
+    with open(path, "w") as f:
+        f.write("same")
+    recorder.create_batch_snapshot([path])
+
+    assert recorder.create_batch_snapshot([path]) is None
+    assert len(list(recorder.repo.iter_commits())) == 1
+
+
+def test_handler_batches_debounced_events(recorder, temp_project_dir):
+    """Test that events settled within the debounce window share a commit."""
+    handler = DebouncedEventHandler(recorder, debounce_interval=0.2)
+    for i in range(3):
+        path = os.path.join(temp_project_dir, f"batched{i}.py")
+        with open(path, "w") as f:
+            f.write(f"value = {i}")
+        handler.on_modified(FileModifiedEvent(path))
+
+    handler.flush()
+    handler.close()
+    commits = list(recorder.repo.iter_commits())
+    assert len(commits) == 1
+    assert "Snapshot of 3 files" in commits[0].message
+
+
+def test_handler_respects_max_batch_size(recorder, temp_project_dir):
+    """Test that a flush splits pending files into batches of max_batch_size."""
+    handler = DebouncedEventHandler(
+        recorder, debounce_interval=60.0, max_batch_size=2
+    )
+    for i in range(3):
+        path = os.path.join(temp_project_dir, f"capped{i}.py")
+        with open(path, "w") as f:
+            f.write(f"value = {i}")
+        handler.on_modified(FileModifiedEvent(path))
+
+    handler.close()
+    assert len(list(recorder.repo.iter_commits())) == 2
+
+
+def test_handler_records_after_debounce(recorder, temp_project_dir):
+    """Test that a settled file is recorded by the scheduler on its own."""
+    handler = DebouncedEventHandler(recorder, debounce_interval=0.1)
+    path = os.path.join(temp_project_dir, "settled.py")
+    with open(path, "w") as f:
+        f.write("settled")
+    handler.on_modified(FileModifiedEvent(path))
+
+    assert _wait_for(lambda: recorder.repo.head.is_valid())
+    handler.close()
+
+
+def test_handler_thread_count_is_flat(recorder, temp_project_dir):
+    """Test that a burst of events does not spawn a thread per event."""
+    before = threading.active_count()
+    handler = DebouncedEventHandler(recorder, debounce_interval=0.2)
+    for i in range(200):
+        path = os.path.join(temp_project_dir, f"burst{i % 50}.py")
+        with open(path, "w") as f:
+            f.write(f"value = {i}")
+        handler.on_modified(FileModifiedEvent(path))
+
+    assert threading.active_count() <= before + 2
+    handler.flush()
+    handler.close()
+    commits = list(recorder.repo.iter_commits())
+    assert sum(len(c.stats.files) for c in commits) >= 50
+
+
+def test_handler_drops_ignored_events(recorder, temp_project_dir):
+    """Test that ignored paths never reach the snapshot scheduler."""
+    with open(os.path.join(temp_project_dir, ".gitignore"), "a") as f:
+        f.write("node_modules/\n")
+    recorder.ignore_matcher.invalidate()
+    handler = DebouncedEventHandler(recorder, debounce_interval=60.0)
+
+    handler.on_modified(FileModifiedEvent(os.path.join(temp_project_dir, "node_modules", "x.js")))
+    handler.on_modified(FileModifiedEvent(os.path.join(temp_project_dir, ".trajectory", "x")))
+
+    assert handler.scheduler.pending_count == 0
+    handler.close()
+
+
+def _recorded(recorder, path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    recorder.create_snapshot(path)
+    return recorder.repo.head.commit
+
+
+def _head_files(recorder):
+    return sorted(recorder.repo.git.ls_tree("-r", "--name-only", "--full-tree", "HEAD").split())
+
+
+@pytest.mark.parametrize("engine", ["recorder", "object_recorder"])
+def test_handler_coalesces_atomic_saves(request, engine, temp_project_dir):
+    """Test that write-temp-then-rename saves become one modification."""
+    recorder = request.getfixturevalue(engine)
+    path = os.path.join(temp_project_dir, "a.py")
+    base = _recorded(recorder, path, "v1")
+    handler = DebouncedEventHandler(recorder, debounce_interval=60.0)
+
+    tmp = os.path.join(temp_project_dir, ".a.py.tmp1234")
+    with open(tmp, "w") as f:
+        f.write("version 2")
+    handler.on_created(FileCreatedEvent(tmp))
+    handler.on_modified(FileModifiedEvent(tmp))
+    os.replace(tmp, path)
+    handler.on_moved(FileMovedEvent(tmp, path))
+    handler.close()
+
+    head = recorder.repo.head.commit
+    assert head.parents == (base,)
+    assert list(head.stats.files) == ["a.py"]
+    assert _head_files(recorder) == ["a.py"]
+
+
+@pytest.mark.parametrize("engine", ["recorder", "object_recorder"])
+def test_handler_records_renames(request, engine, temp_project_dir):
+    """Test that a rename is one snapshot git detects as a rename."""
+    recorder = request.getfixturevalue(engine)
+    old, new = (os.path.join(temp_project_dir, name) for name in ("old.py", "new.py"))
+    base = _recorded(recorder, old, "print('hello')\n" * 10)
+    handler = DebouncedEventHandler(recorder, debounce_interval=60.0)
+
+    os.rename(old, new)
+    handler.on_moved(FileMovedEvent(old, new))
+    handler.close()
+
+    assert recorder.repo.head.commit.parents == (base,)
+    status = recorder.repo.git.diff("-M", "--name-status", "HEAD~1", "HEAD")
+    assert status.split("\t") == ["R100", "old.py", "new.py"]
+    assert recorder.repo.git.log("--follow", "--format=%H", "--", new).split() == [
+        recorder.repo.head.commit.hexsha,
+        base.hexsha,
+    ]
+
+
+@pytest.mark.parametrize("engine", ["recorder", "object_recorder"])
+def test_handler_records_directory_moves_and_deletes(request, engine, temp_project_dir):
+    """Test that moved and deleted directories update every file below them."""
+    recorder = request.getfixturevalue(engine)
+    os.makedirs(os.path.join(temp_project_dir, "pkg", "sub"))
+    os.makedirs(os.path.join(temp_project_dir, "docs"))
+    files = [os.path.join(temp_project_dir, p) for p in ("pkg/a.py", "pkg/sub/b.py", "docs/c.md")]
+    for path in files:
+        with open(path, "w") as f:
+            f.write(path)
+    recorder.create_batch_snapshot(files)
+    handler = DebouncedEventHandler(recorder, debounce_interval=60.0)
+
+    src, dest = os.path.join(temp_project_dir, "pkg"), os.path.join(temp_project_dir, "lib")
+    os.rename(src, dest)
+    handler.on_moved(DirMovedEvent(src, dest))
+    docs = os.path.join(temp_project_dir, "docs")
+    shutil.rmtree(docs)
+    handler.on_deleted(FileDeletedEvent(os.path.join(docs, "c.md")))
+    handler.on_deleted(DirDeletedEvent(docs))
+    handler.close()
+
+    assert _head_files(recorder) == ["lib/a.py", "lib/sub/b.py"]
+
+
+def _make_tree(root, *dirs):
+    for d in dirs:
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+
+
+def test_watch_plan_skips_ignored_trees(recorder, temp_project_dir):
+    """Test that ignored directories never get a watch."""
+    with open(os.path.join(temp_project_dir, ".gitignore"), "a") as f:
+        f.write("node_modules/\n.venv/\n")
+    recorder.ignore_matcher.invalidate()
+    _make_tree(
+        temp_project_dir,
+        "src/pkg",
+        "node_modules/lib",
+        ".venv/lib",
+        "web/node_modules/x",
+        "web/app",
+    )
+    watcher = Watcher(temp_project_dir, recorder)
+
+    plan = watcher.plan_watches(temp_project_dir)
+
+    assert plan == {
+        temp_project_dir: False,
+        os.path.join(temp_project_dir, "src"): True,
+        os.path.join(temp_project_dir, "web"): False,
+        os.path.join(temp_project_dir, "web", "app"): True,
+    }
+    watcher.handler.close()
+
+
+def _recursive(watcher, path):
+    watch = watcher.watches.get(path)
+    return None if watch is None else watch.is_recursive
+
+
+def test_watcher_tracks_new_directories(recorder, temp_project_dir):
+    """Test that directories created at runtime are added to the watch set."""
+    import shutil
+
+    _make_tree(temp_project_dir, "src")
+    watcher = Watcher(temp_project_dir, recorder)
+    watcher.start()
+    src = os.path.join(temp_project_dir, "src")
+    try:
+        # .git and .trajectory keep the root itself non-recursive.
+        assert _recursive(watcher, temp_project_dir) is False
+        assert _recursive(watcher, src) is True
+
+        # Directories below a recursive watch are already covered.
+        watcher.add_directory(os.path.join(src, "new"))
+        assert set(watcher.watches) == {temp_project_dir, src}
+
+        # Watches change on the observer thread, so wait for the events.
+        _make_tree(temp_project_dir, "docs")
+        docs = os.path.join(temp_project_dir, "docs")
+        assert _wait_for(lambda: _recursive(watcher, docs) is True)
+
+        # A directory becoming ignored under a recursive watch splits it.
+        _make_tree(temp_project_dir, "src/build/out", "src/lib")
+        with open(os.path.join(temp_project_dir, ".gitignore"), "a") as f:
+            f.write("build/\n")
+        assert _wait_for(
+            lambda: _recursive(watcher, src) is False
+            and _recursive(watcher, os.path.join(src, "lib")) is True
+        )
+        assert os.path.join(src, "build") not in watcher.watches
+
+        shutil.rmtree(src)
+        assert _wait_for(lambda: not any(path.startswith(src) for path in list(watcher.watches)))
+    finally:
+        watcher.stop()
+
+
+def test_watcher_ignores_directories_outside_root(recorder, temp_project_dir):
+    """Test that a directory moved out of the project is not watched."""
+    import tempfile
+
+    watcher = Watcher(temp_project_dir, recorder)
+    outside = tempfile.mkdtemp()
+    try:
+        watcher.add_directory(outside)
+        assert outside not in watcher.watches
+    finally:
+        os.rmdir(outside)
+        watcher.handler.close()
+
+
+def test_watcher_caps_split_watches(recorder, temp_project_dir):
+    """Test that a tree needing many split watches is watched recursively."""
+    with open(os.path.join(temp_project_dir, ".gitignore"), "a") as f:
+        f.write("__pycache__/\n")
+    recorder.ignore_matcher.invalidate()
+    _make_tree(temp_project_dir, *(f"pkg{i}/__pycache__" for i in range(150)))
+    watcher = Watcher(temp_project_dir, recorder)
+    threads = threading.active_count()
+    watcher.start()
+    try:
+        assert watcher.collapsed
+        assert watcher.watches.keys() == {temp_project_dir}
+        assert _recursive(watcher, temp_project_dir) is True
+        assert threading.active_count() - threads < 10
+
+        # Ignored files below the recursive watch are still dropped.
+        pkg = os.path.join(temp_project_dir, "pkg34")
+        with open(os.path.join(pkg, "__pycache__", "mod.pyc"), "w") as f:
+            f.write("compiled")
+        with open(os.path.join(pkg, "mod.py"), "w") as f:
+            f.write("print(34)")
+        assert _wait_for(lambda: recorder.repo.head.is_valid(), timeout=15)
+        files = recorder.repo.head.commit.stats.files
+        assert "pkg34/mod.py" in files
+        assert not any("__pycache__" in path for path in files)
+    finally:
+        watcher.stop()
+
+
+def test_single_threaded_backend_keeps_split_watches(recorder, temp_project_dir):
+    """Test that the limit only applies to watchdog's per-watch emitters."""
+    with open(os.path.join(temp_project_dir, ".gitignore"), "a") as f:
+        f.write("__pycache__/\n")
+    recorder.ignore_matcher.invalidate()
+    _make_tree(temp_project_dir, *(f"pkg{i}/__pycache__" for i in range(150)))
+    watcher = Watcher(temp_project_dir, recorder, backend="stat")
+    watcher.start()
+    try:
+        assert not watcher.collapsed
+        assert len(watcher.watches) > 150
+    finally:
+        watcher.stop()